@@ -0,0 +1,117 @@
+"""Coalesce bursts of Neon webhooks for the same account into one reconcile"""
+
+import datetime
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Protocol
+
+logger = logging.getLogger()
+
+# How long a finished reconcile can absorb later-arriving events for the account.
+# Neon typically fires createMembership, updateMembership and editAccount within
+# a few seconds of each other.
+COALESCE_WINDOW = datetime.timedelta(seconds=60)
+
+# Neon's event timestamps and our clock are not perfectly in sync. A reconcile
+# only absorbs an event if it started at least this long after the event fired.
+CLOCK_SKEW = datetime.timedelta(seconds=2)
+
+
+@dataclass
+class Reconcile:
+    started_at: datetime.datetime
+    merged: int = 0
+
+
+class ReconcileStore(Protocol):
+    """Where recent reconciles are recorded, keyed by Neon account ID."""
+
+    def get(self, neon_id: str) -> Reconcile | None: ...
+
+    def put(self, neon_id: str, reconcile: Reconcile) -> None: ...
+
+    def expire(self, before: datetime.datetime) -> None: ...
+
+
+class InMemoryStore:
+    """
+    Per-container store. Warm invocations in the same container share it; a
+    shared store (e.g. DynamoDB) can be plugged in to coalesce across containers.
+    """
+
+    def __init__(self) -> None:
+        self._reconciles: dict[str, Reconcile] = {}
+        self._lock = threading.Lock()
+
+    def get(self, neon_id: str) -> Reconcile | None:
+        with self._lock:
+            return self._reconciles.get(neon_id)
+
+    def put(self, neon_id: str, reconcile: Reconcile) -> None:
+        with self._lock:
+            self._reconciles[neon_id] = reconcile
+
+    def expire(self, before: datetime.datetime) -> None:
+        with self._lock:
+            for neon_id in [
+                neon_id
+                for neon_id, reconcile in self._reconciles.items()
+                if reconcile.started_at < before
+            ]:
+                del self._reconciles[neon_id]
+
+
+class Coalescer:
+    def __init__(
+        self,
+        store: ReconcileStore | None = None,
+        window: datetime.timedelta = COALESCE_WINDOW,
+    ) -> None:
+        self.store = store if store is not None else InMemoryStore()
+        self.window = window
+
+    def already_reconciled(
+        self, neon_id: str, event_time: datetime.datetime | None
+    ) -> bool:
+        """
+        True if a recent reconcile of this account started after the event
+        fired, so it already saw the change. The event is counted as merged.
+        """
+        if event_time is None:
+            return False
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.store.expire(now - self.window)
+
+        reconcile = self.store.get(str(neon_id))
+        if reconcile is None or reconcile.started_at < event_time + CLOCK_SKEW:
+            return False
+
+        reconcile.merged += 1
+        self.store.put(str(neon_id), reconcile)
+        logger.info(
+            "Coalesced event for Neon ID %s into the reconcile started at %s (%s merged)",
+            neon_id,
+            reconcile.started_at.isoformat(),
+            reconcile.merged,
+        )
+        return True
+
+    def record(self, neon_id: str, started_at: datetime.datetime) -> None:
+        """Record a completed reconcile. Only call this once it has succeeded."""
+        self.store.put(str(neon_id), Reconcile(started_at=started_at))
+
+
+def parse_event_time(timestamp: str | None) -> datetime.datetime | None:
+    """Neon's eventTimestamp, e.g. 2026-06-10T12:00:00.000-05:00, or None if unusable."""
+    if not timestamp:
+        return None
+    try:
+        event_time = datetime.datetime.fromisoformat(timestamp)
+    except ValueError:
+        logger.warning("Unparseable eventTimestamp %s", timestamp)
+        return None
+    if event_time.tzinfo is None:
+        return None
+    return event_time
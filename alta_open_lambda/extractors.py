@@ -0,0 +1,100 @@
+"""Pull fields out of Neon webhook payloads"""
+
+from collections import deque
+from collections.abc import Iterable
+from typing import Any
+
+Path = tuple[str, ...]
+
+# Where each field lives in the payloads Neon actually sends, per eventTrigger,
+# relative to the object the handler searches (``data`` for createMembership,
+# the whole body otherwise). Candidates are tried in order; each is the first
+# match a breadth-first search would find for that shape. Anything not listed,
+# or not found where expected, falls back to find_keys.
+TRIGGER_PATHS: dict[str, dict[str, tuple[Path, ...]]] = {
+    "createMembership": {
+        # new: flat fields at the data top level
+        "accountId": (("accountId",), ("membershipEnrollment", "accountId")),
+        "status": (("status",),),
+        "enrollType": (("enrollType",),),
+        # legacy: membershipEnrollment + transaction wrappers
+        "transactionStatus": (("transaction", "transactionStatus"),),
+        "enrollmentType": (("membershipEnrollment", "enrollmentType"),),
+    },
+    "updateMembership": {
+        "accountId": (
+            ("data", "accountId"),
+            ("data", "membershipEnrollment", "accountId"),
+        ),
+    },
+    "editAccount": {
+        "accountId": (("data", "individualAccount", "accountId"),),
+    },
+}
+
+_MISSING = object()
+
+
+def _follow(payload: Any, path: Path) -> Any:
+    for key in path:
+        if not isinstance(payload, dict) or key not in payload:
+            return _MISSING
+        payload = payload[key]
+    return payload
+
+
+def find_keys(payload: Any, keys: Iterable[str]) -> dict[str, Any]:
+    """
+    Breadth-first search for several keys in one traversal of a nested
+    payload. Each key maps to its shallowest value, as a separate
+    breadth-first search for that key would find; keys that never appear
+    are left out.
+    """
+    wanted = set(keys)
+    found: dict[str, Any] = {}
+    queue: deque[Any] = deque([payload])
+
+    while queue and wanted:
+        current = queue.popleft()
+        if not isinstance(current, dict):
+            continue
+
+        hits = wanted.intersection(current)
+        for key in hits:
+            found[key] = current[key]
+        wanted -= hits
+
+        for value in current.values():
+            if isinstance(value, dict):
+                queue.append(value)
+            elif isinstance(value, list):
+                queue.extend(item for item in value if isinstance(item, dict))
+
+    return found
+
+
+def extract(event_trigger: str, payload: Any, keys: Iterable[str]) -> dict[str, Any]:
+    """
+    The requested fields for a webhook with the given eventTrigger. Known
+    shapes are read directly; any remaining keys share one find_keys pass.
+    Missing fields are None.
+    """
+    paths = TRIGGER_PATHS.get(event_trigger, {})
+    fields: dict[str, Any] = {}
+    remaining = []
+
+    for key in keys:
+        for path in paths.get(key, ()):
+            value = _follow(payload, path)
+            if value is not _MISSING:
+                fields[key] = value
+                break
+        else:
+            remaining.append(key)
+
+    if remaining:
+        found = find_keys(payload, remaining)
+        for key in remaining:
+            fields[key] = found.get(key)
+
+    return fields
@@ -5,20 +5,24 @@ import json
 import datetime
 import zoneinfo
 import requests
-import boto3
 import base64
-from collections import deque
-from typing import Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
 
 from mailjetUtil import (
     Subscriber as MailjetSubscriber,
-    MJCredentials,
     MJService,
     MailjetAction,
+    get_mailjet_credentials,
 )
 from openPathUpdateSingle import openPathUpdateSingle
+from alta_open_lambda.coalescer import Coalescer, parse_event_time
+from alta_open_lambda.extractors import extract, find_keys
 from neonUtil import getMemberById
 from aws_ssm import N_APIkey, N_APIuser
+from helpers.sessions import getSession
 
 
 logger = logging.getLogger()
@@ -26,42 +30,73 @@ logger.setLevel(logging.INFO)
 
 TZ = zoneinfo.ZoneInfo("America/Chicago")
 
+# Warm Lambda containers keep module state between invocations, so clients are
+# cached here (aws_ssm already keeps the secrets). The TTL bounds how long a
+# renamed Mailjet list can go unnoticed.
+WARM_CACHE_TTL = datetime.timedelta(minutes=15)
+
+T = TypeVar("T")
 
-def find_key_bfs(d: dict, target_key: str) -> Any:
-    """
-    Find a key in a nested dictionary using breadth-first search.
 
-    Args:
-        d: The dictionary to search
-        target_key: The key to find
+class TTLCache:
+    """
+    Module-level cache whose entries expire after a fixed time to live.
 
-    Returns:
-        The value associated with the key if found, None otherwise
+    A loader that returns None is not cached, so a failed lookup on a cold
+    start is retried on the next invocation instead of sticking for the TTL.
     """
 
-    queue: deque[tuple[dict, list[str]]] = deque([(d, [])])
+    def __init__(self, ttl: datetime.timedelta) -> None:
+        self.ttl = ttl.total_seconds()
+        self._entries: dict[str, tuple[float, Any]] = {}
+        self._lock = threading.RLock()
 
-    while queue:
-        current_dict, path = queue.popleft()
+    def get(self, key: str, load: Callable[[], T]) -> T:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
 
-        if not isinstance(current_dict, dict):
-            continue
+            value = load()
+            if value is not None:
+                self._entries[key] = (time.monotonic(), value)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_warm_cache = TTLCache(WARM_CACHE_TTL)
 
-        # Check if target key exists at current level
-        if target_key in current_dict:
-            return current_dict[target_key]
+# Skips OpenPath reconciles already covered by one for the same account
+coalescer = Coalescer()
 
-        # Add all nested dictionaries to the queue
-        for key, value in current_dict.items():
-            if isinstance(value, dict):
-                queue.append((value, path + [key]))
-            elif isinstance(value, list):
-                # Handle lists that might contain dictionaries
-                for i, item in enumerate(value):
-                    if isinstance(item, dict):
-                        queue.append((item, path + [key, f"[{i}]"]))
+# Accounts reconciled at once by batch_handler
+BATCH_WORKERS = 4
 
-    return None
+
+def get_cached_mailjet_service() -> MJService:
+    """
+    A cached MJService. Its list IDs are resolved once when it is built and
+    shared by later warm invocations until the cache entry expires.
+    """
+    built = False
+
+    def load() -> MJService:
+        nonlocal built
+        built = True
+        return MJService(get_mailjet_credentials())
+
+    mailjet = _warm_cache.get("mailjet_service", load)
+
+    # a cached service whose list lookup failed retries it rather than keeping None
+    if not built and (
+        mailjet.new_members_list_id is None or mailjet.all_contacts_list_id is None
+    ):
+        mailjet.set_list_ids()
+
+    return mailjet
 
 
 def add_member_to_mailjet(
@@ -93,22 +128,7 @@ def add_member_to_mailjet(
         )
         return
 
-    logger.info("Getting mailjet credentials from SSM")
-
-    ssm_mj_creds = boto3.client("ssm").get_parameters(
-        Names=[
-            "/mailjet/api_key",
-            "/mailjet/api_secret",
-        ],
-        WithDecryption=True,
-    )
-
-    mj_creds = MJCredentials(
-        public_key=ssm_mj_creds["Parameters"][0]["Value"],
-        secret_key=ssm_mj_creds["Parameters"][1]["Value"],
-    )
-
-    mailjet = MJService(mj_creds)
+    mailjet = get_cached_mailjet_service()
 
     mailjet_account = MailjetSubscriber(
         email_=account_email.lower(),
@@ -184,10 +204,8 @@ def get_neon_id_from_membership_id(membership_id: int) -> int | None:
         "Authorization": f"Basic {N_signature}",
     }
     try:
-        response = requests.get(
-            url=f"https://api.neoncrm.com/v2/memberships/{membership_id}",
-            headers=N_headers,
-        )
+        url = f"https://api.neoncrm.com/v2/memberships/{membership_id}"
+        response = getSession(url).get(url=url, headers=N_headers)
     except requests.exceptions.RequestException as e:
         logger.error("Error retrieving membership %s from Neon: %s", membership_id, e)
         return None
@@ -201,7 +219,7 @@ def get_neon_id_from_membership_id(membership_id: int) -> int | None:
         )
         return None
 
-    neon_id = find_key_bfs(response.json(), "accountId")
+    neon_id = find_keys(response.json(), ["accountId"]).get("accountId")
     if not neon_id:
         logger.warning("No Neon ID found in membership %s response", membership_id)
         return None
@@ -209,26 +227,19 @@ def get_neon_id_from_membership_id(membership_id: int) -> int | None:
     return neon_id
 
 
-def lambda_handler(event: dict, _: dict) -> None:
-    """
-    Main lambda handler.
-    """
-
+def in_maintenance_window() -> bool:
+    """dailyMaintenance runs between 2:30 AM and 4:59 AM (inclusive)."""
     now = datetime.datetime.now(TZ)
+    return (now.hour == 2 and now.minute >= 30) or (3 <= now.hour < 5)
 
-    # Don't run between 2:30 AM and 4:59 AM (inclusive)
-    if (now.hour == 2 and now.minute >= 30) or (3 <= now.hour < 5):
-        logger.info("Skipping run between 2:30 and 5:00 AM")
-        return
-
-    logger.info("EVENT INFO: %s", event)
-
-    if not (body := event.get("body")):
-        return
 
-    neon_response: dict = json.loads(body)
+def resolve_webhook(neon_response: dict) -> tuple[Any, bool] | None:
+    """
+    Parse one Neon webhook body. Returns the Neon ID whose OpenPath access
+    should be reconciled and whether the event is a successful join, or None.
+    """
     if not (event_trigger := neon_response.get("eventTrigger")):
-        return
+        return None
 
     # This will be read as a string, not a boolean. Since we're only using this
     # as a temporary measure to migrate off the legacy webhooks, I don't think
@@ -242,46 +253,44 @@ def lambda_handler(event: dict, _: dict) -> None:
         logger.warning('This type of webhook will be deprecated soon - please update your webhook.')
 
     neon_id = None
+    join = False
 
     match event_trigger:
         case "createMembership":
             logger.info("Event trigger: createMembership")
             if not (data := neon_response.get("data")):
                 logger.error("No data found in event object")
-                return
-            neon_id = find_key_bfs(data, "accountId")
+                return None
+            if legacy == "true":
+                status_key, enroll_key = "transactionStatus", "enrollmentType"
+            else:
+                status_key, enroll_key = "status", "enrollType"
+            fields = extract(event_trigger, data, ["accountId", status_key, enroll_key])
+
+            neon_id = fields["accountId"]
             if not neon_id:
                 logger.error("No Neon ID found in event data")
-                return
+                return None
 
-            if legacy == "true":
-                transaction_status = find_key_bfs(data, "transactionStatus")
-                enroll_type = find_key_bfs(data, "enrollmentType")
-            else:
-                transaction_status = find_key_bfs(data, "status")
-                enroll_type = find_key_bfs(data, "enrollType")
+            transaction_status = fields[status_key]
+            enroll_type = fields[enroll_key]
 
-            if transaction_status == "SUCCEEDED" and enroll_type in {
+            join = transaction_status == "SUCCEEDED" and enroll_type in {
                 "JOIN",
                 "REJOIN",
-            }:
-                logger.info(
-                    "Getting account and membership end dates for Neon ID: %s", neon_id
-                )
-                account, should_add_member, membership_end_dates = handle_joins(neon_id)
-
-                if should_add_member:
-                    logger.info("Adding Neon ID %s to Mailjet", neon_id)
-                    add_member_to_mailjet(account, membership_end_dates)
-
-        case "updateMembership":
-            neon_id = find_key_bfs(neon_response, "accountId")
-        case "editAccount":
-            neon_id = find_key_bfs(neon_response, "accountId")
+            }
+
+        case "updateMembership" | "editAccount":
+            neon_id = extract(event_trigger, neon_response, ["accountId"])["accountId"]
         case "mergedAccount":
-            neon_id = find_key_bfs(neon_response, "matchedAccountId")
+            neon_id = extract(event_trigger, neon_response, ["matchedAccountId"])[
+                "matchedAccountId"
+            ]
         case "updateEventRegistration":
             data = neon_response.get("data", {})
+            registration = extract(
+                event_trigger, data, ["registrationStatus", "markedAttended"]
+            )
             attendee_ids = [
                 a.get("accountId")
                 for t in data.get("tickets", [])
@@ -295,16 +304,18 @@ def lambda_handler(event: dict, _: dict) -> None:
                 attendee_ids,
                 data.get("eventId"),
                 data.get("id"),
-                find_key_bfs(data, "registrationStatus"),
-                find_key_bfs(data, "markedAttended"),
+                registration["registrationStatus"],
+                registration["markedAttended"],
             )
-            return
+            return None
 
         case "deleteMembership":
-            membership_id = find_key_bfs(neon_response, "membershipId")
+            membership_id = extract(event_trigger, neon_response, ["membershipId"])[
+                "membershipId"
+            ]
             if not membership_id:
                 logger.error("No membership ID found in event data")
-                return
+                return None
 
             logger.info("Getting Neon ID from membership ID: %s", membership_id)
 
@@ -312,21 +323,153 @@ def lambda_handler(event: dict, _: dict) -> None:
 
     if not neon_id:
         logger.warning("No Neon ID found")
+        return None
+
+    return neon_id, join
+
+
+def reconcile(
+    neon_id: Any, event_time: datetime.datetime | None, account: dict | None = None
+) -> None:
+    """
+    Update OpenPath for the account unless a recent reconcile already covered it.
+    account is the Neon account with memberships, if it was already fetched.
+    """
+    if coalescer.already_reconciled(neon_id, event_time):
         return
 
     logger.info("Updating Alta Open for Neon ID: %s", neon_id)
 
-    openPathUpdateSingle(neon_id)
-
-    # Currently, marking attendance does not trigger the updateEventRegistration webhook,
-    # so the following code will not run
-    # if event_trigger == "updateEventRegistration":
-    #     event_id = neon_response.get("data").get("eventId")
-    #     event = neon.getEvent(event_id)
-    #     event_name = event.get("name")
-    #     event_date = event.get("eventDates").get("endDate")
-    #     attendees = neon_response.get("data").get("tickets")[0].get("attendees")
-    #     for attendee in attendees:
-    #         if attendee.get("markedAttended"):
-    #             neon_id = attendee.get("registrantAccountId")
-    #             toolTestingUpdate(event_name, neon_id, event_date)
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    if account is None:
+        openPathUpdateSingle(neon_id)
+    else:
+        openPathUpdateSingle(neon_id, account=account)
+    coalescer.record(neon_id, started_at)
+
+
+def process_account(
+    neon_id: Any, event_time: datetime.datetime | None, join: bool
+) -> None:
+    """
+    Reconcile one account, then add it to Mailjet if it is a fresh join. A join
+    fetches the account once and shares it with the reconcile.
+
+    The Mailjet add runs last and its failure is only logged, so it can neither
+    hold up OpenPath access nor get the record redelivered and the join repeated.
+    dailyMaintenance adds any contact it missed to the all contacts list.
+    """
+    if not join:
+        reconcile(neon_id, event_time)
+        return
+
+    logger.info("Getting account and membership end dates for Neon ID: %s", neon_id)
+    account, should_add_member, membership_end_dates = handle_joins(neon_id)
+    reconcile(neon_id, event_time, account)
+
+    if should_add_member:
+        logger.info("Adding Neon ID %s to Mailjet", neon_id)
+        try:
+            add_member_to_mailjet(account, membership_end_dates)
+        except Exception:
+            logger.exception("Failed to add Neon ID %s to Mailjet", neon_id)
+
+
+def lambda_handler(event: dict, _: dict) -> None:
+    """
+    Main lambda handler.
+    """
+
+    # Don't run while dailyMaintenance is running
+    if in_maintenance_window():
+        logger.info("Skipping run between 2:30 and 5:00 AM")
+        return
+
+    logger.info("EVENT INFO: %s", event)
+
+    if not (body := event.get("body")):
+        return
+
+    neon_response: dict = json.loads(body)
+    if not (resolved := resolve_webhook(neon_response)):
+        return
+
+    neon_id, join = resolved
+    process_account(
+        neon_id, parse_event_time(neon_response.get("eventTimestamp")), join
+    )
+
+
+def batch_handler(event: dict, _: dict) -> dict:
+    """
+    Handler for SQS batches of webhook bodies, e.g. the first-of-the-month
+    renewal burst. Each account is processed once per batch, however many
+    records mention it, with up to BATCH_WORKERS accounts at a time.
+
+    Returns SQS partial batch failures so only failed records are redelivered.
+    """
+    records = event.get("Records", [])
+
+    # Leave the whole batch for redelivery once dailyMaintenance is done
+    if in_maintenance_window():
+        logger.info("Deferring batch of %s between 2:30 and 5:00 AM", len(records))
+        return {
+            "batchItemFailures": [
+                {"itemIdentifier": record["messageId"]} for record in records
+            ]
+        }
+
+    failures: list[str] = []
+    # One entry per account: its Neon ID, the message IDs that mention it, the
+    # latest event time among them (None if any record has no timestamp) and
+    # whether any of them is a join
+    accounts: dict[str, tuple[Any, list[str], datetime.datetime | None, bool]] = {}
+
+    for record in records:
+        message_id = record["messageId"]
+        try:
+            neon_response = json.loads(record["body"])
+            resolved = resolve_webhook(neon_response)
+        except Exception:
+            logger.exception("Failed to handle record %s", message_id)
+            failures.append(message_id)
+            continue
+        if not resolved:
+            continue
+
+        neon_id, join = resolved
+        event_time = parse_event_time(neon_response.get("eventTimestamp"))
+        if str(neon_id) in accounts:
+            neon_id, message_ids, latest, joined = accounts[str(neon_id)]
+            message_ids.append(message_id)
+            event_time = (
+                max(latest, event_time)
+                if latest is not None and event_time is not None
+                else None
+            )
+            join = join or joined
+        else:
+            message_ids = [message_id]
+        accounts[str(neon_id)] = (neon_id, message_ids, event_time, join)
+
+    logger.info(
+        "Processing %s accounts for %s records", len(accounts), len(records)
+    )
+
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+        futures = {
+            pool.submit(process_account, neon_id, event_time, join): message_ids
+            for neon_id, message_ids, event_time, join in accounts.values()
+        }
+        for future, message_ids in futures.items():
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Failed to process records %s", message_ids)
+                failures.extend(message_ids)
+
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in failures
+        ]
+    }
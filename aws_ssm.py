@@ -1,27 +1,147 @@
+################# Secrets from AWS SSM Parameter Store #################
+#  Used instead of config.py on EC2/Lambda. Values are fetched on      #
+#  first access, not at import, and only for the service being used:  #
+#  importing N_APIkey fetches the Neon key and user in one call, and   #
+#  never touches the Gmail, Discourse, OpenPath or Mailjet secrets.    #
+#                                                                      #
+#  Set SSM_CACHE_PATH to also cache fetched values on local disk       #
+#  (file mode 0600) for SSM_CACHE_TTL seconds, so back-to-back cron    #
+#  scripts don't each go back to SSM.                                  #
+########################################################################
+
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable
+
 import boto3
 
-ssm_creds = boto3.client("ssm").get_parameters(
-    Names=[
-        "/altaopen/api_key",
-        "/altaopen/api_user",
-        "/discourse/api_key",
-        "/discourse/api_user",
-        "/gmail/user",
-        "/gmail/password",
-        "/neon/api_key",
-        "/neon/api_user",
-    ],
-    WithDecryption=True,
-)
-
-N_APIkey = ssm_creds["Parameters"][6]["Value"]
-N_APIuser = ssm_creds["Parameters"][7]["Value"]
-
-G_user = ssm_creds["Parameters"][5]["Value"]
-G_password = ssm_creds["Parameters"][4]["Value"]
-
-O_APIkey = ssm_creds["Parameters"][0]["Value"]
-O_APIuser = ssm_creds["Parameters"][1]["Value"]
-
-D_APIkey = ssm_creds["Parameters"][2]["Value"]
-D_APIuser = ssm_creds["Parameters"][3]["Value"]
+PARAMETERS = {
+    "N_APIkey": "/neon/api_key",
+    "N_APIuser": "/neon/api_user",
+    "G_user": "/gmail/user",
+    "G_password": "/gmail/password",
+    "O_APIkey": "/altaopen/api_key",
+    "O_APIuser": "/altaopen/api_user",
+    "D_APIkey": "/discourse/api_key",
+    "D_APIuser": "/discourse/api_user",
+    "MJ_APIkey": "/mailjet/api_key",
+    "MJ_APIsecret": "/mailjet/api_secret",
+}
+
+#get_parameters accepts at most 10 names per call
+SSM_BATCH_SIZE = 10
+
+CACHE_PATH_ENV = "SSM_CACHE_PATH"
+CACHE_TTL_ENV = "SSM_CACHE_TTL"
+DEFAULT_CACHE_TTL = 3600
+
+_values: dict[str, str] = {}
+_lock = threading.Lock()
+
+
+#all parameters for the same service, e.g. "/neon/api_key" -> "/neon/api_user"
+def _serviceParameters(parameter: str) -> list[str]:
+    prefix = parameter.rsplit("/", 1)[0] + "/"
+    return [name for name in PARAMETERS.values() if name.startswith(prefix)]
+
+
+def _cachePath() -> str | None:
+    return os.environ.get(CACHE_PATH_ENV) or None
+
+
+def _cacheTtl() -> float:
+    return float(os.environ.get(CACHE_TTL_ENV, DEFAULT_CACHE_TTL))
+
+
+def _readDiskCache() -> dict[str, dict]:
+    path = _cachePath()
+    if path is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable SSM cache %s: %s", path, e)
+        return {}
+
+
+def _writeDiskCache(values: dict[str, str]):
+    path = _cachePath()
+    if path is None:
+        return
+    cached = _readDiskCache()
+    now = time.time()
+    cached.update({name: {"value": value, "fetchedAt": now} for name, value in values.items()})
+    tmpPath = f"{path}.tmp"
+    try:
+        #create the file owner-only before any secret is written to it
+        fd = os.open(tmpPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cached, f)
+        os.replace(tmpPath, path)
+    except OSError as e:
+        logging.warning("Could not write SSM cache %s: %s", path, e)
+
+
+def _fromDiskCache(names: list[str]) -> dict[str, str]:
+    cached = _readDiskCache()
+    oldest = time.time() - _cacheTtl()
+    return {
+        name: cached[name]["value"]
+        for name in names
+        if name in cached and cached[name].get("fetchedAt", 0) >= oldest
+    }
+
+
+def _fromSsm(names: list[str]) -> dict[str, str]:
+    client = boto3.client("ssm")
+    values = {}
+    for i in range(0, len(names), SSM_BATCH_SIZE):
+        response = client.get_parameters(Names=names[i:i + SSM_BATCH_SIZE], WithDecryption=True)
+        if response.get("InvalidParameters"):
+            raise ValueError(f"SSM parameters not found: {response['InvalidParameters']}")
+        values.update({parameter["Name"]: parameter["Value"] for parameter in response["Parameters"]})
+    return values
+
+
+def fetch(names: Iterable[str]) -> dict[str, str]:
+    """
+    Values for the given SSM parameter names, from the in-process cache, then
+    the disk cache if enabled, then a single batched SSM call for the rest.
+    """
+    names = list(dict.fromkeys(names))
+    with _lock:
+        missing = [name for name in names if name not in _values]
+        if missing:
+            found = _fromDiskCache(missing)
+            stillMissing = [name for name in missing if name not in found]
+            if stillMissing:
+                fetched = _fromSsm(stillMissing)
+                _writeDiskCache(fetched)
+                found.update(fetched)
+            _values.update(found)
+        return {name: _values[name] for name in names}
+
+
+def prefetch(*attributes: str):
+    """Fetch the services behind several attributes at once, e.g. prefetch("N_APIkey", "O_APIkey")."""
+    fetch(name for attribute in attributes for name in _serviceParameters(PARAMETERS[attribute]))
+
+
+def clearCache():
+    with _lock:
+        _values.clear()
+
+
+def __getattr__(attribute: str) -> str:
+    if attribute not in PARAMETERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {attribute!r}")
+    parameter = PARAMETERS[attribute]
+    return fetch(_serviceParameters(parameter))[parameter]
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + list(PARAMETERS))
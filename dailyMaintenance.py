@@ -1,13 +1,13 @@
-from discourseUpdateGroups import discourseUpdateGroups
+from discourseUpdateGroups import discourseUpdateGroups, fetchGroupMembers
 from openPathUpdateAll import openPathUpdateAll
-from mailjetUtil import run_mailjet_maintenance
+from mailjetUtil import run_mailjet_maintenance, get_mailjet_neon_lookups, get_all_contacts_list_state
 
 import neonUtil
+import openPathUtil
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import datetime, pytz
 
-import json
-
 logging.basicConfig(
     format="%(asctime)s %(levelname)-8s %(message)s",
     level=logging.INFO,
@@ -15,19 +15,38 @@ logging.basicConfig(
 )
 
 
+# A failed prefetch shouldn't stop the other services' updates
+def prefetched(future, what):
+    try:
+        return future.result()
+    except Exception:
+        logging.exception("Prefetching %s failed", what)
+        return None
+
+
 def main():
     logging.info("Starting sync cycle.")
     neonAccounts = {}
 
     # For real use, just get neon accounts directly
     # Be aware this takes a long time (2+ minutes)
-    neonAccounts = neonUtil.getRealAccounts()
+    # Only the first run of the day does a full pull; later runs fetch what changed since the last one
+    # Results are saved so standalone scripts can reuse them (see neonSnapshot.py)
+    # OpenPath users are kept up to date the same way (see openPathDirectory.py)
+    # None of the other services' reads depend on Neon, so fetch them while we wait
+    neonPulledAt = datetime.datetime.now(datetime.timezone.utc)
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        neonFuture = executor.submit(neonUtil.getRealAccounts, incremental=True)
+        opUsersFuture = executor.submit(openPathUtil.getAllUsers, incremental=True)
+        groupMembersFuture = executor.submit(fetchGroupMembers)
+        mailjetLookupsFuture = executor.submit(get_mailjet_neon_lookups)
+        mailjetListFuture = executor.submit(get_all_contacts_list_state)
 
-    # Testing goes a lot faster if we're working with a cache of accounts
-    # with open("Neon/neonAccounts.json") as neonFile:
-    #     neonAccountJson = json.load(neonFile)
-    #     for account in neonAccountJson:
-    #         neonAccounts[neonAccountJson[account]["Account ID"]] = neonAccountJson[account]
+        neonAccounts = neonFuture.result()
+        opUsers = prefetched(opUsersFuture, "OpenPath users")
+        groupMembers = prefetched(groupMembersFuture, "Discourse groups")
+        mailjetLookups = prefetched(mailjetLookupsFuture, "Mailjet's Neon accounts")
+        mailjetList = prefetched(mailjetListFuture, "the Mailjet contact list")
 
     # we're going to run this multiple times per day, but we don't want to send a zillion emails
     now = datetime.datetime.now(pytz.timezone("America/Chicago"))
@@ -37,14 +56,24 @@ def main():
     )
 
 
-    if now < mailcutoff:
-        openPathUpdateAll(neonAccounts, mailSummary=True)
+    # without the OpenPath user list we can't tell what needs changing; try again next cycle
+    if opUsers is None:
+        logging.error("Skipping OpenPath updates this cycle.")
+    elif now < mailcutoff:
+        openPathUpdateAll(neonAccounts, mailSummary=True, opUsers=opUsers)
     else:
-        openPathUpdateAll(neonAccounts, mailSummary=False)
+        openPathUpdateAll(neonAccounts, mailSummary=False, opUsers=opUsers)
 
 
-    discourseUpdateGroups(neonAccounts)
-    run_mailjet_maintenance()
+    discourseUpdateGroups(neonAccounts, groupMembers=groupMembers)
+    # missing prefetches are fetched again by run_mailjet_maintenance
+    run_mailjet_maintenance(
+        neonAccounts,
+        mailjetLookups,
+        neon_pulled_at=neonPulledAt,
+        list_state=mailjetList,
+        mail_alerts=now < mailcutoff,
+    )
     logging.info("Sync cycle complete.")
 
 
@@ -4,6 +4,8 @@
 ################################################################
 
 from pprint import pformat
+from concurrent.futures import ThreadPoolExecutor
+import datetime
 import discourseUtil
 import neonUtil
 import logging
@@ -13,9 +15,40 @@ logging.basicConfig(
          level=logging.INFO,
          datefmt='%Y-%m-%d %H:%M:%S')
 
-def updateMakers(neonAccounts: dict):
-    # retrieve all members of makers group
-    makers = discourseUtil.getGroupMembers(discourseUtil.GROUP_MAKERS)
+#how stale a saved Neon account snapshot can be when running standalone
+SNAPSHOT_MAX_AGE = datetime.timedelta(hours=1)
+
+#groups whose current membership we read before updating
+SYNCED_GROUPS = (
+    discourseUtil.GROUP_MAKERS,
+    discourseUtil.GROUP_WIKI_ADMINS,
+    discourseUtil.GROUP_STEWARDS,
+    discourseUtil.GROUP_LEADERSHIP,
+)
+
+#fetch current members of all SYNCED_GROUPS at once.  A failed fetch maps to None
+def fetchGroupMembers():
+    with ThreadPoolExecutor(max_workers=len(SYNCED_GROUPS)) as executor:
+        return dict(zip(SYNCED_GROUPS, executor.map(discourseUtil.getGroupMembers, SYNCED_GROUPS)))
+
+#map each DiscourseID to the Neon accounts that use it, so we don't rescan neonAccounts per Discourse user
+#accounts without a DiscourseID are listed under None
+def buildDiscourseIndex(neonAccounts: dict):
+    index = {}
+    for account in neonAccounts.values():
+        index.setdefault(account.get("DiscourseID") or None, []).append(account)
+    return index
+
+def isActive(account: dict):
+    return account.get("validMembership") or neonUtil.accountIsType(account, neonUtil.STAFF_TYPE)
+
+def updateMakers(neonAccounts: dict, makers: dict = None, discourseIndex: dict = None):
+    if discourseIndex is None:
+        discourseIndex = buildDiscourseIndex(neonAccounts)
+
+    # retrieve all members of makers group, unless the caller already did
+    if makers is None:
+        makers = discourseUtil.getGroupMembers(discourseUtil.GROUP_MAKERS)
     if makers is None:
         # Failed to fetch group membership, so avoid updating
         return
@@ -23,7 +56,7 @@ def updateMakers(neonAccounts: dict):
     #Step 1: find all Neon accounts that are paid up, have a DiscourseID, and aren't in Makers
     addMakers = set()
     for account in neonAccounts:
-        if not neonAccounts[account].get("validMembership") and not neonUtil.accountIsType(neonAccounts[account], neonUtil.STAFF_TYPE):
+        if not isActive(neonAccounts[account]):
             continue
         #logging.debug(pformat(neonAccounts[account]))
         if neonAccounts[account].get("DiscourseID") is None or neonAccounts[account].get("DiscourseID") == "":
@@ -43,12 +76,7 @@ def updateMakers(neonAccounts: dict):
     #step 2 : remove makers without an active membership
     removeMakers = set()
     for maker in makers:
-        remove = True
-        for account in neonAccounts:
-            if maker == neonAccounts[account].get("DiscourseID") and (neonAccounts[account].get("validMembership") or neonUtil.accountIsType(neonAccounts[account], neonUtil.STAFF_TYPE)):
-                    remove = False
-
-        if remove:
+        if not any(isActive(account) for account in discourseIndex.get(maker, [])):
             logging.info(maker+" ("+makers[maker]["name"]+") used to be a subscriber but is no longer")
             removeMakers.add(f'{maker}')
 
@@ -57,66 +85,72 @@ def updateMakers(neonAccounts: dict):
     discourseUtil.addGroupMembers(list(removeMakers), discourseUtil.GROUP_COMMUNITY)
 
 
-def updateTypes(neonAccounts: dict):
+def updateTypes(neonAccounts: dict, groupMembers: dict = None, discourseIndex: dict = None):
+    groupMembers = groupMembers or {}
+    if discourseIndex is None:
+        discourseIndex = buildDiscourseIndex(neonAccounts)
+
     #using sets for these to pevent duplicate entries
     leadershipMembers = set()
     stewardsMembers = set()
     instructorsMembers = set()
     wikiAdmins = set()
 
-    for account in neonAccounts.values():
-        dID = account.get("DiscourseID")
-        if not dID:
-            if neonUtil.accountIsAnyType(account):
-                logging.warning(f'{account["First Name"]} {account["Last Name"]} ({account["Account ID"]}) has type {account.get("Individual Type")} but no Discourse ID')
+    for account in discourseIndex.get(None, []):
+        if neonUtil.accountIsAnyType(account):
+            logging.warning(f'{account["First Name"]} {account["Last Name"]} ({account["Account ID"]}) has type {account.get("Individual Type")} but no Discourse ID')
+
+    for dID, accounts in discourseIndex.items():
+        if dID is None:
             continue
 
-        if neonUtil.accountIsType(account, neonUtil.LEAD_TYPE) or neonUtil.accountIsType(account, neonUtil.DIRECTOR_TYPE):
-            leadershipMembers.add(dID)
+        for account in accounts:
+            if neonUtil.accountIsType(account, neonUtil.LEAD_TYPE) or neonUtil.accountIsType(account, neonUtil.DIRECTOR_TYPE):
+                leadershipMembers.add(dID)
 
-        if neonUtil.accountIsType(account, neonUtil.STEWARD_TYPE) or neonUtil.accountIsType(account, neonUtil.SUPER_TYPE):
-            stewardsMembers.add(dID)
+            if neonUtil.accountIsType(account, neonUtil.STEWARD_TYPE) or neonUtil.accountIsType(account, neonUtil.SUPER_TYPE):
+                stewardsMembers.add(dID)
 
-        if neonUtil.accountIsType(account, neonUtil.INSTRUCTOR_TYPE):
-            instructorsMembers.add(dID)
+            if neonUtil.accountIsType(account, neonUtil.INSTRUCTOR_TYPE):
+                instructorsMembers.add(dID)
 
-        if neonUtil.accountIsType(account, neonUtil.WIKI_ADMIN_TYPE):
-            wikiAdmins.add(dID)
+            if neonUtil.accountIsType(account, neonUtil.WIKI_ADMIN_TYPE):
+                wikiAdmins.add(dID)
 
     #Discourse is annoying about primary groups - there's no way to set a heirarchy; it's last-one-sticks
     #Update the "highest rank" group last so users new to multiple groups wind up with the highest title
-    discourseUtil.setGroupMembers(list(wikiAdmins), discourseUtil.GROUP_WIKI_ADMINS)
-    discourseUtil.setGroupMembers(list(stewardsMembers), discourseUtil.GROUP_STEWARDS)
+    discourseUtil.setGroupMembers(list(wikiAdmins), discourseUtil.GROUP_WIKI_ADMINS,
+                                  currentMembersDict=groupMembers.get(discourseUtil.GROUP_WIKI_ADMINS))
+    discourseUtil.setGroupMembers(list(stewardsMembers), discourseUtil.GROUP_STEWARDS,
+                                  currentMembersDict=groupMembers.get(discourseUtil.GROUP_STEWARDS))
     #haven't actually decided on a Discourse group for instructors yet
     #discourseUtil.setGroupMembers(list(instructorsMembers), discourseUtil.GROUP_INSTRUCTORS)
-    discourseUtil.setGroupMembers(list(leadershipMembers), discourseUtil.GROUP_LEADERSHIP)
+    discourseUtil.setGroupMembers(list(leadershipMembers), discourseUtil.GROUP_LEADERSHIP,
+                                  currentMembersDict=groupMembers.get(discourseUtil.GROUP_LEADERSHIP))
 
 
 
-def discourseUpdateGroups(neonAccounts: dict):
+#groupMembers is an optional prefetch from fetchGroupMembers(); missing or failed groups are fetched again
+def discourseUpdateGroups(neonAccounts: dict, groupMembers: dict = None):
     #quick sanity check - don't blow away all the groups if this is called with an empty dict
     if len(neonAccounts) == 0:
         logging.error("discourseUpdateGroups() called with empty accounts dict.  aborting.")
         return
 
-    updateMakers(neonAccounts)
-    updateTypes(neonAccounts)
+    groupMembers = groupMembers or {}
+    discourseIndex = buildDiscourseIndex(neonAccounts)
+    updateMakers(neonAccounts, makers=groupMembers.get(discourseUtil.GROUP_MAKERS), discourseIndex=discourseIndex)
+    updateTypes(neonAccounts, groupMembers, discourseIndex=discourseIndex)
 
 #begin standalone script functionality -- pull neonAccounts and call our function
 def main():
     neonAccounts = {}
 
-    #For real use, just get neon accounts directly
-    #Be aware this takes a long time (2+ minutes)
-    neonAccounts = neonUtil.getRealAccounts()
+    #Pulling accounts from Neon takes a long time (2+ minutes), so reuse
+    #the snapshot saved by the last sync cycle if it's recent enough
+    neonAccounts = neonUtil.getRealAccounts(snapshotMaxAge=SNAPSHOT_MAX_AGE)
     #neonAccounts = neonUtil.getMembersFast()
 
-    # Testing goes a lot faster if we're working with a cache of accounts
-    # with open("Neon/neonAccounts.json") as neonFile:
-    #     neonAccountJson = json.load(neonFile)
-    #     for account in neonAccountJson:
-    #         neonAccounts[neonAccountJson[account]["Account ID"]] = neonAccountJson[account]
-
     discourseUpdateGroups(neonAccounts)
 
 if __name__ == "__main__":
@@ -4,10 +4,11 @@
 ################################################################
 
 from pprint import pformat
-import requests
 import logging
 import os
 
+from helpers.sessions import getSession
+
 ### Discourse Account Info
 if os.environ.get("USER") == "ec2-user" or os.environ.get("LAMBDA_TASK_ROOT"):
     from aws_ssm import D_APIkey, D_APIuser
@@ -58,7 +59,7 @@ def getGroupMembers(groupName: str):
             + str(offset)
         )
         print(f"""fetching from {url}""")
-        response = requests.get(url, headers=D_headers)
+        response = getSession(url).get(url, headers=D_headers)
         offset += limit
         if response.status_code != 200:
             logging.error(f"Failed to fetch group {groupName}: HTTP {response.status_code}")
@@ -87,7 +88,7 @@ def addGroupMembers(membersList: list, groupName: str):
 
     logging.info(f"""Adding members to {groupName}: {','.join(membersList)}""")
     if not dryRun:
-        updateResponse = requests.put(
+        updateResponse = getSession(url).put(
             url, data={"usernames": ",".join(membersList)}, headers=D_headers
         )
         if updateResponse.status_code != 200:
@@ -110,7 +111,7 @@ def removeGroupMembers(membersList: list, groupName: str):
 
     logging.info(f"""Removing members from {groupName}: {','.join(membersList)}""")
     if not dryRun:
-        deleteResponse = requests.delete(
+        deleteResponse = getSession(url).delete(
             url, data={"usernames": ",".join(membersList)}, headers=D_headers
         )
         if deleteResponse.status_code != 200:
@@ -124,11 +125,13 @@ def removeGroupMembers(membersList: list, groupName: str):
 ####################################################################
 # Set Discourse group membership by adding and/or removing users
 ####################################################################
-def setGroupMembers(newMembersList: list, groupName: str):
+def setGroupMembers(newMembersList: list, groupName: str, currentMembersDict: dict = None):
     if GROUP_IDS.get(groupName) is None:
         logging.error(f""""{groupName}" is not a known Discourse group""")
 
-    currentMembersDict = getGroupMembers(groupName)
+    # callers that already fetched the group can pass its members in
+    if currentMembersDict is None:
+        currentMembersDict = getGroupMembers(groupName)
     if currentMembersDict is None:
         # Failed to fetch group membership, so avoid updating
         return
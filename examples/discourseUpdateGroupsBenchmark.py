@@ -0,0 +1,100 @@
+############### discourseUpdateGroups reconciliation benchmark ###############
+#  Times updateMakers() step 2 (find makers without an active membership)   #
+#  against synthetic account sets, old nested scan vs. DiscourseID index    #
+#  Run from the repo root:  python examples/discourseUpdateGroupsBenchmark.py
+#############################################################################
+
+import logging
+import random
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discourseUpdateGroups
+import discourseUtil
+import neonUtil
+
+#keep the benchmark offline and quiet
+discourseUtil.dryRun = True
+logging.disable(logging.INFO)
+
+SIZES = (10_000, 50_000)
+
+
+def syntheticAccounts(count: int):
+    rng = random.Random(count)
+    neonAccounts = {}
+    for i in range(count):
+        account = {
+            "Account ID": str(i),
+            "First Name": "First",
+            "Last Name": f"Last{i}",
+            "validMembership": rng.random() < 0.4,
+        }
+        if rng.random() < 0.7:
+            account["DiscourseID"] = f"user{i}"
+        if rng.random() < 0.02:
+            account["individualTypes"] = [{"name": neonUtil.STAFF_TYPE}]
+        neonAccounts[str(i)] = account
+    return neonAccounts
+
+
+#makers group drawn from all Discourse users, so some need removing
+def syntheticMakers(neonAccounts: dict):
+    rng = random.Random(len(neonAccounts))
+    return {
+        account["DiscourseID"]: {"name": account["Last Name"]}
+        for account in neonAccounts.values()
+        if account.get("DiscourseID") and rng.random() < 0.5
+    }
+
+
+#the pre-index step 2, kept here for comparison
+def nestedRemoveMakers(neonAccounts: dict, makers: dict):
+    removeMakers = set()
+    for maker in makers:
+        remove = True
+        for account in neonAccounts:
+            if maker == neonAccounts[account].get("DiscourseID") and (neonAccounts[account].get("validMembership") or neonUtil.accountIsType(neonAccounts[account], neonUtil.STAFF_TYPE)):
+                    remove = False
+        if remove:
+            removeMakers.add(maker)
+    return removeMakers
+
+
+def indexedRemoveMakers(neonAccounts: dict, makers: dict):
+    discourseIndex = discourseUpdateGroups.buildDiscourseIndex(neonAccounts)
+    return {
+        maker for maker in makers
+        if not any(discourseUpdateGroups.isActive(account) for account in discourseIndex.get(maker, []))
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    for count in SIZES:
+        neonAccounts = syntheticAccounts(count)
+        makers = syntheticMakers(neonAccounts)
+
+        indexed, indexedTime = timed(indexedRemoveMakers, neonAccounts, makers)
+        _, fullTime = timed(discourseUpdateGroups.updateMakers, neonAccounts, makers)
+        print(f"{count} accounts, {len(makers)} makers:")
+        print(f"    indexed step 2:      {indexedTime:8.3f}s")
+        print(f"    full updateMakers(): {fullTime:8.3f}s")
+
+        #the nested scan is quadratic; at 50k it takes far too long to be worth waiting for
+        if count <= 10_000:
+            nested, nestedTime = timed(nestedRemoveMakers, neonAccounts, makers)
+            assert nested == indexed
+            print(f"    nested step 2:       {nestedTime:8.3f}s ({nestedTime / indexedTime:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,20 @@
-import requests
+from helpers.sessions import getSession
 
 
 ## Helper function for API calls
 def apiCall(httpVerb, url, json, headers):
-    # Make request
+    # Make request over the shared keep-alive session for this host
+    session = getSession(url)
     if httpVerb == "GET":
-        response = requests.get(url, json=json, headers=headers)
+        response = session.get(url, json=json, headers=headers)
     elif httpVerb == "POST":
-        response = requests.post(url, json=json, headers=headers)
+        response = session.post(url, json=json, headers=headers)
     elif httpVerb == "PUT":
-        response = requests.put(url, json=json, headers=headers)
+        response = session.put(url, json=json, headers=headers)
     elif httpVerb == "PATCH":
-        response = requests.patch(url, json=json, headers=headers)
+        response = session.patch(url, json=json, headers=headers)
     elif httpVerb == "DELETE":
-        response = requests.delete(url, json=json, headers=headers)
+        response = session.delete(url, json=json, headers=headers)
     else:
         print(f"HTTP verb {httpVerb} not recognized")
 
@@ -0,0 +1,76 @@
+import datetime
+import email.utils
+import logging
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    """
+    Spaces calls out to `rate` per second across all threads, and adapts the
+    rate to the API's answers: it halves on a 429 or 5xx (honouring any
+    Retry-After) and creeps back up by `increase` per healthy response, up to
+    maxRate.
+    """
+
+    def __init__(self, rate, minRate=1.0, maxRate=None, increase=0.05, decrease=0.5):
+        self.rate = rate
+        self.minRate = minRate
+        self.maxRate = maxRate if maxRate is not None else rate
+        self.increase = increase
+        self.decrease = decrease
+        self.lock = threading.Lock()
+        self.nextTime = time.monotonic()
+
+    @property
+    def currentRate(self):
+        return self.rate
+
+    ## Claim the next call slot; returns how many seconds to wait for it
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.nextTime - now
+            self.nextTime = max(now, self.nextTime) + 1.0 / self.rate
+        return max(wait, 0.0)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    ## Adjust the rate from an API response
+    def observe(self, response):
+        throttled = response.status_code == 429 or response.status_code >= 500
+        with self.lock:
+            if not throttled:
+                self.rate = min(self.maxRate, self.rate + self.increase)
+                return
+
+            self.rate = max(self.minRate, self.rate * self.decrease)
+            retryAfter = retryAfterSeconds(response)
+            if retryAfter is not None:
+                self.nextTime = max(self.nextTime, time.monotonic() + retryAfter)
+
+        logging.warning(
+            "%s returned %s; slowing to %.1f requests/second",
+            response.url,
+            response.status_code,
+            self.rate,
+        )
+
+
+## Seconds to wait from a Retry-After header (delay-seconds or HTTP date), or None
+def retryAfterSeconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retryAt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retryAt - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
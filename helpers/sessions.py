@@ -0,0 +1,91 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from helpers.rateLimiter import AdaptiveRateLimiter
+
+
+# Connections kept open per host.  Matches the widest thread pool we run against
+# a single API (neonUtil's membership fan-out), so no worker waits on a connection.
+POOL_SIZE = 10
+
+# (connect, read) seconds - a hung API call shouldn't hang a whole sync cycle
+DEFAULT_TIMEOUT = (10, 60)
+
+# A throttled request was never processed, so it's safe to send again
+THROTTLE_RETRIES = 3
+
+NEON_HOST = "https://api.neoncrm.com"
+OPENPATH_HOST = "https://api.openpath.com"
+
+# Process-wide limiters for hosts with an API rate limit.  Every request to the
+# host through getSession() waits its turn, whichever module sends it.
+# Neon allows 10 requests/second per account.  OpenPath doesn't publish a limit,
+# so stay well clear of the bursts that have drawn 429s from it.
+_limiters = {
+    NEON_HOST: AdaptiveRateLimiter(rate=9, maxRate=10),
+    OPENPATH_HOST: AdaptiveRateLimiter(rate=5, maxRate=8),
+}
+
+
+def _host(url: str):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class PooledSession(requests.Session):
+    """
+    A requests.Session that applies DEFAULT_TIMEOUT unless the caller passes one,
+    and paces requests through the host's rate limiter if it has one.
+    """
+
+    def __init__(self, poolSize=POOL_SIZE):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+
+        limiter = getLimiter(url)
+        if limiter is None:
+            return super().request(method, url, **kwargs)
+
+        for _ in range(THROTTLE_RETRIES):
+            limiter.acquire()
+            response = super().request(method, url, **kwargs)
+            limiter.observe(response)
+            if response.status_code != 429:
+                break
+        return response
+
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+## Get the shared keep-alive session for the host in the given URL
+def getSession(url: str) -> PooledSession:
+    host = _host(url)
+
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = PooledSession()
+    return session
+
+
+## Get the shared rate limiter for the host in the given URL, or None if it isn't limited
+def getLimiter(url: str):
+    return _limiters.get(_host(url))
+
+
+## Close all shared sessions (they'll be recreated on next use)
+def closeSessions():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -3,19 +3,26 @@
 ##################################################################
 import datetime
 import logging
+import time
 
+from collections import deque
+from email.mime.text import MIMEText
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from urllib.parse import quote
-from dataclasses import dataclass
-from typing import Protocol, Literal, Self, Any
+from dataclasses import dataclass, field
+from typing import Callable, Protocol, Literal, Self, Any, TypeVar
 from enum import StrEnum
 from zoneinfo import ZoneInfo
 
-import boto3
-
 from pydantic import BaseModel, Field, model_validator, field_serializer
 from mailjet_rest import Client  # type: ignore
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_result
-from neonUtil import getNeonAccounts
+from neonUtil import getNeonAccounts, iter_neon_accounts
+from AsmblyMessageFactory import commonMessageFooter
+import gmailUtil
+import aws_ssm
 
 
 logging.basicConfig(
@@ -25,6 +32,27 @@ logging.basicConfig(
 )
 
 
+T = TypeVar("T")
+
+# Mailjet's maximum page size for contact queries
+MJ_PAGE_SIZE = 1000
+# pages fetched concurrently when reading a whole list
+MJ_PAGE_WORKERS = 4
+# contacts per managemanycontacts job, to stay well clear of Mailjet's payload limit
+MJ_BULK_CHUNK_SIZE = 1000
+# bulk jobs submitted concurrently
+MJ_BULK_WORKERS = 4
+# consecutive failed status reads before we give up on a bulk job
+MJ_JOB_STATUS_ERRORS = 3
+# how long to wait on bulk jobs before reporting them as still pending
+MJ_JOB_TIMEOUT = datetime.timedelta(minutes=10)
+# most of a list we'll remove in one sync; the rest wait for later syncs, in
+# case a big drop is really a bad Neon fetch
+MJ_MAX_REMOVAL_FRACTION = 0.1
+# job statuses Mailjet won't move on from
+MJ_JOB_DONE_STATUSES = ("Completed", "Error", "Abort")
+
+
 class MJContactProperties(StrEnum):
     FIRSTNAME = "first_name"
     LASTNAME = "last_name"
@@ -186,6 +214,27 @@ class MJCredentials:
     secret_key: str
 
 
+@dataclass
+class BulkJobReport:
+    """
+    The outcome of a set of managemanycontacts jobs.
+    """
+
+    completed_jobs: list[int] = field(default_factory=list)
+    # jobs still processing when we stopped waiting
+    pending_jobs: list[int] = field(default_factory=list)
+    # email -> why that contact wasn't updated
+    failed_contacts: dict[str, str] = field(default_factory=dict)
+    # Mailjet's per-contact error reports for jobs that partly failed
+    error_files: list[str] = field(default_factory=list)
+    # emails held back from removal by the per-sync cap, for a later sync
+    deferred_removals: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.pending_jobs or self.failed_contacts or self.error_files)
+
+
 class MailserviceInterface(Protocol):
     def send_email(self) -> None: ...
 
@@ -214,8 +263,12 @@ class MailserviceInterface(Protocol):
         offset: int = 0,
     ) -> None | tuple[int, list[Subscriber]]: ...
 
+    def iter_contacts_in_list(self, list_id: int) -> Iterator[Subscriber]: ...
+
     def get_all_contacts_in_list(self, list_id: int) -> list[Subscriber] | None: ...
 
+    def get_list_subscribers(self, list_id: int) -> dict[str, Subscriber] | None: ...
+
 
 class MJService:
     new_members_list_id: int | None = None
@@ -358,6 +411,108 @@ class MJService:
 
         return job_id
 
+    def submit_bulk_jobs(
+        self, list_ids: list[int | None], subscribers: list[Subscriber], action: MailjetAction
+    ) -> tuple[dict[int, list[Subscriber]], list[Subscriber]]:
+        """
+        Submit subscribers in MJ_BULK_CHUNK_SIZE chunks, concurrently.
+
+        Returns (job ID -> the chunk it carries, subscribers in chunks that failed to submit).
+        """
+        chunks = [
+            subscribers[start : start + MJ_BULK_CHUNK_SIZE]
+            for start in range(0, len(subscribers), MJ_BULK_CHUNK_SIZE)
+        ]
+
+        with ThreadPoolExecutor(max_workers=MJ_BULK_WORKERS) as executor:
+            job_ids = list(
+                executor.map(
+                    lambda chunk: self.bulk_update_subscribers_in_lists(list_ids, chunk, action),
+                    chunks,
+                )
+            )
+
+        jobs: dict[int, list[Subscriber]] = {}
+        unsubmitted: list[Subscriber] = []
+        for job_id, chunk in zip(job_ids, chunks):
+            if job_id is None:
+                unsubmitted.extend(chunk)
+            else:
+                jobs[job_id] = chunk
+
+        return jobs, unsubmitted
+
+    def get_job(self, job_id: int) -> dict | None:
+        """
+        One look at a managemanycontacts job. Returns its status record, or None if
+        Mailjet hasn't registered it yet. Raises ValueError if the request fails.
+        """
+        response = self.client.contact_managemanycontacts.get(action_id=job_id)
+
+        if response.status_code == 404:
+            return None
+
+        if response.status_code != 200:
+            raise ValueError(
+                f"Mailjet get job {job_id} status returned status code {response.status_code}"
+            )
+
+        return response.json().get("Data")[0]
+
+    def track_bulk_jobs(
+        self,
+        jobs: dict[int, list[Subscriber]],
+        timeout: datetime.timedelta = MJ_JOB_TIMEOUT,
+        sleep: Callable[[float], None] | None = None,
+    ) -> BulkJobReport:
+        """
+        Poll all outstanding jobs together, backing off between rounds, until each
+        finishes or the timeout passes. A job whose status can't be read
+        MJ_JOB_STATUS_ERRORS times running is reported as failed.
+        """
+        sleep = sleep or time.sleep
+        report = BulkJobReport()
+        outstanding = dict(jobs)
+        status_errors = {job_id: 0 for job_id in jobs}
+        delay = 2.0
+        waited = 0.0
+
+        while True:
+            for job_id in list(outstanding):
+                try:
+                    job = self.get_job(job_id)
+                except ValueError as e:
+                    logging.error("%s", e)
+                    status_errors[job_id] += 1
+                    if status_errors[job_id] >= MJ_JOB_STATUS_ERRORS:
+                        chunk = outstanding.pop(job_id)
+                        report.failed_contacts.update({sub.email: str(e) for sub in chunk if sub.email})
+                    continue
+
+                status_errors[job_id] = 0
+                if job is None or job.get("Status") not in MJ_JOB_DONE_STATUSES:
+                    continue
+
+                chunk = outstanding.pop(job_id)
+
+                if job.get("Status") == "Completed":
+                    report.completed_jobs.append(job_id)
+                    if job.get("ErrorFile"):
+                        report.error_files.append(job["ErrorFile"])
+                else:
+                    error = f"job {job_id} {job.get('Status')}: {job.get('Error') or 'no details'}"
+                    report.failed_contacts.update({sub.email: error for sub in chunk if sub.email})
+
+            if not outstanding or waited >= timeout.total_seconds():
+                break
+
+            sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 30.0)
+
+        report.pending_jobs = list(outstanding)
+        return report
+
     @retry(
         stop=stop_after_attempt(5),
         wait=wait_exponential(multiplier=1, min=2, max=10),
@@ -431,32 +586,177 @@ class MJService:
             return None
 
         return (
-            contacts_list.count,
+            contacts_list.total,
             [self.validate_contact_props(contact) for contact in contacts_list.data],
         )
 
-    def get_all_contacts_in_list(self, list_id: int) -> list[Subscriber] | None:
-        offset = 0
-        response = self.get_contacts(list_id=list_id, offset=offset)
+    def _iter_later_pages(
+        self, fetch_page: Callable[[int], T | None], total: int
+    ) -> Iterator[T | None]:
+        """
+        Fetch the pages after the first, MJ_PAGE_WORKERS at a time, yielding them in
+        order. A failed page is yielded as None and ends the stream.
+        """
+        offsets = iter(range(MJ_PAGE_SIZE, total, MJ_PAGE_SIZE))
+
+        with ThreadPoolExecutor(max_workers=MJ_PAGE_WORKERS) as executor:
+            # keep a bounded window of pages in flight, so we never hold the whole list
+            pending = deque(
+                executor.submit(fetch_page, offset)
+                for offset in islice(offsets, MJ_PAGE_WORKERS)
+            )
+
+            while pending:
+                page = pending.popleft().result()
+
+                if page is None:
+                    for future in pending:
+                        future.cancel()
+                    yield None
+                    return
+
+                for offset in islice(offsets, 1):
+                    pending.append(executor.submit(fetch_page, offset))
+
+                yield page
+
+    def iter_contacts_in_list(self, list_id: int) -> Iterator[Subscriber]:
+        """
+        Stream every contact in the list, in list order.
+
+        The first page tells us the total; the remaining pages are fetched
+        concurrently. A failed page ends the stream early.
+        """
+        response = self.get_contacts(list_id=list_id, limit=MJ_PAGE_SIZE)
 
         if response is None:
+            return
+
+        total, subscribers = response
+        yield from subscribers
+
+        for page in self._iter_later_pages(
+            lambda offset: self.get_contacts(list_id=list_id, limit=MJ_PAGE_SIZE, offset=offset),
+            total,
+        ):
+            if page is None:
+                return
+
+            yield from page[1]
+
+    def get_all_contacts_in_list(self, list_id: int) -> list[Subscriber] | None:
+        subscribers = list(self.iter_contacts_in_list(list_id))
+
+        return subscribers or None
+
+    def get_list_contacts_page(
+        self, list_id: int, offset: int = 0
+    ) -> MJContactResponse | None:
+        response = self.client.contact.get(
+            filters={"ContactsList": list_id, "limit": MJ_PAGE_SIZE, "offset": offset}
+        )
+
+        if response.status_code != 200:
+            logging.error(
+                "Mailjet get list contacts request failed with status code %s. Response: %s.",
+                response.status_code,
+                response.json(),
+            )
+
+            return None
+
+        return MJContactResponse.model_validate_json(response.content)
+
+    def get_list_subscribed_at(
+        self, list_id: int, contact_id: int
+    ) -> datetime.datetime | None:
+        """
+        When the contact was (last) added to the list, or None if that can't be read.
+        """
+        response = self.client.listrecipient.get(
+            filters={"ContactsList": list_id, "Contact": contact_id}
+        )
+
+        if response.status_code != 200:
+            logging.error(
+                "Mailjet get list recipient request failed with status code %s. Response: %s.",
+                response.status_code,
+                response.json(),
+            )
+
+            return None
+
+        recipients = response.json().get("Data") or []
+        if not recipients or not recipients[0].get("SubscribedAt"):
             return None
 
-        count = response[0]
-        subscribers = response[1]
+        return datetime.datetime.fromisoformat(recipients[0]["SubscribedAt"])
+
+    def get_list_contacts(self, list_id: int) -> dict[int, MailjetContact] | None:
+        """
+        Map contact ID to contact for every contact in the list.
+
+        Unlike iter_contacts_in_list, a partial read is a failure: a missing
+        page would look like contacts that left the list.
+        """
+        first = self.get_list_contacts_page(list_id)
+
+        if first is None:
+            return None
+
+        contacts = {contact.id_: contact for contact in first.data}
+
+        for page in self._iter_later_pages(
+            lambda offset: self.get_list_contacts_page(list_id, offset), first.total
+        ):
+            if page is None:
+                return None
 
-        offset += 50
+            contacts.update({contact.id_: contact for contact in page.data})
 
-        while offset < count:
-            response = self.get_contacts(list_id=list_id, offset=offset)
+        return contacts
 
-            if response is None:
-                return subscribers
+    def get_list_subscribers(self, list_id: int) -> dict[str, Subscriber] | None:
+        """
+        Get the current contents of a list, keyed by lowercase email.
 
-            subscribers.extend(response[1])
-            offset += 50
+        Contacts without any properties set are included with default values.
+        """
+        contacts = self.get_list_contacts(list_id)
 
-        return subscribers
+        if contacts is None:
+            return None
+
+        if not contacts:
+            return {}
+
+        subscribers = self.get_all_contacts_in_list(list_id)
+
+        if subscribers is None:
+            return None
+
+        properties = {sub.id_: sub for sub in subscribers}
+
+        return {
+            contact.email.lower(): (
+                properties[contact_id].model_copy(
+                    update={"email_": contact.email.lower()}
+                )
+                if contact_id in properties
+                else Subscriber(
+                    email_=contact.email.lower(),
+                    id_=contact_id,
+                    first_name="",
+                    last_name="",
+                    attended_orientation=False,
+                    orientation_date=None,
+                    signed_waiver=False,
+                    active_member=False,
+                    latest_membership_end=None,
+                )
+            )
+            for contact_id, contact in contacts.items()
+        }
 
     def validate_contact_props(
         self,
@@ -528,9 +828,69 @@ class MJService:
         return self.validate_contact_props(contact, email)
 
 
+def _normalize_date(value: datetime.datetime | None) -> datetime.datetime | None:
+    # Mailjet hands dates back in UTC, whatever zone they were uploaded in
+    if value is None:
+        return None
+    return value.astimezone(datetime.timezone.utc)
+
+
+def subscriber_fingerprint(sub: Subscriber) -> tuple:
+    """
+    The contact properties we sync, in a form that compares equal between
+    a Subscriber built from Neon and the same contact read back from Mailjet.
+    """
+    return (
+        sub.first_name,
+        sub.last_name,
+        sub.attended_orientation,
+        _normalize_date(sub.orientation_date),
+        sub.signed_waiver,
+        sub.active_member,
+        _normalize_date(sub.latest_membership_end),
+    )
+
+
+def diff_subscribers(
+    desired: list[Subscriber], current: dict[str, Subscriber]
+) -> tuple[list[Subscriber], list[Subscriber]]:
+    """
+    Compare the subscribers we want in a list against its current contents.
+
+    Returns (contacts to add or update, contacts to remove). Subscribers are
+    matched by lowercase email; later duplicates in desired win.
+    """
+    desired_by_email = {sub.email: sub for sub in desired if sub.email}
+
+    upserts = [
+        sub
+        for email, sub in desired_by_email.items()
+        if email not in current
+        or subscriber_fingerprint(sub) != subscriber_fingerprint(current[email])
+    ]
+
+    removals = [sub for email, sub in current.items() if email not in desired_by_email]
+
+    return upserts, removals
+
+
 def update_mj_all_contacts_list(
-    mailjet: MJService, neon_account_dict: dict
-) -> int | None:
+    mailjet: MJService,
+    neon_account_dict: dict,
+    sleep: Callable[[float], None] | None = None,
+    neon_pulled_at: datetime.datetime | None = None,
+    current: dict[str, Subscriber] | None = None,
+) -> BulkJobReport | None:
+    """
+    Sync the all contacts list to the given Neon accounts, sending only the differences.
+
+    neon_pulled_at is when the Neon read behind neon_account_dict started. Contacts
+    added to the list after it (by the Lambda, say) aren't removed. current may be
+    a prefetched get_list_subscribers() result for the list.
+
+    Waits for the bulk jobs and returns their combined report, or None if the list
+    couldn't be found.
+    """
     all_contacts_mj_list_id = mailjet.all_contacts_list_id
 
     if all_contacts_mj_list_id is None:
@@ -568,66 +928,219 @@ def update_mj_all_contacts_list(
 
         accounts.append(account)
 
-    job_id = mailjet.bulk_update_subscribers_in_lists(
-        list_ids=[all_contacts_mj_list_id],
-        subscribers=accounts,
-        action=MailjetAction.ADD_NOFORCE,
+    if current is None:
+        current = mailjet.get_list_subscribers(all_contacts_mj_list_id)
+
+    deferred: list[str] = []
+    if current is None:
+        logging.warning("Couldn't read the %s list; uploading every contact.", MJContactListNames.ALL_CONTACTS)
+        upserts, removals = accounts, []
+    else:
+        upserts, removals = diff_subscribers(accounts, current)
+
+        # a big drop is more likely a failed or partial Neon fetch than people
+        # leaving, so only part of it goes each sync and the rest is reported
+        cap = int(MJ_MAX_REMOVAL_FRACTION * len(current))
+        if len(removals) > cap:
+            removals.sort(key=lambda sub: sub.email or "")
+            deferred = [sub.email for sub in removals[cap:]]
+            removals = removals[:cap]
+            logging.error(
+                "Deferring %s of %s removals from the %s list (cap %s per sync)",
+                len(deferred),
+                len(deferred) + len(removals),
+                MJContactListNames.ALL_CONTACTS,
+                cap,
+            )
+
+        if neon_pulled_at is not None and removals:
+            removals = subscribed_before(
+                mailjet, all_contacts_mj_list_id, removals, neon_pulled_at
+            )
+
+    logging.info(
+        "Mailjet %s list: %s contacts to add or update, %s to remove",
+        MJContactListNames.ALL_CONTACTS,
+        len(upserts),
+        len(removals),
+    )
+
+    jobs: dict[int, list[Subscriber]] = {}
+    unsubmitted: list[Subscriber] = []
+    for subscribers, action in (
+        (upserts, MailjetAction.ADD_NOFORCE),
+        (removals, MailjetAction.REMOVE),
+    ):
+        if not subscribers:
+            continue
+
+        submitted, failed = mailjet.submit_bulk_jobs(
+            list_ids=[all_contacts_mj_list_id],
+            subscribers=subscribers,
+            action=action,
+        )
+        jobs |= submitted
+        unsubmitted.extend(failed)
+
+    report = mailjet.track_bulk_jobs(jobs, sleep=sleep)
+    report.failed_contacts.update(
+        {sub.email: "bulk job submission failed" for sub in unsubmitted if sub.email}
     )
+    report.deferred_removals = deferred
 
-    return job_id
+    return report
 
 
-def run_mailjet_maintenance() -> None:
+def subscribed_before(
+    mailjet: MJService,
+    list_id: int,
+    subscribers: list[Subscriber],
+    cutoff: datetime.datetime,
+) -> list[Subscriber]:
     """
-    Main entry point for running maintenance tasks on Mailjet.
+    The subscribers that joined the list before cutoff. Anyone added since (by the
+    Lambda, say) or whose subscription time can't be read is kept on the list.
+    """
+    with ThreadPoolExecutor(max_workers=MJ_PAGE_WORKERS) as executor:
+        subscribed_at = list(
+            executor.map(
+                lambda sub: mailjet.get_list_subscribed_at(list_id, sub.id_),
+                subscribers,
+            )
+        )
+
+    return [
+        sub
+        for sub, joined in zip(subscribers, subscribed_at)
+        if joined is not None and joined <= cutoff
+    ]
+
+
+# Individual accounts with an email address that haven't opted out of all email
+OPTED_IN_SEARCH_FIELDS = [
+    {"field": "Account Type", "operator": "EQUAL", "value": "Individual"},
+    {"field": "Email 1", "operator": "NOT_BLANK"},
+    {
+        "field": "Email Opt-Out",
+        "operator": "EQUAL",
+        "value": "At least one email opted in",
+    },
+]
+
+# Neon reports accounts without any membership with this expiration date
+NO_MEMBERSHIP_DATE = "1970-01-01"
+
+
+@dataclass
+class MJNeonLookups:
+    """
+    The Neon data the Mailjet all contacts list needs beyond neonUtil.getRealAccounts().
+    """
+
+    # opted-in accounts with orientation or a waiver but no membership
+    non_member_accts: dict[str, dict]
+    # IDs of member accounts that opted out of email
+    opted_out_member_ids: set[str]
+
+
+def get_mailjet_neon_lookups() -> MJNeonLookups:
+    """
+    Search Neon for the accounts getRealAccounts() can't tell us about.
+
+    These searches don't depend on the account dict, so they can run alongside it.
     """
 
-    ssm_mj_creds = boto3.client("ssm").get_parameters(
-        Names=[
-            "/mailjet/api_key",
-            "/mailjet/api_secret",
+    no_membership = {"field": "Membership Expiration Date", "operator": "BLANK"}
+
+    non_member_accts = getNeonAccounts(
+        searchFields=[
+            *OPTED_IN_SEARCH_FIELDS,
+            no_membership,
+            {"field": "FacilityTourDate", "operator": "NOT_BLANK"},
+        ]
+    )
+    non_member_accts = getNeonAccounts(
+        searchFields=[
+            *OPTED_IN_SEARCH_FIELDS,
+            no_membership,
+            {"field": "WaiverDate", "operator": "NOT_BLANK"},
         ],
-        WithDecryption=True,
+        neonAccountDict=non_member_accts,
     )
 
-    mj_creds = MJCredentials(
-        public_key=ssm_mj_creds["Parameters"][0]["Value"],
-        secret_key=ssm_mj_creds["Parameters"][1]["Value"],
+    # only the IDs are needed, so stream the accounts rather than collecting them
+    opted_out_member_ids = {
+        account["Account ID"]
+        for account in iter_neon_accounts(
+            searchFields=[
+                {"field": "Membership Expiration Date", "operator": "NOT_BLANK"},
+                {
+                    "field": "Email Opt-Out",
+                    "operator": "NOT_EQUAL",
+                    "value": "At least one email opted in",
+                },
+            ]
+        )
+    }
+
+    return MJNeonLookups(
+        non_member_accts=non_member_accts,
+        opted_out_member_ids=opted_out_member_ids,
     )
 
-    mailjet = MJService(mj_creds)
+
+def get_mailjet_neon_accounts(
+    neon_accounts: dict[str, dict] | None = None,
+    lookups: MJNeonLookups | None = None,
+) -> dict[str, dict]:
+    """
+    Collect the opted-in Neon accounts that belong in the Mailjet all contacts list.
+
+    With neon_accounts from neonUtil.getRealAccounts(), members are taken from it and
+    only the accounts it can't see are searched for. Otherwise, search for everyone.
+    """
+
+    if neon_accounts is None:
+        return search_mailjet_neon_accounts()
+
+    if lookups is None:
+        lookups = get_mailjet_neon_lookups()
+
+    member_accts: dict[str, dict] = {}
+    for account_id, account in neon_accounts.items():
+        if (
+            account.get("Membership Expiration Date", NO_MEMBERSHIP_DATE)
+            == NO_MEMBERSHIP_DATE
+            or account_id in lookups.opted_out_member_ids
+            # snapshots saved before "Account Type" was fetched don't have it
+            or account.get("Account Type", "Individual") != "Individual"
+            or not account.get("Email 1")
+        ):
+            continue
+
+        member_accts[account_id] = account
+
+    return lookups.non_member_accts | member_accts
+
+
+def search_mailjet_neon_accounts() -> dict[str, dict]:
+    """
+    Search Neon for all the opted-in accounts that belong in the Mailjet all contacts list.
+    """
 
     orientation_search_fields = [
-        {"field": "Account Type", "operator": "EQUAL", "value": "Individual"},
-        {"field": "Email 1", "operator": "NOT_BLANK"},
-        {
-            "field": "Email Opt-Out",
-            "operator": "EQUAL",
-            "value": "At least one email opted in",
-        },
+        *OPTED_IN_SEARCH_FIELDS,
         {"field": "FacilityTourDate", "operator": "NOT_BLANK"},
     ]
 
     waiver_search_fields = [
-        {"field": "Account Type", "operator": "EQUAL", "value": "Individual"},
-        {"field": "Email 1", "operator": "NOT_BLANK"},
-        {
-            "field": "Email Opt-Out",
-            "operator": "EQUAL",
-            "value": "At least one email opted in",
-        },
+        *OPTED_IN_SEARCH_FIELDS,
         {"field": "WaiverDate", "operator": "NOT_BLANK"},
     ]
 
     # This will only retrieve accounts who have had at least one membership at some point
     member_search_fields = [
-        {"field": "Account Type", "operator": "EQUAL", "value": "Individual"},
-        {"field": "Email 1", "operator": "NOT_BLANK"},
-        {
-            "field": "Email Opt-Out",
-            "operator": "EQUAL",
-            "value": "At least one email opted in",
-        },
+        *OPTED_IN_SEARCH_FIELDS,
         {
             "field": "Most Recent Membership Only",
             "operator": "EQUAL",
@@ -635,16 +1148,6 @@ def run_mailjet_maintenance() -> None:
         },
     ]
 
-    # all_acct_search_fields = [
-    #     {"field": "Account Type", "operator": "EQUAL", "value": "Individual"},
-    #     {"field": "Email 1", "operator": "NOT_BLANK"},
-    #     {
-    #         "field": "Email Opt-Out",
-    #         "operator": "EQUAL",
-    #         "value": "At least one email opted in",
-    #     },
-    # ]
-
     orientation_accts: dict[str, dict] = {}
     waiver_accts: dict[str, dict] = {}
     member_accts: dict[str, dict] = {}
@@ -659,17 +1162,100 @@ def run_mailjet_maintenance() -> None:
         searchFields=member_search_fields, neonAccountDict=member_accts
     )
 
-    all_accts = orientation_accts | waiver_accts | member_accts
+    return orientation_accts | waiver_accts | member_accts
+
+
+def get_mailjet_credentials() -> MJCredentials:
+    """Mailjet API keys from SSM, looked up by parameter name through aws_ssm."""
+    return MJCredentials(
+        public_key=aws_ssm.MJ_APIkey,
+        secret_key=aws_ssm.MJ_APIsecret,
+    )
+
+
+def get_mailjet_service() -> MJService:
+    return MJService(get_mailjet_credentials())
+
+
+def get_all_contacts_list_state() -> tuple[MJService, dict[str, Subscriber] | None]:
+    """
+    Connect to Mailjet and read the current all contacts list.
+
+    Doesn't depend on Neon, so it can run alongside the Neon sync.
+    """
+    mailjet = get_mailjet_service()
+
+    if mailjet.all_contacts_list_id is None:
+        return mailjet, None
+
+    return mailjet, mailjet.get_list_subscribers(mailjet.all_contacts_list_id)
+
+
+def get_deferred_removals_message(deferred: list[str]) -> MIMEText:
+    list_separator = "\n        "
+    msg = MIMEText(f"""
+    {len(deferred)} contacts that are no longer in Neon were NOT removed from the Mailjet
+    {MJContactListNames.ALL_CONTACTS} list, because that's more than {MJ_MAX_REMOVAL_FRACTION:.0%} of the
+    list in one sync. They'll be removed a batch at a time in the next syncs.
+
+    If this many people really haven't left, the Neon data is probably bad; check the
+    sync logs before the next run. Held back this time:
+        {list_separator.join(deferred)}
 
-    # all_accts = getNeonAccounts(searchFields=all_acct_search_fields)
+{commonMessageFooter}
+""")
+    msg["To"] = "membership@asmbly.org"
+    msg["Subject"] = "Mailjet contact removals held back"
+    return msg
 
-    job_id = update_mj_all_contacts_list(mailjet, all_accts)
 
-    if job_id is None:
+def run_mailjet_maintenance(
+    neon_accounts: dict[str, dict] | None = None,
+    lookups: MJNeonLookups | None = None,
+    neon_pulled_at: datetime.datetime | None = None,
+    list_state: tuple[MJService, dict[str, Subscriber] | None] | None = None,
+    mail_alerts: bool = False,
+) -> None:
+    """
+    Main entry point for running maintenance tasks on Mailjet.
+
+    Pass neon_accounts from neonUtil.getRealAccounts() to avoid searching Neon for
+    members again, and neon_pulled_at for when that read started. lookups and
+    list_state may be prefetched with get_mailjet_neon_lookups() and
+    get_all_contacts_list_state(). With mail_alerts, removals held back by the
+    per-sync cap are emailed to membership.
+    """
+    if neon_accounts is None:
+        neon_pulled_at = datetime.datetime.now(datetime.timezone.utc)
+
+    if list_state is None:
+        mailjet, current_contacts = get_mailjet_service(), None
+    else:
+        mailjet, current_contacts = list_state
+
+    all_accts = get_mailjet_neon_accounts(neon_accounts, lookups)
+
+    report = update_mj_all_contacts_list(
+        mailjet,
+        all_accts,
+        neon_pulled_at=neon_pulled_at,
+        current=current_contacts,
+    )
+
+    if report is None:
         logging.error("Failed to update all contacts list")
     else:
-        logging.info("Updated all contacts list with job id %s", job_id)
-        logging.info("Job status: %s", mailjet.get_job_status(job_id))
+        logging.info(
+            "Updated all contacts list with jobs %s", report.completed_jobs
+        )
+        if report.pending_jobs:
+            logging.warning("Jobs still processing: %s", report.pending_jobs)
+        for email, error in report.failed_contacts.items():
+            logging.error("Failed to update %s: %s", email, error)
+        for error_file in report.error_files:
+            logging.error("Mailjet reported contact errors: %s", error_file)
+        if report.deferred_removals and mail_alerts:
+            gmailUtil.sendMIMEmessage(get_deferred_removals_message(report.deferred_removals))
 
     logging.info("Finished running Mailjet maintenance tasks.")
 
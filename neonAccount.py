@@ -0,0 +1,31 @@
+################ Asmbly Neon Account Record ################
+#  The account records neonUtil builds.  Still a plain dict #
+#  to every caller, but remembers its individual type names #
+#  so repeated type checks reuse one set of names           #
+############################################################
+
+import sys
+
+
+class NeonAccount(dict):
+    __slots__ = ("_typeCache",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._typeCache = None
+
+    ####################################################################
+    # Names of this account's individual types.  The cache is keyed on
+    # the names themselves, so any change to "individualTypes" -- replaced,
+    # appended to, or edited in place -- gives a fresh set
+    ####################################################################
+    def typeNames(self) -> frozenset:
+        key = tuple(type.get("name") for type in self.get("individualTypes") or ())
+        cache = self._typeCache
+        if cache is None or cache[0] != key:
+            names = frozenset(
+                sys.intern(name) if isinstance(name, str) else name
+                for name in key
+            )
+            cache = self._typeCache = (key, names)
+        return cache[1]
@@ -0,0 +1,162 @@
+############### Asmbly Neon Account Snapshot Store ###############
+#  Persists the account dict built by neonUtil.getRealAccounts()  #
+#  so other scripts can reuse it without re-querying Neon         #
+###################################################################
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+
+from neonAccount import NeonAccount
+
+
+# The snapshot lives next to the scripts on AdminBot.  Lambda only has /tmp to write to.
+def _defaultPath():
+    if os.environ.get("NEON_SNAPSHOT_PATH"):
+        return os.environ["NEON_SNAPSHOT_PATH"]
+    if os.environ.get("LAMBDA_TASK_ROOT"):
+        return "/tmp/neonAccounts.db"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "neonAccounts.db")
+
+
+def _connect(path=None):
+    connection = sqlite3.connect(path or _defaultPath())
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS accounts (account_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS memberships (account_id TEXT PRIMARY KEY, signal TEXT NOT NULL,"
+        " fetched_at TEXT NOT NULL, data TEXT NOT NULL)"
+    )
+    return connection
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+####################################################################
+# Replace the stored snapshot with the given account dict
+# The swap happens in one transaction, so a failed write leaves the
+# previous snapshot intact.
+####################################################################
+def saveSnapshot(neonAccountDict: dict, path=None, meta: dict = None):
+    connection = _connect(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM accounts")
+            connection.executemany(
+                "INSERT INTO accounts (account_id, data) VALUES (?, ?)",
+                (
+                    (str(accountId), json.dumps(account))
+                    for accountId, account in neonAccountDict.items()
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("savedAt", _now().isoformat()), *(meta or {}).items()],
+            )
+    finally:
+        connection.close()
+
+    logging.info("Saved snapshot of %s Neon accounts", len(neonAccountDict))
+
+
+####################################################################
+# Look up a value saved alongside the snapshot.  None if it isn't set
+####################################################################
+def getMeta(key: str, path=None):
+    connection = _connect(path)
+    try:
+        row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    finally:
+        connection.close()
+
+    return row[0] if row else None
+
+
+####################################################################
+# When was the stored snapshot taken?  None if there isn't one
+####################################################################
+def snapshotTime(path=None):
+    savedAt = getMeta("savedAt", path)
+    if savedAt is None:
+        return None
+    return datetime.datetime.fromisoformat(savedAt)
+
+
+####################################################################
+# Load the stored snapshot, keyed by Account ID
+# Returns None if there is no snapshot or it is older than maxAge
+####################################################################
+def loadSnapshot(maxAge: datetime.timedelta = None, path=None):
+    savedAt = snapshotTime(path)
+    if savedAt is None:
+        logging.info("No Neon account snapshot found")
+        return None
+
+    if maxAge is not None and _now() - savedAt > maxAge:
+        logging.info("Neon account snapshot from %s is too old to use", savedAt)
+        return None
+
+    connection = _connect(path)
+    try:
+        rows = connection.execute("SELECT account_id, data FROM accounts").fetchall()
+    finally:
+        connection.close()
+
+    logging.info("Loaded snapshot of %s Neon accounts from %s", len(rows), savedAt)
+    return {accountId: NeonAccount(json.loads(data)) for accountId, data in rows}
+
+
+####################################################################
+# Raw membership lists cached per account, so unchanged histories
+# don't have to be re-fetched from Neon on every sync.  Each entry is
+# stored with a change signal; it is only returned while the caller's
+# current signal still matches and the entry is younger than maxAge.
+####################################################################
+def loadMemberships(signals: dict, maxAge: datetime.timedelta, path=None):
+    if not signals:
+        return {}
+
+    oldest = (_now() - maxAge).isoformat()
+    connection = _connect(path)
+    try:
+        rows = connection.execute(
+            "SELECT account_id, signal, data FROM memberships WHERE fetched_at >= ?", (oldest,)
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return {
+        accountId: json.loads(data)
+        for accountId, signal, data in rows
+        if signals.get(accountId) == signal
+    }
+
+
+####################################################################
+# Store freshly fetched membership lists: {accountId: (signal, memberships)}
+####################################################################
+def saveMemberships(entries: dict, path=None):
+    if not entries:
+        return
+
+    fetchedAt = _now().isoformat()
+    connection = _connect(path)
+    try:
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO memberships (account_id, signal, fetched_at, data) VALUES (?, ?, ?, ?)",
+                (
+                    (str(accountId), signal, fetchedAt, json.dumps(memberships))
+                    for accountId, (signal, memberships) in entries.items()
+                ),
+            )
+    finally:
+        connection.close()
@@ -3,16 +3,19 @@
 ##################################################################
 
 from pprint import pformat, pprint
+import json
 import logging
 import base64
 import datetime, pytz
-import requests
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-import threading
-import time
 import os
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 
+import neonSnapshot
+from neonAccount import NeonAccount
+from helpers.sessions import getSession, getLimiter, POOL_SIZE
+
 if os.environ.get("USER") == "ec2-user" or os.environ.get("LAMBDA_TASK_ROOT"):
     from aws_ssm import N_APIkey, N_APIuser
 else:
@@ -54,6 +57,26 @@ MEMBERSHIP_ID_CERAMICS = 7
 
 ACCOUNT_FIELD_OPENPATH_ID = 178
 
+# Special account types getRealAccounts pulls in even without membership records
+REAL_ACCOUNT_TYPES = (STAFF_TYPE, INSTRUCTOR_TYPE, ONDUTY_TYPE, ONDUTY_TYPE_CERAMICS, LEAD_TYPE)
+
+# Flags appendMemberships sets (but never clears) on an account
+MEMBERSHIP_FLAGS = (
+    "validMembership",
+    "ceramicsMembership",
+    "compedCeramics",
+    "paidCeramics",
+    "compedRegular",
+    "paidRegular",
+)
+
+# Incremental syncs fall back to a full sync once the last full one is this old
+FULL_SYNC_INTERVAL = datetime.timedelta(days=1)
+
+# Cached membership histories are re-fetched at least this often, even for
+# accounts Neon says weren't modified
+MEMBERSHIP_CACHE_MAX_AGE = datetime.timedelta(days=1)
+
 ####################################################################
 # Update the OpenPathID stored in Neon for an account
 ####################################################################
@@ -80,7 +103,7 @@ def updateOpenPathID(account: dict):
         logging.warning("DryRun in neonUtil.updateOpenPathID()")
         return
 
-    response = requests.patch(url, json=data, headers=N_headers)
+    response = getSession(url).patch(url, json=data, headers=N_headers)
     if response.status_code != 200:
         raise ValueError(f"Patch {url} returned status code {response.status_code}")
 
@@ -105,28 +128,11 @@ def updateDID(account: dict):
         logging.warning("DryRun in neonUtil.updateDID()")
         return
 
-    response = requests.patch(url, json=data, headers=N_headers)
+    response = getSession(url).patch(url, json=data, headers=N_headers)
     if response.status_code != 200:
         raise ValueError(f"Patch {url} returned status code {response.status_code}")
 
 
-class RateLimiter:
-    """Allows up to `per_second` calls per second across all threads."""
-    def __init__(self, per_second):
-        self.interval = 1.0 / per_second
-        self.lock = threading.Lock()
-        self.next_time = time.monotonic()
-
-    def acquire(self):
-        with self.lock:
-            now = time.monotonic()
-            wait = self.next_time - now
-            self.next_time = max(now, self.next_time) + self.interval
-        if wait > 0:
-            time.sleep(wait)
-
-
-
 ####################################################################
 # Update a valid Neon account to include membership information
 ####################################################################
@@ -134,19 +140,31 @@ def appendMemberships(account: dict, detailed=False):
     # this should be a pretty thorough check for sane argument
     assert int(account.get("Account ID")) > 0
 
-    # Neon counts a failed renewal as a valid subscription so long as automatic renewal is enabled.
-    # WE only think a subscription is valid if the payment transaction was successful, so check payment status.
-    url = N_baseURL + f'/accounts/{account.get("Account ID")}/memberships'
-    response = requests.get(url, headers=N_headers)
+    return applyMemberships(account, getMembershipsById(account.get("Account ID")), detailed=detailed)
+
+
+####################################################################
+# Given a Neon account ID, return its raw membership list
+####################################################################
+def getMembershipsById(id: int):
+    url = N_baseURL + f'/accounts/{id}/memberships'
+    response = getSession(url).get(url, headers=N_headers)
 
     if response.status_code != 200:
         raise ValueError(f"Get {url} returned status code {response.status_code}: {response.text}")
 
     # logging.debug(pformat(response.json()))
 
-    account["validMembership"] = False
+    return response.json().get("memberships")
+
 
-    memberships = response.json().get("memberships")
+####################################################################
+# Update a Neon account with membership info from an already-fetched membership list
+####################################################################
+def applyMemberships(account: dict, memberships: list, detailed=False):
+    # Neon counts a failed renewal as a valid subscription so long as automatic renewal is enabled.
+    # WE only think a subscription is valid if the payment transaction was successful, so check payment status.
+    account["validMembership"] = False
 
     if len(memberships) > 0:
         account["membershipDates"] = {}
@@ -261,17 +279,160 @@ def appendMemberships(account: dict, detailed=False):
     return account
 
 
+####################################################################
+# Columnar applyMemberships for many accounts at once.  Every account's
+# memberships are loaded into flat parallel columns, with each distinct date
+# string parsed once into a day ordinal, then all accounts are evaluated in a
+# single pass over the rows.  The rules (and results) are exactly those of
+# applyMemberships, which stays the reference for single-account fetches.
+####################################################################
+class MembershipColumns:
+    __slots__ = ("offsets", "starts", "ends", "rawStarts", "rawEnds", "rawLevels",
+                 "levels", "statuses", "fees", "autoRenewals", "_ordinals")
+
+    def __init__(self, membershipLists: list):
+        # rows for the i-th membership list are offsets[i]:offsets[i + 1]
+        self.offsets = [0]
+        self.starts, self.ends = [], []
+        self.rawStarts, self.rawEnds, self.rawLevels, self.levels = [], [], [], []
+        self.statuses, self.fees, self.autoRenewals = [], [], []
+        self._ordinals = {}
+
+        for memberships in membershipLists:
+            for membership in memberships:
+                self.rawStarts.append(membership["termStartDate"])
+                self.rawEnds.append(membership["termEndDate"])
+                self.starts.append(self._ordinal(membership["termStartDate"]))
+                self.ends.append(self._ordinal(membership["termEndDate"]))
+                levelId = membership["membershipLevel"].get("id")
+                self.rawLevels.append(levelId)
+                self.statuses.append(membership["status"])
+                # applyMemberships only casts the level of successful memberships
+                self.levels.append(int(levelId) if membership["status"] == "SUCCEEDED" else None)
+                self.fees.append(membership.get("fee"))
+                self.autoRenewals.append(membership["autoRenewal"])
+            self.offsets.append(len(self.starts))
+
+    def _ordinal(self, date: str):
+        ordinal = self._ordinals.get(date)
+        if ordinal is None:
+            ordinal = datetime.datetime.strptime(date, "%Y-%m-%d").date().toordinal()
+            self._ordinals[date] = ordinal
+        return ordinal
+
+
+def applyMembershipsBatch(accountMemberships: list, detailed=False):
+    """Apply each (account, memberships) pair like applyMemberships; returns the accounts."""
+    columns = MembershipColumns([memberships for _, memberships in accountMemberships])
+    todayOrdinal = today.toordinal()
+    yesterdayOrdinal = yesterday.toordinal()
+    epochOrdinal = datetime.date(1970, 1, 1).toordinal()
+
+    starts, ends, statuses = columns.starts, columns.ends, columns.statuses
+    rawStarts, rawEnds, rawLevels, levels = columns.rawStarts, columns.rawEnds, columns.rawLevels, columns.levels
+    fees, autoRenewals, offsets = columns.fees, columns.autoRenewals, columns.offsets
+
+    for i, (account, memberships) in enumerate(accountMemberships):
+        account["validMembership"] = False
+        first, last = offsets[i], offsets[i + 1]
+        if first == last:
+            continue
+
+        membershipDates = account["membershipDates"] = {}
+        lastExpiration = lastCeramicsExpiration = epochOrdinal
+        lastTier = MEMBERSHIP_ID_REGULAR
+        firstStart = firstCeramicsStart = todayOrdinal
+        atLeastOneActive = False
+        currentStatus = "No Record"
+
+        for row in range(first, last):
+            start, end, status = starts[row], ends[row], statuses[row]
+            current = start <= todayOrdinal <= end
+            if current:
+                currentStatus = status
+            if status != "SUCCEEDED":
+                continue
+
+            membershipDates[rawStarts[row]] = [rawEnds[row], rawLevels[row]]
+            atLeastOneActive = True
+            ceramics = levels[row] == MEMBERSHIP_ID_CERAMICS
+
+            if end > lastExpiration:
+                lastExpiration = end
+                if rawLevels[row]:
+                    lastTier = levels[row]
+                account["autoRenewal"] = autoRenewals[row]
+            if ceramics and end > lastCeramicsExpiration:
+                lastCeramicsExpiration = end
+            if start < firstStart:
+                firstStart = start
+                if ceramics:
+                    firstCeramicsStart = start
+
+            if current:
+                account["validMembership"] = True
+                if ceramics:
+                    account["ceramicsMembership"] = True
+                    account["compedCeramics" if fees[row] == 0 else "paidCeramics"] = True
+                else:
+                    account["compedRegular" if fees[row] == 0 else "paidRegular"] = True
+
+        if atLeastOneActive:
+            account["Membership Start Date"] = str(datetime.date.fromordinal(firstStart))
+            account["Ceramics Start Date"] = str(datetime.date.fromordinal(firstCeramicsStart))
+            account["Ceramics Expiration Date"] = str(datetime.date.fromordinal(lastCeramicsExpiration))
+            account["Membership Expiration Date"] = str(datetime.date.fromordinal(lastExpiration))
+
+        if not account["validMembership"] and lastExpiration == yesterdayOrdinal:
+            if account["autoRenewal"] == True and currentStatus in ("No Record", "PENDING"):
+                account["validMembership"] = True
+                account["ceramicsMembership"] = (lastTier == MEMBERSHIP_ID_CERAMICS)
+                logging.info(
+                    "Neon %s expired yesterday. Keeping active pending auto-renewal processing",
+                    account.get("Account ID"),
+                )
+            else:
+                logging.info(
+                    "Neon %s expired yesterday. autoRenewal = %s, current membership status = %s",
+                    account.get("Account ID"),
+                    account["autoRenewal"],
+                    currentStatus,
+                )
+
+        if detailed:
+            account["MembershipDetails"] = memberships
+
+    return [account for account, _ in accountMemberships]
+
+
 ####################################################################
 # Given a Neon member ID, return an account including membership info
 ####################################################################
 def getMemberById(id: int, detailed=False):
+    account = getAccountById(id)
+
+    # This only contains basic account info.  We have to fetch the membership data separately
+    account = appendMemberships(account, detailed=detailed)
+    return account
+
+
+####################################################################
+# Given a Neon member ID, return the basic account without membership info
+####################################################################
+def getAccountById(id: int):
     url = N_baseURL + f"/accounts/{id}"
-    response = requests.get(url, headers=N_headers)
+    response = getSession(url).get(url, headers=N_headers)
 
     if response.status_code != 200:
         raise ValueError(f"Get {url} returned status code {response.status_code}")
 
-    account = response.json().get("individualAccount")
+    return flattenAccount(response.json().get("individualAccount"))
+
+
+####################################################################
+# Reshape an individualAccount from a Neon fetch to match search results
+####################################################################
+def flattenAccount(account: dict):
     logging.debug(pformat(account))
 
     if account.get("accountCustomFields"):
@@ -301,10 +462,7 @@ def getMemberById(id: int, detailed=False):
     account["First Name"] = account.get("primaryContact").get("firstName")
     account["Last Name"] = account.get("primaryContact").get("lastName")
     account["Account ID"] = account.get("accountId")
-
-    # This only contains basic account info.  We have to fetch the membership data separately
-    account = appendMemberships(account, detailed=detailed)
-    return account
+    return NeonAccount(account)
 
 
 ####################################################################
@@ -312,6 +470,7 @@ def getMemberById(id: int, detailed=False):
 # Our scripts expect the fetch format, so do translation here
 ####################################################################
 def fixTypes(account: dict):
+    account = NeonAccount(account)
     if account.get("Individual Type"):
         typeDictList = []
         typelist = account.get("Individual Type").split("|")
@@ -331,153 +490,343 @@ def fixTypes(account: dict):
 )
 def _neon_search(data):
     url = N_baseURL + "/accounts/search"
-    response = requests.post(url, json=data, headers=N_headers)
+    response = getSession(url).post(url, json=data, headers=N_headers)
     if response.status_code != 200:
         raise ValueError(f"Post {url} returned status code {response.status_code}: {response.text}")
     return response
 
 
+# Output Fields
+# 85 is DiscourseId
+# 77 is OrientationDate
+# 179 is WaiverDate
+# 88 is KeyCardID
+# 178 is OpenPathID
+# 180 is AccessSuspended
+# 274 is ShaperOrigin Date
+# 440 is Domino date
+# 1248 is CSI Date
+ACCOUNT_SEARCH_OUTPUT_FIELDS = [
+    "First Name",
+    "Last Name",
+    "Preferred Name",
+    "Account ID",
+    "Account Type",
+    "Email 1",
+    "Email 2",
+    "Email 3",
+    "Membership Expiration Date",
+    "Membership Start Date",
+    "Individual Type",
+    "Account Current Membership Status",
+    85,
+    77,
+    179,
+    ACCOUNT_FIELD_OPENPATH_ID,
+    88,
+    180,
+    182,
+    274,
+    440,
+    1248
+]
+ACCOUNT_SEARCH_PAGE_SIZE = 200
+
+
 ####################################################################
-# Get Neon accounts matching given criteria
+# Build the /accounts/search request body for one page of results
 ####################################################################
-def getNeonAccounts(searchFields, neonAccountDict={}):
-    # Output Fields
-    # 85 is DiscourseId
-    # 77 is OrientationDate
-    # 179 is WaiverDate
-    # 88 is KeyCardID
-    # 178 is OpenPathID
-    # 180 is AccessSuspended
-    # 274 is ShaperOrigin Date
-    # 440 is Domino date
-    # 1248 is CSI Date
-
-    # Neon does pagination as a data parameter, so need to update data for each page
-    page = 0
-    while True:
-        data = {
-            "searchFields": searchFields,
-            "outputFields": [
-                "First Name",
-                "Last Name",
-                "Preferred Name",
-                "Account ID",
-                "Email 1",
-                "Email 2",
-                "Email 3",
-                "Membership Expiration Date",
-                "Membership Start Date",
-                "Individual Type",
-                "Account Current Membership Status",
-                85,
-                77,
-                179,
-                ACCOUNT_FIELD_OPENPATH_ID,
-                88,
-                180,
-                182,
-                274,
-                440,
-                1248
-            ],
-            "pagination": {"currentPage": page, "pageSize": 200},
-        }
+def accountSearchData(searchFields, page: int):
+    return {
+        "searchFields": searchFields,
+        "outputFields": ACCOUNT_SEARCH_OUTPUT_FIELDS,
+        "pagination": {"currentPage": page, "pageSize": ACCOUNT_SEARCH_PAGE_SIZE},
+    }
+
+
+####################################################################
+# Merge one page of /accounts/search results into neonAccountDict
+####################################################################
+def mergeSearchResults(searchResults: list, neonAccountDict: dict):
+    # re-shuffle the data into a format that's a little easier to work with
+    for acct in searchResults:
+        # don't clobber an existing local account record that may have been updated since the last Neon query
+        if neonAccountDict.get(acct["Account ID"]) is None:
+            neonAccountDict[acct["Account ID"]] = fixTypes(acct)
+    return neonAccountDict
+
+
+# Search pages in flight at once; the shared Neon session does the pacing
+SEARCH_WORKERS = POOL_SIZE
+# Pages iter_neon_accounts fetches ahead of its consumer
+SEARCH_PREFETCH = 4
 
-        response = _neon_search(data)
 
-        logging.info("Fetching Accounts: %s", response.json().get("pagination"))
-        # re-shuffle the data into a format that's a little easier to work with
-        for acct in response.json()["searchResults"]:
-            # don't clobber an existing local account record that may have been updated since the last Neon query
-            if neonAccountDict.get(acct["Account ID"]) is None:
-                neonAccountDict[acct["Account ID"]] = fixTypes(acct)
-        # intentionally incrementing page before checking totalPages
+def _searchPage(searchFields, page: int):
+    response = _neon_search(accountSearchData(searchFields, page))
+    logging.info("Fetching Accounts: %s", response.json().get("pagination"))
+    return response.json()
+
+
+####################################################################
+# Run several account searches at once.  Each search's first page tells us
+# totalPages, and its remaining pages are fetched alongside everything else.
+# Returns each search's pages of results, in search and page order
+####################################################################
+def searchNeonAccounts(searches: list):
+    with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+        firstPages = [executor.submit(_searchPage, searchFields, 0) for searchFields in searches]
         # "page" is 0-based, "totalPages" is 1-based
-        page += 1
-        if page >= response.json().get("pagination").get("totalPages"):
-            break
+        laterPages = [
+            [
+                executor.submit(_searchPage, searchFields, page)
+                for page in range(1, first.result()["pagination"]["totalPages"])
+            ]
+            for searchFields, first in zip(searches, firstPages)
+        ]
+        return [
+            [first.result()["searchResults"], *(page.result()["searchResults"] for page in later)]
+            for first, later in zip(firstPages, laterPages)
+        ]
+
+
+####################################################################
+# Merge the results of several searches into neonAccountDict.  Earlier
+# searches win, exactly as if they had been run one after another
+####################################################################
+def getNeonAccountsForSearches(searches: list, neonAccountDict=None):
+    if neonAccountDict is None:
+        neonAccountDict = {}
+
+    for pages in searchNeonAccounts(searches):
+        for searchResults in pages:
+            mergeSearchResults(searchResults, neonAccountDict)
+    return neonAccountDict
+
+
+####################################################################
+# Stream the accounts matching given criteria, normalized by fixTypes,
+# one page at a time and in page order.  At most `prefetch` further pages
+# are in flight or waiting, so memory stays bounded however many
+# accounts match.
+####################################################################
+def iter_neon_accounts(searchFields, prefetch=SEARCH_PREFETCH):
+    first = _searchPage(searchFields, 0)
+    # "page" is 0-based, "totalPages" is 1-based
+    totalPages = first["pagination"]["totalPages"]
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = deque(
+            executor.submit(_searchPage, searchFields, page)
+            for page in range(1, min(totalPages, prefetch + 1))
+        )
+        nextPage = len(pending) + 1
+        try:
+            searchResults = first["searchResults"]
+            del first
+            while True:
+                for acct in searchResults:
+                    yield fixTypes(acct)
+                if not pending:
+                    return
+                searchResults = pending.popleft().result()["searchResults"]
+                if nextPage < totalPages:
+                    pending.append(executor.submit(_searchPage, searchFields, nextPage))
+                    nextPage += 1
+        finally:
+            # a consumer that stops early shouldn't wait on pages it won't read
+            for future in pending:
+                future.cancel()
+
+
+####################################################################
+# Get Neon accounts matching given criteria
+####################################################################
+def getNeonAccounts(searchFields, neonAccountDict=None):
+    if neonAccountDict is None:
+        neonAccountDict = {}
+
+    for account in iter_neon_accounts(searchFields):
+        # don't clobber an existing local account record that may have been updated since the last Neon query
+        if neonAccountDict.get(account["Account ID"]) is None:
+            neonAccountDict[account["Account ID"]] = account
     return neonAccountDict
 
 
 ####################################################################
 # Get all accounts in neon with OP IDs but no memberships
 ####################################################################
-def getOrphanOpAccounts(neonAccountDict={}):
-    searchFields = [
-        {"field": "Membership Expiration Date", "operator": "BLANK"},
-        {"field": "OpenPathID", "operator": "NOT_BLANK"},
-    ]
+ORPHAN_OP_SEARCH_FIELDS = [
+    {"field": "Membership Expiration Date", "operator": "BLANK"},
+    {"field": "OpenPathID", "operator": "NOT_BLANK"},
+]
+
 
-    return getNeonAccounts(searchFields, neonAccountDict=neonAccountDict)
+def getOrphanOpAccounts(neonAccountDict=None):
+    return getNeonAccounts(ORPHAN_OP_SEARCH_FIELDS, neonAccountDict=neonAccountDict)
 
 
 ####################################################################
 # Get all accounts in neon with Discourse IDs but no memberships
 ####################################################################
-def getOrphanDiscourseAccounts(neonAccountDict={}):
-    searchFields = [
-        {"field": "Membership Expiration Date", "operator": "BLANK"},
-        {"field": "DiscourseID", "operator": "NOT_BLANK"},
-    ]
+ORPHAN_DISCOURSE_SEARCH_FIELDS = [
+    {"field": "Membership Expiration Date", "operator": "BLANK"},
+    {"field": "DiscourseID", "operator": "NOT_BLANK"},
+]
 
-    return getNeonAccounts(searchFields, neonAccountDict=neonAccountDict)
+
+def getOrphanDiscourseAccounts(neonAccountDict=None):
+    return getNeonAccounts(ORPHAN_DISCOURSE_SEARCH_FIELDS, neonAccountDict=neonAccountDict)
 
 
 ####################################################################
 # Get all members in Neon without subscription details
 # Should we make a synthetic type for "Members" and combine this with getByType?
 ####################################################################
-def getMembersFast(neonAccountDict={}):
-    searchFields = [{"field": "Membership Expiration Date", "operator": "NOT_BLANK"}]
+MEMBERS_SEARCH_FIELDS = [{"field": "Membership Expiration Date", "operator": "NOT_BLANK"}]
+
 
-    return getNeonAccounts(searchFields, neonAccountDict=neonAccountDict)
+def getMembersFast(neonAccountDict=None):
+    return getNeonAccounts(MEMBERS_SEARCH_FIELDS, neonAccountDict=neonAccountDict)
 
 
 ####################################################################
 # Get all accounts of a given type in Neon without subscription details
 ####################################################################
-def getAccountsByType(type: str, neonAccountDict={}):
-    searchFields = [{"field": "Individual Type", "operator": "EQUAL", "value": type}]
+def typeSearchFields(type: str):
+    return [{"field": "Individual Type", "operator": "EQUAL", "value": type}]
+
 
-    return getNeonAccounts(searchFields, neonAccountDict=neonAccountDict)
+def getAccountsByType(type: str, neonAccountDict=None):
+    return getNeonAccounts(typeSearchFields(type), neonAccountDict=neonAccountDict)
 
 
 ####################################################################
-# Get all staf and current/past members from Neon, incuding detailed subscription info
+# The searches that make up a full getRealAccounts() sync, in merge order
 ####################################################################
-def getRealAccounts():
-    accountCount = 0
-    activeSubscriptions = 0
-
-    neonAccountDict = getMembersFast()
-    # Special accounts might not have any membership records
-    neonAccountDict = getAccountsByType(STAFF_TYPE, neonAccountDict=neonAccountDict)
-    neonAccountDict = getAccountsByType(INSTRUCTOR_TYPE, neonAccountDict=neonAccountDict)
-    neonAccountDict = getAccountsByType(ONDUTY_TYPE, neonAccountDict=neonAccountDict)
-    neonAccountDict = getAccountsByType(ONDUTY_TYPE_CERAMICS, neonAccountDict=neonAccountDict)
-    neonAccountDict = getAccountsByType(LEAD_TYPE, neonAccountDict=neonAccountDict)
-
-    # former Staff accounts might not have any membership records
-    neonAccountDict = getOrphanDiscourseAccounts(neonAccountDict=neonAccountDict)
-    neonAccountDict = getOrphanOpAccounts(neonAccountDict=neonAccountDict)
-
-    # some progress logging
-    num_pings = 10
-    num_loops = len(neonAccountDict)
-    loops_per_ping = num_loops / num_pings
-    progress_per_ping = 100 / num_pings
-    progress = 0
-    counter = 0
+def realAccountSearches():
+    return [
+        MEMBERS_SEARCH_FIELDS,
+        # Special accounts might not have any membership records
+        *(typeSearchFields(type) for type in REAL_ACCOUNT_TYPES),
+        # former Staff accounts might not have any membership records
+        ORPHAN_DISCOURSE_SEARCH_FIELDS,
+        ORPHAN_OP_SEARCH_FIELDS,
+    ]
 
-    accounts_to_fetch = []
-    for account in neonAccountDict:
-        accountCount += 1
 
+####################################################################
+# Get all accounts in neon modified since the given date
+# Membership changes don't touch the account's own modified date, so check both
+####################################################################
+def getModifiedAccounts(since: datetime.date, neonAccountDict=None):
+    searches = [
+        [{"field": field, "operator": "GREATER_AND_EQUAL", "value": str(since)}]
+        for field in ("Account Last Modified Date", "Membership Last Modified Date")
+    ]
+    return getNeonAccountsForSearches(searches, neonAccountDict=neonAccountDict)
+
+
+####################################################################
+# Helper function: would getRealAccounts() pick up this search result?
+####################################################################
+def _isRealAccount(account: dict):
+    if account.get("Membership Expiration Date"):
+        return True
+    if account.get("DiscourseID") or account.get("OpenPathID"):
+        return True
+    return any(accountIsType(account, type) for type in REAL_ACCOUNT_TYPES)
+
+
+####################################################################
+# Helper function: could this account's membership status have changed since the given date?
+# Status flips the day a term starts, and the day after it ends (or the day after that
+# if we're holding the account open for auto-renewal - see appendMemberships)
+####################################################################
+def _membershipChangedSince(account: dict, since: datetime.date):
+    for start, (end, _) in (account.get("membershipDates") or {}).items():
+        start = datetime.date.fromisoformat(start)
+        end = datetime.date.fromisoformat(end)
+        for day in (start, end + datetime.timedelta(days=1), end + datetime.timedelta(days=2)):
+            if since < day <= today:
+                return True
+    return False
+
+
+####################################################################
+# Fill in membership details for the given accounts in neonAccountDict
+# Only accounts in cacheableIds may reuse a cached membership history.  Pass
+#   just the accounts Neon says weren't modified: a level or fee change, or a
+#   new pending term, can leave the search results (and so the signal) as-is.
+####################################################################
+def _fetchMembershipDetails(neonAccountDict: dict, accountIds, trustSearchExpiration=True, cacheableIds=()):
+    accounts_to_fetch = accountsNeedingMemberships(
+        neonAccountDict, accountIds, trustSearchExpiration=trustSearchExpiration
+    )
+
+    signals = {str(account["Account ID"]): membershipSignal(account) for account in accounts_to_fetch}
+    cacheableIds = {str(accountId) for accountId in cacheableIds}
+    cached = neonSnapshot.loadMemberships(
+        {accountId: signal for accountId, signal in signals.items() if accountId in cacheableIds},
+        MEMBERSHIP_CACHE_MAX_AGE,
+    )
+    uncached = [account for account in accounts_to_fetch if str(account["Account ID"]) not in cached]
+
+    # Neon's rate limit is 10 req/sec; the shared Neon session paces these requests
+    logging.info(
+        "Fetching membership details for %s accounts (%s unchanged since cached)",
+        len(uncached),
+        len(cached),
+    )
+
+    def fetch(account):
+        # this should be a pretty thorough check for sane argument
+        assert int(account.get("Account ID")) > 0
+        return getMembershipsById(account.get("Account ID"))
+
+    with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
+        fetched = dict(zip(
+            (str(account["Account ID"]) for account in uncached),
+            executor.map(fetch, uncached),
+        ))
+
+    logging.info("Neon requests paced at %.1f/second", getLimiter(N_baseURL).currentRate)
+
+    neonSnapshot.saveMemberships({accountId: (signals[accountId], memberships) for accountId, memberships in fetched.items()})
+
+    memberships = cached | fetched
+    for account in applyMembershipsBatch([(account, memberships[str(account["Account ID"])]) for account in accounts_to_fetch]):
+        neonAccountDict[account["Account ID"]] = account
+
+
+####################################################################
+# Cheap stand-in for "did this account's membership history change?",
+# taken from the account's search results before memberships are applied
+####################################################################
+def membershipSignal(account: dict):
+    return json.dumps([
+        account.get("Membership Expiration Date"),
+        account.get("Membership Start Date"),
+        account.get("Account Current Membership Status"),
+    ])
+
+
+####################################################################
+# Tidy up the given accounts in neonAccountDict and return the ones whose
+# membership details still need to be fetched
+####################################################################
+def accountsNeedingMemberships(neonAccountDict: dict, accountIds, trustSearchExpiration=True):
+    accounts_to_fetch = []
+    for account in accountIds:
         # copy primary contact info to match search results format
         neonAccountDict[account][
             "fullName"
         ] = f"""{neonAccountDict[account].get("First Name")} {neonAccountDict[account].get("Last Name")}"""
 
+        # flags from an earlier pass don't get cleared by appendMemberships
+        for flag in MEMBERSHIP_FLAGS:
+            neonAccountDict[account].pop(flag, None)
+
         # fixup missing membership expiration dates so we don't have to keep checking for them
         if neonAccountDict[account].get("Membership Expiration Date") is None:
             neonAccountDict[account]["Membership Expiration Date"] = "1970-01-01"
@@ -488,8 +837,10 @@ def getRealAccounts():
         # NOTE that Neon sets "Membership Start Date" to start of the most recent membership term, not the oldest.  This means
         #     expired members that had a renewal will show incorrect start dates by our counting.
         #     I figure we won't need that data, so don't bother pulling membership details to correct it.
+        # Searches on membership fields can return an older term's dates, so those callers skip this shortcut.
         if (
-            datetime.datetime.strptime(
+            trustSearchExpiration
+            and datetime.datetime.strptime(
                 neonAccountDict[account]["Membership Expiration Date"], "%Y-%m-%d"
             ).date()
             < yesterday
@@ -499,31 +850,105 @@ def getRealAccounts():
 
         accounts_to_fetch.append(neonAccountDict[account])
 
-    # Neon's rate limit is 10 req/sec; use 9 for headroom against sleep/network jitter
-    rate_limiter = RateLimiter(per_second=9)
-    logging.info("Fetching membership details for %s accounts", len(accounts_to_fetch))
-
-    def fetch_with_rate_limit(account):
-        rate_limiter.acquire()
-        return appendMemberships(account)
+    return accounts_to_fetch
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        results = list(executor.map(fetch_with_rate_limit, accounts_to_fetch))
 
-    for account in results:
-        neonAccountDict[account["Account ID"]] = account
-        if account.get("validMembership"):
-            activeSubscriptions += 1
+####################################################################
+# Update the saved snapshot with accounts changed since the last sync
+# Returns None if it's time for a full sync instead
+####################################################################
+def _getRealAccountsIncremental():
+    lastFullSync = neonSnapshot.getMeta("lastFullSync")
+    highWaterMark = neonSnapshot.getMeta("highWaterMark")
+    if (
+        lastFullSync is None
+        or highWaterMark is None
+        or today - datetime.date.fromisoformat(lastFullSync) >= FULL_SYNC_INTERVAL
+    ):
+        logging.info("Last full Neon sync was %s; running a full sync", lastFullSync)
+        return None
+
+    neonAccountDict = neonSnapshot.loadSnapshot()
+    if neonAccountDict is None:
+        return None
+
+    since = datetime.date.fromisoformat(highWaterMark)
+    modifiedAccounts = getModifiedAccounts(since)
+
+    refreshIds = []
+    for accountId, account in modifiedAccounts.items():
+        if accountId in neonAccountDict or _isRealAccount(account):
+            neonAccountDict[accountId] = account
+            refreshIds.append(accountId)
+
+    # unmodified accounts can still start or lapse with the passing of time
+    # their membership histories didn't change, so they can come from the cache
+    unmodifiedIds = [
+        accountId
+        for accountId, account in neonAccountDict.items()
+        if accountId not in modifiedAccounts and _membershipChangedSince(account, since)
+    ]
+    refreshIds.extend(unmodifiedIds)
 
     logging.info(
-        "In %s Neon accounts we found %s active subscriptions",
-        accountCount,
-        activeSubscriptions,
+        "Incremental Neon sync since %s: %s modified accounts, %s to refresh",
+        since,
+        len(modifiedAccounts),
+        len(refreshIds),
+    )
+
+    _fetchMembershipDetails(
+        neonAccountDict, refreshIds, trustSearchExpiration=False, cacheableIds=unmodifiedIds
     )
 
+    neonSnapshot.saveSnapshot(neonAccountDict, meta={"highWaterMark": str(today)})
+
     return neonAccountDict
 
 
+####################################################################
+# Get all staf and current/past members from Neon, incuding detailed subscription info
+# With snapshotMaxAge set, reuse the last saved snapshot if it's recent enough.
+# With incremental set, only fetch accounts modified since the last saved sync, doing
+#   a full sync when the last one is FULL_SYNC_INTERVAL old.
+# Fresh results are saved as the new snapshot if persist, snapshotMaxAge or incremental is set.
+####################################################################
+def getRealAccounts(snapshotMaxAge: datetime.timedelta = None, persist=False, incremental=False):
+    if snapshotMaxAge is not None:
+        neonAccountDict = neonSnapshot.loadSnapshot(maxAge=snapshotMaxAge)
+        if neonAccountDict is not None:
+            return neonAccountDict
+        persist = True
+
+    if incremental:
+        neonAccountDict = _getRealAccountsIncremental()
+        if neonAccountDict is None:
+            persist = True
+        else:
+            _logActiveSubscriptions(neonAccountDict)
+            return neonAccountDict
+
+    neonAccountDict = getNeonAccountsForSearches(realAccountSearches())
+
+    _fetchMembershipDetails(neonAccountDict, list(neonAccountDict))
+    _logActiveSubscriptions(neonAccountDict)
+
+    if persist:
+        neonSnapshot.saveSnapshot(
+            neonAccountDict, meta={"lastFullSync": str(today), "highWaterMark": str(today)}
+        )
+
+    return neonAccountDict
+
+
+def _logActiveSubscriptions(neonAccountDict: dict):
+    logging.info(
+        "In %s Neon accounts we found %s active subscriptions",
+        len(neonAccountDict),
+        sum(1 for account in neonAccountDict.values() if account.get("validMembership")),
+    )
+
+
 ####################################################################
 # Helper function: is this Neon account marked with any type
 ####################################################################
@@ -538,6 +963,9 @@ def accountIsAnyType(account: dict):
 # Helper function: is this Neon account marked with specified type
 ####################################################################
 def accountIsType(account: dict, accountType: str):
+    if isinstance(account, NeonAccount):
+        return accountType in account.typeNames()
+
     if account.get("individualTypes") is None:
         return False
 
@@ -0,0 +1,162 @@
+############### Asmbly OpenPath User Directory ###############
+#  Local copy of the OpenPath users openPathUtil fetches, so  #
+#  sync cycles only re-page the users that changed            #
+##############################################################
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+
+
+# The directory lives next to the scripts on AdminBot.  Lambda only has /tmp to write to.
+def _defaultPath():
+    if os.environ.get("OPENPATH_DIRECTORY_PATH"):
+        return os.environ["OPENPATH_DIRECTORY_PATH"]
+    if os.environ.get("LAMBDA_TASK_ROOT"):
+        return "/tmp/openPathUsers.db"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "openPathUsers.db")
+
+
+def _connect(path=None):
+    connection = sqlite3.connect(path or _defaultPath())
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, synced_at TEXT NOT NULL, data TEXT NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+    )
+    return connection
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+####################################################################
+# The parts of an OpenPath user we keep, in the API's own shape
+####################################################################
+def directoryGroups(groups):
+    return [{"id": group.get("id"), "name": group.get("name")} for group in groups or []]
+
+
+def directoryEntry(opUser: dict):
+    return {
+        "id": opUser.get("id"),
+        "externalId": opUser.get("externalId"),
+        "identity": {"email": (opUser.get("identity") or {}).get("email")},
+        "status": opUser.get("status"),
+        "groups": directoryGroups(opUser.get("groups")),
+        "updatedAt": opUser.get("updatedAt"),
+    }
+
+
+####################################################################
+# Store OpenPath users.  With replace, they become the whole directory,
+# swapped in one transaction so a failed write leaves the old one intact.
+####################################################################
+def saveUsers(opUsers, replace=False, path=None, meta: dict = None):
+    syncedAt = _now().isoformat()
+    entries = [directoryEntry(opUser) for opUser in opUsers]
+
+    connection = _connect(path)
+    try:
+        with connection:
+            if replace:
+                connection.execute("DELETE FROM users")
+            connection.executemany(
+                "INSERT OR REPLACE INTO users (id, synced_at, data) VALUES (?, ?, ?)",
+                (
+                    (entry["id"], syncedAt, json.dumps(entry))
+                    for entry in entries
+                ),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (meta or {}).items(),
+            )
+    finally:
+        connection.close()
+
+    logging.debug("Saved %s OpenPath users to the directory", len(entries))
+
+
+####################################################################
+# Merge changed fields into a stored user, e.g. after we update it
+# in OpenPath.  A user we haven't seen yet is added with just these.
+####################################################################
+def updateUser(opId: int, fields: dict, path=None):
+    connection = _connect(path)
+    try:
+        with connection:
+            row = connection.execute(
+                "SELECT data FROM users WHERE id = ?", (int(opId),)
+            ).fetchone()
+            entry = json.loads(row[0]) if row else directoryEntry({"id": int(opId)})
+            entry.update(fields)
+            connection.execute(
+                "INSERT OR REPLACE INTO users (id, synced_at, data) VALUES (?, ?, ?)",
+                (entry["id"], _now().isoformat(), json.dumps(entry)),
+            )
+    finally:
+        connection.close()
+
+
+####################################################################
+# Forget a user that was deleted from OpenPath
+####################################################################
+def deleteUser(opId: int, path=None):
+    connection = _connect(path)
+    try:
+        with connection:
+            connection.execute("DELETE FROM users WHERE id = ?", (int(opId),))
+    finally:
+        connection.close()
+
+
+####################################################################
+# Look up a value saved alongside the directory.  None if it isn't set
+####################################################################
+def getMeta(key: str, path=None):
+    connection = _connect(path)
+    try:
+        row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    finally:
+        connection.close()
+
+    return row[0] if row else None
+
+
+####################################################################
+# All stored users, keyed by OpenPath ID like openPathUtil.getAllUsers()
+####################################################################
+def loadUsers(path=None):
+    connection = _connect(path)
+    try:
+        rows = connection.execute("SELECT id, data FROM users").fetchall()
+    finally:
+        connection.close()
+
+    return {opId: json.loads(data) for opId, data in rows}
+
+
+####################################################################
+# A stored user by OpenPath ID.  None if we don't have it, or if it was
+# last synced from OpenPath longer than maxAge ago
+####################################################################
+def getUser(opId: int, maxAge: datetime.timedelta = None, path=None):
+    connection = _connect(path)
+    try:
+        row = connection.execute(
+            "SELECT synced_at, data FROM users WHERE id = ?", (int(opId),)
+        ).fetchone()
+    finally:
+        connection.close()
+
+    if row is None:
+        return None
+    if maxAge is not None and _now() - datetime.datetime.fromisoformat(row[0]) > maxAge:
+        return None
+    return json.loads(row[1])
+
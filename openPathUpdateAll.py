@@ -5,7 +5,10 @@
 import neonUtil
 import openPathUtil
 import logging
-import json
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from email.mime.text import MIMEText
 from AsmblyMessageFactory import commonMessageFooter
 import gmailUtil
@@ -15,6 +18,18 @@ logging.basicConfig(
          level=logging.INFO,
          datefmt='%Y-%m-%d %H:%M:%S')
 
+#how stale a saved Neon account snapshot can be when running standalone
+SNAPSHOT_MAX_AGE = datetime.timedelta(hours=1)
+
+#OpenPath changes are applied in parallel, paced by the shared OpenPath rate limiter
+APPLY_WORKERS = 4
+#a group update is an idempotent PUT, so it's safe to retry after an error
+APPLY_RETRIES = 3
+RETRY_DELAY = 2 #seconds, doubled after each failed attempt
+
+ACTION_UPDATE = "update groups"
+ACTION_CREATE = "create user"
+
 def getWarningText(warningUsers):
     if len(warningUsers) == 0:
         return ""
@@ -24,8 +39,82 @@ def getWarningText(warningUsers):
     WARNING: {len(warningUsers)} USER{'S HAVE' if len(warningUsers) > 1 else ' HAS'} FACILITY ACCESS WITHOUT A SIGNED WAIVER:
       {list_separator.join(warningUsers)}'''
 
-def openPathUpdateAll(neonAccounts, mailSummary = False):
-    opUsers = openPathUtil.getAllUsers()
+def accountName(account):
+    return f'''{account.get("fullName")} ({account.get("Email 1")})'''
+
+#set an account's OpenPath groups, retrying server and connection errors;
+#each try is counted in result["attempts"]
+def setGroupsWithRetry(account, groups, result):
+    delay = RETRY_DELAY
+    for attempt in range(1, APPLY_RETRIES + 1):
+        result["attempts"] = attempt
+        try:
+            openPathUtil.setGroups(account, groups)
+            return
+        except requests.RequestException as e:
+            #a 4xx means OpenPath rejected the request, and it will again
+            status = e.response.status_code if e.response is not None else None
+            if attempt == APPLY_RETRIES or (status is not None and status < 500):
+                raise
+            logging.warning(f'''Attempt {attempt} to update OpenPath groups for {accountName(account)} failed: {e}''')
+            time.sleep(delay)
+            delay *= 2
+
+#apply one planned change; always returns a result row, never raises
+def applyChange(action, account, groups):
+    result = {"action": action, "account": accountName(account), "attempts": 0, "error": None}
+    try:
+        if action == ACTION_UPDATE:
+            setGroupsWithRetry(account, groups, result)
+        #user creation isn't idempotent, so it's only attempted once
+        elif not openPathUtil.createUser(account):
+            result["error"] = "OpenPath user creation failed"
+        elif account.get("OpenPathID"):
+            if groups:
+                setGroupsWithRetry(account, groups, result)
+            openPathUtil.createMobileCredential(account)
+    except Exception as e:
+        logging.exception(f'''Failed to {action} for {accountName(account)}''')
+        result["error"] = str(e)
+    return result
+
+#apply planned (action, account, groups) changes through a bounded worker pool
+def applyChanges(changes):
+    if not changes:
+        return []
+    with ThreadPoolExecutor(max_workers=APPLY_WORKERS) as executor:
+        return list(executor.map(lambda change: applyChange(*change), changes))
+
+#summary table of applied changes, one row per action
+def getResultsTable(results):
+    if len(results) == 0:
+        return "No OpenPath changes needed."
+
+    rows = [f'''{'action':<15}{'applied':>8}{'failed':>8}{'retried':>8}''']
+    for action in (ACTION_UPDATE, ACTION_CREATE):
+        actionResults = [r for r in results if r["action"] == action]
+        failed = sum(1 for r in actionResults if r["error"])
+        retried = sum(1 for r in actionResults if r["attempts"] > 1)
+        rows.append(f'''{action:<15}{len(actionResults) - failed:>8}{failed:>8}{retried:>8}''')
+
+    list_separator = '\n      '
+    return f'''OpenPath changes:
+      {list_separator.join(rows)}'''
+
+def getFailureText(results):
+    failures = [r for r in results if r["error"]]
+    if len(failures) == 0:
+        return ""
+
+    list_separator = '\n      '
+    return f'''
+    WARNING: {len(failures)} OPENPATH UPDATE{'S' if len(failures) > 1 else ''} FAILED:
+      {list_separator.join(f"{r['account']} - {r['action']}: {r['error']}" for r in failures)}'''
+
+#opUsers is an optional prefetch from openPathUtil.getAllUsers()
+def openPathUpdateAll(neonAccounts, mailSummary = False, opUsers = None):
+    if opUsers is None:
+        opUsers = openPathUtil.getAllUsers(incremental=True)
 
     # Build externalId->opUser lookup to reconcile Neon accounts missing their OpenPathID
     opUsersByExternalId = {}
@@ -49,6 +138,10 @@ def openPathUpdateAll(neonAccounts, mailSummary = False):
     paidRegulars = 0
     paidCeramics = 0
 
+    accessGroups = openPathUtil.getOpGroupsForAccounts(neonAccounts)
+    #OpenPath changes are planned for every account first, then applied together
+    changes = []
+
     for accountId, account in neonAccounts.items():
         if not account.get("OpenPathID") and accountId in opUsersByExternalId:
             opUser = opUsersByExternalId[accountId]
@@ -90,17 +183,17 @@ def openPathUpdateAll(neonAccounts, mailSummary = False):
             ceramicsFacilityCount += 1
 
         if account.get("OpenPathID"):
-            openPathUtil.updateGroups(account,
-                                        openPathGroups=opUsers.get(int(account.get("OpenPathID"))).get("groups"))
+            currentGroups, groups = openPathUtil.groupChanges(account,
+                                        openPathGroups=opUsers.get(int(account.get("OpenPathID"))).get("groups"),
+                                        opGroups=accessGroups[accountId])
+            if sorted(currentGroups) != sorted(groups):
+                changes.append((ACTION_UPDATE, account, groups))
             #note that this isn't necessarily 100% accurate, because we have Neon users with provisioned OpenPath IDs and no access groups
             #assuming that typical users who gained and lost openPath access have a signed waiver
             if not account.get("WaiverDate"):
                 warningUsers.append(f'''{account.get("fullName")} ({account.get("Email 1")})''')
         elif neonUtil.accountHasFacilityAccess(account):
-            if openPathUtil.createUser(account):
-                openPathUtil.updateGroups(account,
-                                            openPathGroups=[]) #pass empty groups list to skip the http get
-                openPathUtil.createMobileCredential(account)
+            changes.append((ACTION_CREATE, account, accessGroups[accountId]))
         elif account.get("validMembership"):
             startDate = account.get("Membership Start Date")
             if not account.get("WaiverDate"):
@@ -112,6 +205,9 @@ def openPathUpdateAll(neonAccounts, mailSummary = False):
         if account.get("ceramicsMembership") and not account.get("CsiDate"):
             missingCsiSubscribers[accountId] = f'''{account.get("fullName")} ({account.get("Email 1")}) - since {account.get("Ceramics Start Date")}'''
 
+    results = applyChanges(changes)
+    logging.info(getResultsTable(results))
+
     list_separator = '\n            '
     compedSubscriberString = ""
     compedSubscriberDetails =""
@@ -141,6 +237,7 @@ def openPathUpdateAll(neonAccounts, mailSummary = False):
         {len(missingCsiSubscribers)} are missing Ceramics Introduction{':' if len(missingCsiSubscribers) > 0 else ' (yay!)'}
             {list_separator.join(missingCsiSubscribers[x] for x in sorted(missingCsiSubscribers, reverse=True))}
 {getWarningText(warningUsers)}
+{getFailureText(results)}
 {compedLeaderDetails}
 {compedSubscriberDetails}
 {commonMessageFooter}
@@ -172,19 +269,15 @@ def openPathUpdateAll(neonAccounts, mailSummary = False):
     logging.info(msg.get_payload())
     print(summaryMsg.get_payload())
 
+    return results
+
 #begin standalone script functionality -- pull neonAccounts and call our function
 def main():
     neonAccounts = {}
 
-    #For real use, just get neon accounts directly
-    #Be aware this takes a long time (2+ minutes)
-    neonAccounts = neonUtil.getRealAccounts()
-
-    # Testing goes a lot faster if we're working with a cache of accounts
-    #with open("Neon/neonAccounts.json") as neonFile:
-    #    neonAccountJson = json.load(neonFile)
-    #    for account in neonAccountJson:
-    #        neonAccounts[neonAccountJson[account]["Account ID"]] = neonAccountJson[account]
+    #Pulling accounts from Neon takes a long time (2+ minutes), so reuse
+    #the snapshot saved by the last sync cycle if it's recent enough
+    neonAccounts = neonUtil.getRealAccounts(snapshotMaxAge=SNAPSHOT_MAX_AGE)
 
     openPathUpdateAll(neonAccounts)
 
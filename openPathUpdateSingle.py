@@ -6,20 +6,88 @@ import neonUtil
 import openPathUtil
 import logging
 import sys
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(
          format='%(asctime)s %(levelname)-8s %(message)s',
          level=logging.INFO,
          datefmt='%Y-%m-%d %H:%M:%S')
 
-def openPathUpdateSingle(neonID):
-    account = neonUtil.getMemberById(neonID)
+#Neon account + memberships + OpenPath groups
+FETCH_WORKERS = 3
+
+#groups we read or wrote this recently are reused from the OpenPath user directory,
+#so a burst of webhooks for one account only fetches them once
+GROUPS_MAX_AGE = datetime.timedelta(minutes=5)
+
+#Returns a function that records, under the given stage name, the seconds since
+#the previous stage ended (or since stageTimer was called, for the first stage)
+def stageTimer(timings: dict):
+    last = time.perf_counter()
+
+    def stage(name):
+        nonlocal last
+        now = time.perf_counter()
+        timings[name] = now - last
+        last = now
+
+    return stage
+
+
+#Fetch the Neon account, its memberships and its OpenPath groups concurrently.
+#Memberships only need the Neon ID, so they start right away; the groups start as
+#soon as the account fetch returns the OpenPath ID.
+#A caller that already has the account with its memberships can pass it in, and
+#only the groups are fetched.
+#Each stage is timed with stage() from stageTimer.  The fetches overlap, so a stage's
+#time is how much longer it took than the stage before it.
+def fetchAccountState(neonID, stage, account=None):
+    if account is not None:
+        openPathGroups = None
+        if account.get("OpenPathID"):
+            openPathGroups = openPathUtil.getGroupsById(account.get("OpenPathID"), GROUPS_MAX_AGE)
+            stage("openpath groups")
+        return account, openPathGroups
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        memberships = pool.submit(neonUtil.getMembershipsById, neonID)
+        account = neonUtil.getAccountById(neonID)
+        stage("neon account")
+
+        openPathGroups = None
+        if account.get("OpenPathID"):
+            openPathGroups = pool.submit(openPathUtil.getGroupsById, account.get("OpenPathID"), GROUPS_MAX_AGE)
+
+        account = neonUtil.applyMemberships(account, memberships.result())
+        stage("neon memberships")
+
+        if openPathGroups is not None:
+            openPathGroups = openPathGroups.result()
+            stage("openpath groups")
+
+    return account, openPathGroups
+
+
+#Returns the seconds spent in each stage, for latency logging.
+#account is the Neon account with its memberships, if the caller already fetched it
+def openPathUpdateSingle(neonID, account=None):
+    timings = {}
+    stage = stageTimer(timings)
+    account, openPathGroups = fetchAccountState(neonID, stage, account)
+
     if account.get("OpenPathID"):
-        openPathUtil.updateGroups(account)
+        opGroups = openPathUtil.getOpGroups(account)
+        current, desired = openPathUtil.groupChanges(account, openPathGroups, opGroups)
+        if sorted(current) == sorted(desired):
+            logging.info(f'''OpenPath groups already up to date for {account.get("fullName")}''')
+        else:
+            openPathUtil.updateGroups(account, openPathGroups=openPathGroups, opGroups=opGroups)
         #note that this isn't necessarily 100% accurate, because we have Neon users with provisioned OpenPath IDs and no access groups
         #assuming that typical users who gained and lost openPath access have a signed waiver
     #instructors and on-duty volunteers might need OP credentials without having facility access
-    elif ( neonUtil.accountHasFacilityAccess(account) or 
+    elif ( neonUtil.accountHasFacilityAccess(account) or
            neonUtil.accountIsType(account, neonUtil.INSTRUCTOR_TYPE) or
            neonUtil.accountIsType(account, neonUtil.ONDUTY_TYPE)):
         if openPathUtil.createUser(account):
@@ -31,6 +99,11 @@ def openPathUpdateSingle(neonID):
         if not account.get("FacilityTourDate"):
             logging.info(f'''{account.get("fullName")} ({account.get("Email 1")} is missing the Facility Tour''')
 
+    stage("openpath update")
+    logging.info("openPathUpdateSingle %s timings: %s (total %.3fs)", neonID,
+                 ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()), sum(timings.values()))
+    return timings
+
 
 #begin standalone script functionality -- update single account provided on command line
 def main():
@@ -6,11 +6,13 @@ from os import environ
 from pprint import pformat
 from base64 import b64encode
 import datetime, pytz
-import requests
 import logging
 from pprint import pprint
 
 import neonUtil
+import openPathDirectory
+from neonAccount import NeonAccount
+from helpers.sessions import getSession
 import AsmblyMessageFactory
 import gmailUtil
 
@@ -32,25 +34,164 @@ GROUP_ONDUTY = 507223
 GROUP_CERAMICS_ONDUTY = 730657
 GROUP_SPECIAL_EVENT = 119566
 
+# Facts about a Neon account that OpenPath access depends on.  Each fact is a
+# bit, so an account's whole access situation is one int.
+# Account types, by Neon individual type name
+TYPE_FACTS = {
+    "staff": neonUtil.STAFF_TYPE,
+    "director": neonUtil.DIRECTOR_TYPE,
+    "lead": neonUtil.LEAD_TYPE,
+    "super": neonUtil.SUPER_TYPE,
+    "coworking": neonUtil.COWORKING_TYPE,
+    "steward": neonUtil.STEWARD_TYPE,
+    "instructor": neonUtil.INSTRUCTOR_TYPE,
+    "onDuty": neonUtil.ONDUTY_TYPE,
+    "ceramicsOnDuty": neonUtil.ONDUTY_TYPE_CERAMICS,
+}
+# Everything else, by predicate on the account
+FLAG_FACTS = {
+    "subscriber": neonUtil.subscriberHasFacilityAccess,
+    "ceramics": lambda account: bool(
+        account.get("ceramicsMembership") and account.get("CsiDate")
+    ),
+    "waiverAndTour": lambda account: bool(
+        account.get("WaiverDate")
+        and account.get("FacilityTourDate")
+        and not account.get("AccessSuspended")
+    ),
+    "shaper": neonUtil.accountHasShaperAccess,
+    "domino": neonUtil.accountHasDominoAccess,
+}
+
+# Each rule is a list of terms; a term is a tuple of facts that must all hold
+# ("!fact" must not hold).  A group is granted if any of its terms match.
+
+# Same conditions as neonUtil.accountHasFacilityAccess
+FACILITY_ACCESS = (
+    ("staff",),
+    ("lead",),
+    ("subscriber",),
+    # CoWorking can ride out subscription lapses, but not other membership requirements
+    ("coworking", "waiverAndTour"),
+)
+# Non-leader staff have access to all areas during regular hours
+NON_LEADER_STAFF = ("staff", "!lead", "!director", "!super")
+
+
+def withFacilityAccess(*facts):
+    return tuple(term + facts for term in FACILITY_ACCESS)
+
+
+# OpenPath groups we manage, and who gets them.  Adding a group is adding a line.
+ACCESS_POLICY = {
+    # Instructors and On-Duty volunteers might not be members, but still need
+    # access to Instructor's storage and clock in/out buttons, respectively
+    GROUP_INSTRUCTORS: (("instructor",), NON_LEADER_STAFF),
+    GROUP_ONDUTY: (("onDuty",),),
+    # ceramics_onduty gets the interior ceramics door but not exterior entry
+    #   so non-member volunteers can't get into the shop unsupervised via ceramics
+    GROUP_CERAMICS_ONDUTY: (("ceramicsOnDuty",),),
+    # Board / Leaders / SuperStewards 24x7 access
+    GROUP_MANAGEMENT: (("lead",), ("director",), ("super",)),
+    # Other groups are effectively subsets of overall facility access
+    GROUP_SUBSCRIBERS: FACILITY_ACCESS,
+    GROUP_CERAMICS: (NON_LEADER_STAFF, ("subscriber", "ceramics")),
+    GROUP_COWORKING: (NON_LEADER_STAFF,) + withFacilityAccess("coworking"),
+    GROUP_STEWARDS: (NON_LEADER_STAFF,) + withFacilityAccess("steward"),
+    GROUP_SHAPER_ORIGIN: withFacilityAccess("shaper"),
+    GROUP_DOMINO: withFacilityAccess("domino"),
+}
+
+MANAGED_GROUPS = frozenset(ACCESS_POLICY)
+
+
+####################################################################
+# Compile ACCESS_POLICY into fact bits and (required, forbidden) masks
+####################################################################
+def compilePolicy(policy):
+    factBits = {
+        fact: 1 << bit for bit, fact in enumerate([*TYPE_FACTS, *FLAG_FACTS])
+    }
+
+    def termMasks(term):
+        required = forbidden = 0
+        for fact in term:
+            if fact.startswith("!"):
+                forbidden |= factBits[fact[1:]]
+            else:
+                required |= factBits[fact]
+        return required, forbidden
+
+    # groups in ascending ID order, so the group bits decode to a sorted list
+    groups = sorted(policy)
+    rules = [
+        (1 << bit, [termMasks(term) for term in policy[group]])
+        for bit, group in enumerate(groups)
+    ]
+    typeBits = [(factBits[fact], name) for fact, name in TYPE_FACTS.items()]
+    flagBits = [(factBits[fact], test) for fact, test in FLAG_FACTS.items()]
+    return groups, rules, typeBits, flagBits
+
+
+_groups, _rules, _typeBits, _flagBits = compilePolicy(ACCESS_POLICY)
+
+
 def isManagedGroup(group: int):
-    if (
-        group == GROUP_MANAGEMENT
-        or group == GROUP_ONDUTY
-        or group == GROUP_SUBSCRIBERS
-        or group == GROUP_CERAMICS
-        or group == GROUP_CERAMICS_ONDUTY
-        or group == GROUP_COWORKING
-        or group == GROUP_STEWARDS
-        or group == GROUP_INSTRUCTORS
-        or group == GROUP_SHAPER_ORIGIN
-        or group == GROUP_DOMINO
-    ):
-        return True
-    return False
+    return group in MANAGED_GROUPS
+
+
+####################################################################
+# The fact bits for a Neon account
+####################################################################
+def accountFacts(neonAccount):
+    if isinstance(neonAccount, NeonAccount):
+        typeNames = neonAccount.typeNames()
+    else:
+        typeNames = {
+            type.get("name") for type in neonAccount.get("individualTypes") or ()
+        }
+
+    facts = 0
+    for bit, name in _typeBits:
+        if name in typeNames:
+            facts |= bit
+    for bit, test in _flagBits:
+        if test(neonAccount):
+            facts |= bit
+    return facts
+
+
+####################################################################
+# The bitmask of managed groups granted by the given fact bits
+####################################################################
+def groupMask(facts: int):
+    mask = 0
+    for groupBit, terms in _rules:
+        for required, forbidden in terms:
+            if facts & required == required and not facts & forbidden:
+                mask |= groupBit
+                break
+    return mask
+
+
+####################################################################
+# OpenPath group IDs for a group bitmask, in ascending order
+####################################################################
+def groupsFromMask(mask: int):
+    groups = []
+    for group in _groups:
+        if mask & 1:
+            groups.append(group)
+        mask >>= 1
+    return groups
 
 
 dryRun = False
 
+# How often an incremental getAllUsers() re-pages every user anyway, to catch
+# changes that didn't move a user's updatedAt (and users deleted outright)
+FULL_SYNC_INTERVAL = datetime.timedelta(days=1)
+
 ### OpenPath Account Info
 O_auth = f"{O_APIuser}:{O_APIkey}"
 # Asmbly is OpenPath org ID 5231
@@ -65,8 +206,15 @@ O_headers = {
 
 ####################################################################
 # Get all defined OpenPath users
+# With incremental set, only page through users updated since the last
+#   sync and merge them into the saved directory (see openPathDirectory.py),
+#   doing a full sync when the last one is FULL_SYNC_INTERVAL old.
 ####################################################################
-def getAllUsers():
+def getAllUsers(incremental=False):
+    if incremental:
+        opUsers = _getAllUsersIncremental()
+        if opUsers is not None:
+            return opUsers
 
     opUsers = {}
 
@@ -82,7 +230,7 @@ def getAllUsers():
             + "&offset="
             + str(offset)
         )
-        response = requests.get(url, headers=O_headers)
+        response = getSession(url).get(url, headers=O_headers)
 
         if response.status_code != 200:
             raise ValueError(f"Get {url} returned status code {response.status_code}")
@@ -94,15 +242,87 @@ def getAllUsers():
         for i in response.json().get("data"):
             opUsers[i["id"]] = i
 
+    if incremental:
+        openPathDirectory.saveUsers(
+            opUsers.values(),
+            replace=True,
+            meta={"lastFullSync": str(neonUtil.today), "highWaterMark": highWaterMark(opUsers.values())},
+        )
+
     return opUsers
 
 
+
+####################################################################
+# Get OpenPath users updated at or after the given updatedAt timestamp
+####################################################################
+def getUsersUpdatedSince(since: str):
+    opUsers = []
+
+    limit = 100
+    offset = 0
+    total = limit
+    while offset < total:
+        url = (
+            O_baseURL
+            + "/users?sort=updatedAt&order=desc"
+            + "&limit="
+            + str(limit)
+            + "&offset="
+            + str(offset)
+        )
+        response = getSession(url).get(url, headers=O_headers)
+
+        if response.status_code != 200:
+            raise ValueError(f"Get {url} returned status code {response.status_code}")
+
+        offset += limit
+        total = int(response.json().get("totalCount"))
+
+        # newest first, so we're done at the first user older than since
+        for i in response.json().get("data"):
+            if (i.get("updatedAt") or "") < since:
+                return opUsers
+            opUsers.append(i)
+
+    return opUsers
+
+
+## The newest updatedAt among the given OpenPath users
+def highWaterMark(opUsers):
+    return max((opUser.get("updatedAt") or "" for opUser in opUsers), default="")
+
+
+####################################################################
+# Update the saved directory with users changed since the last sync
+# Returns None if it's time for a full sync instead
+####################################################################
+def _getAllUsersIncremental():
+    lastFullSync = openPathDirectory.getMeta("lastFullSync")
+    since = openPathDirectory.getMeta("highWaterMark")
+    if (
+        lastFullSync is None
+        or since is None
+        or neonUtil.today - datetime.date.fromisoformat(lastFullSync) >= FULL_SYNC_INTERVAL
+    ):
+        logging.info("Last full OpenPath sync was %s; running a full sync", lastFullSync)
+        return None
+
+    changedUsers = getUsersUpdatedSince(since)
+    openPathDirectory.saveUsers(
+        changedUsers, meta={"highWaterMark": max(since, highWaterMark(changedUsers))}
+    )
+    logging.info("Incremental OpenPath sync since %s: %s updated users", since, len(changedUsers))
+
+    return openPathDirectory.loadUsers()
+
+
 ####################################################################
 # Get a single OpenPath user by OpenPath ID
 ####################################################################
 def getUser(opId: int):
     url = O_baseURL + f"/users/{opId}"
-    response = requests.get(url, headers=O_headers)
+    response = getSession(url).get(url, headers=O_headers)
 
     if response.status_code != 200:
         raise ValueError(f"Get {url} returned status code {response.status_code}")
@@ -118,12 +338,14 @@ def deactivateUser(opId: int):
     data = {"status": "I"}
     logging.debug("PUT to %s %s", url, pformat(data))
 
-    response = requests.put(url, json=data, headers=O_headers)
+    response = getSession(url).put(url, json=data, headers=O_headers)
     if response.status_code != 204:
         raise ValueError(
             f"Put {url} returned status code {response.status_code}; expected 200"
         )
 
+    openPathDirectory.updateUser(opId, {"status": "I"})
+
 
 ####################################################################
 # ACTUALLY DELETE an OpenPath user by ID
@@ -135,27 +357,37 @@ def reallyActuallyDeleteUser(opId: int):
         "ACTUALLY DELETING OpenPath User %s! User will no longer show up in logs!", opId
     )
     url = O_baseURL + f"/users/{opId}"
-    response = requests.delete(url, headers=O_headers)
+    response = getSession(url).delete(url, headers=O_headers)
 
     # A successful delete call returns 204 "NO DATA"
     if response.status_code != 204:
         raise ValueError(f"Delete {url} returned status code {response.status_code}")
 
+    openPathDirectory.deleteUser(opId)
+
 
 ####################################################################
 # Given an OpenPath ID, return group membership
+# With maxAge set, use the saved directory's copy if it was synced recently enough
 ####################################################################
-def getGroupsById(id):
+def getGroupsById(id, maxAge: datetime.timedelta = None):
     if not id:
         return []
 
+    if maxAge is not None:
+        opUser = openPathDirectory.getUser(id, maxAge=maxAge)
+        if opUser is not None:
+            return opUser.get("groups")
+
     url = O_baseURL + f"/users/{id}/groups"
-    response = requests.get(url, headers=O_headers)
+    response = getSession(url).get(url, headers=O_headers)
 
     if response.status_code != 200:
         raise ValueError(f"Get {url} returned status code {response.status_code}")
 
-    return response.json().get("data")
+    groups = response.json().get("data")
+    openPathDirectory.updateUser(id, {"groups": openPathDirectory.directoryGroups(groups)})
+    return groups
 
 
 ####################################################################
@@ -166,7 +398,7 @@ def getCredentialsForId(id: int):
     assert int(id) > 0
 
     url = O_baseURL + f"""/users/{id}/credentials?offset=0&sort=id&order=asc"""
-    response = requests.get(url, headers=O_headers)
+    response = getSession(url).get(url, headers=O_headers)
     if response.status_code != 200:
         raise ValueError(f"Get {url} returned status code {response.status_code}")
 
@@ -178,7 +410,7 @@ def getCredentialsForId(id: int):
 ####################################################################
 def deleteCredential(userId: int, credentialId: int):
     url = O_baseURL + f"""/users/{userId}/credentials/{credentialId}"""
-    response = requests.delete(url, headers=O_headers)
+    response = getSession(url).delete(url, headers=O_headers)
     if response.status_code != 204:
         raise ValueError(
             f"Delete {url} returned status code {response.status_code}; expected 204"
@@ -226,12 +458,16 @@ def disableAccount(neonAccount):
         logging.warning("DryRun in openPathUtil.disableAccount()")
         return
 
-    response = requests.put(url, json=data, headers=O_headers)
+    response = getSession(url).put(url, json=data, headers=O_headers)
+    # an HTTPError keeps the response, so callers can tell a rejected request from a server error
+    response.raise_for_status()
     if response.status_code != 204:
         raise ValueError(
             f"Put {url} returned status code {response.status_code}; expected 204"
         )
 
+    openPathDirectory.updateUser(neonAccount.get("OpenPathID"), {"groups": []})
+
     # todo SEND EMAIL
 
 
@@ -239,66 +475,28 @@ def disableAccount(neonAccount):
 # Determine authorized OP groups for a Neon account
 #################################################################################
 def getOpGroups(neonAccount):
-    opGroups = set()  # using a set prevents duplicates
-
-    # Instructors and On-Duty volunteers might not be members, but still need
-    # access to Instructor's storage and clock in/out buttons, respectively
-    # ceramics_onduty gets the interior ceramics door but not exterior entry
-    #   so non-member volunteers can't get into the shop unsupervised via ceramics
-    if neonUtil.accountIsType(neonAccount, neonUtil.INSTRUCTOR_TYPE):
-        opGroups.add(GROUP_INSTRUCTORS)
-    if neonUtil.accountIsType(neonAccount, neonUtil.ONDUTY_TYPE):
-        opGroups.add(GROUP_ONDUTY)
-    if neonUtil.accountIsType(neonAccount, neonUtil.ONDUTY_TYPE_CERAMICS):
-        opGroups.add(GROUP_CERAMICS_ONDUTY)
-
-    # Board / Leaders / SuperStewards 24x7 access
-    if (
-        neonUtil.accountIsType(neonAccount, neonUtil.LEAD_TYPE)
-        or neonUtil.accountIsType(neonAccount, neonUtil.DIRECTOR_TYPE)
-        or neonUtil.accountIsType(neonAccount, neonUtil.SUPER_TYPE)
-    ):
-        opGroups.add(GROUP_MANAGEMENT)
-    elif neonUtil.accountIsType(neonAccount, neonUtil.STAFF_TYPE):
-        # non-leader staff have access to all areas during regular hours
-        opGroups.add(GROUP_SUBSCRIBERS)  # shop
-        opGroups.add(GROUP_STEWARDS)  # stewards storage
-        opGroups.add(GROUP_INSTRUCTORS)  # instructor storage
-        opGroups.add(GROUP_COWORKING)  # coworking
-        opGroups.add(GROUP_CERAMICS) #ceramics interior and exterior doors
-
-    # Other groups are effectively subsets of overall facility access
-    if neonUtil.accountHasFacilityAccess(neonAccount):
-        opGroups.add(GROUP_SUBSCRIBERS)
-        if neonUtil.subscriberHasCeramicsAccess(neonAccount):
-            opGroups.add(GROUP_CERAMICS)
-        if neonUtil.accountIsType(neonAccount, neonUtil.COWORKING_TYPE):
-            opGroups.add(GROUP_COWORKING)
-        if neonUtil.accountIsType(neonAccount, neonUtil.STEWARD_TYPE):
-            opGroups.add(GROUP_STEWARDS)
-        if neonUtil.accountHasShaperAccess(neonAccount):
-            opGroups.add(GROUP_SHAPER_ORIGIN)
-        if neonUtil.accountHasDominoAccess(neonAccount):
-            opGroups.add(GROUP_DOMINO)
-
-    return list(opGroups)
+    return groupsFromMask(groupMask(accountFacts(neonAccount)))
 
 
 #################################################################################
-# Given a Neon account and optionally an OpenPath user, perform necessary updates
+# Determine authorized OP groups for many Neon accounts in one pass
 #################################################################################
-def updateGroups(neonAccount, openPathGroups=None, email=False):
-    if not neonAccount.get("OpenPathID"):
-        logging.error("No OpenPathID found to update groups")
-        return
-
-    # this should be a pretty thorough check for sane argument
-    assert int(neonAccount.get("OpenPathID")) > 0
+def getOpGroupsForAccounts(neonAccounts: dict):
+    return {
+        accountId: groupsFromMask(groupMask(accountFacts(account)))
+        for accountId, account in neonAccounts.items()
+    }
 
-    if openPathGroups is None:
-        openPathGroups = getGroupsById(neonAccount.get("OpenPathID"))
 
-    neonOpGroups = getOpGroups(neonAccount)
+#################################################################################
+# Given a Neon account and its current OpenPath groups, return the current and
+# desired OpenPath group ID lists. Unmanaged groups are carried over unchanged.
+# opGroups is an optional precomputed getOpGroups() result
+#################################################################################
+def groupChanges(neonAccount, openPathGroups, opGroups=None):
+    if opGroups is None:
+        opGroups = getOpGroups(neonAccount)
+    neonOpGroups = list(opGroups)
 
     opGroupArray = []
     for group in openPathGroups:
@@ -324,31 +522,66 @@ def updateGroups(neonAccount, openPathGroups=None, email=False):
         neonOpGroups,
     )
 
-    # If the OP groups for this Neon account changed, update OP
-    if sorted(opGroupArray) != sorted(neonOpGroups):
-        # this should be a pretty thorough check for sane argument
-        assert int(neonAccount.get("OpenPathID")) > 0
-
-        logging.info(
-            "Updating OpenPath groups for %s (%s) %s",
-            neonAccount.get("fullName"),
-            neonAccount.get("Email 1"),
-            neonOpGroups,
+    return opGroupArray, neonOpGroups
+
+
+#################################################################################
+# Replace the OpenPath groups for a Neon account's OpenPath user
+#################################################################################
+def setGroups(neonAccount, groupIds):
+    # this should be a pretty thorough check for sane argument
+    assert int(neonAccount.get("OpenPathID")) > 0
+
+    logging.info(
+        "Updating OpenPath groups for %s (%s) %s",
+        neonAccount.get("fullName"),
+        neonAccount.get("Email 1"),
+        groupIds,
+    )
+    data = {"groupIds": groupIds}
+
+    url = O_baseURL + f"""/users/{neonAccount.get("OpenPathID")}/groupIds"""
+    logging.debug("PUT to %s %s", url, pformat(data))
+    if dryRun:
+        logging.warning("DryRun in openPathUtil.setGroups()")
+        return
+
+    response = getSession(url).put(url, json=data, headers=O_headers)
+    # an HTTPError keeps the response, so callers can tell a rejected request from a server error
+    response.raise_for_status()
+    if response.status_code != 204:
+        raise ValueError(
+            f"Put {url} returned status code {response.status_code}; expected 204"
         )
-        data = {"groupIds": neonOpGroups}
 
-        url = O_baseURL + f"""/users/{neonAccount.get("OpenPathID")}/groupIds"""
-        logging.debug("PUT to %s %s", url, pformat(data))
+    openPathDirectory.updateUser(
+        neonAccount.get("OpenPathID"),
+        {"groups": openPathDirectory.directoryGroups({"id": id} for id in groupIds)},
+    )
+
+
+#################################################################################
+# Given a Neon account and optionally an OpenPath user, perform necessary updates
+#################################################################################
+def updateGroups(neonAccount, openPathGroups=None, email=False, opGroups=None):
+    if not neonAccount.get("OpenPathID"):
+        logging.error("No OpenPathID found to update groups")
+        return
+
+    # this should be a pretty thorough check for sane argument
+    assert int(neonAccount.get("OpenPathID")) > 0
+
+    if openPathGroups is None:
+        openPathGroups = getGroupsById(neonAccount.get("OpenPathID"))
+
+    opGroupArray, neonOpGroups = groupChanges(neonAccount, openPathGroups, opGroups)
+
+    # If the OP groups for this Neon account changed, update OP
+    if sorted(opGroupArray) != sorted(neonOpGroups):
+        setGroups(neonAccount, neonOpGroups)
         if dryRun:
-            logging.warning("DryRun in openPathUtil.updateGroups()")
             return
 
-        response = requests.put(url, json=data, headers=O_headers)
-        if response.status_code != 204:
-            raise ValueError(
-                f"Put {url} returned status code {response.status_code}; expected 204"
-            )
-
         # TODO: SEND EMAIL
 
     if not email:
@@ -406,7 +639,7 @@ def createUser(neonAccount):
     url = O_baseURL + "/users"
     logging.debug("POST to %s %s", url, pformat(data))
     if not dryRun:
-        response = requests.post(url, json=data, headers=O_headers)
+        response = getSession(url).post(url, json=data, headers=O_headers)
         if response.status_code != 201:
             logging.error(
                 "Status %s (expected 201) creating OpenPath User %s\nResponse: %s",
@@ -442,7 +675,7 @@ def createUser(neonAccount):
             # ...confirmed that updating FirstName and LastName fixes initials and FullName too
             url = O_baseURL + f"""/users/{opUser.get("id")}"""
             logging.debug("PATCH to %s %s", url, pformat(data))
-            response = requests.patch(url, json=data, headers=O_headers)
+            response = getSession(url).patch(url, json=data, headers=O_headers)
             if response.status_code != 200:
                 raise ValueError(
                     f"Patch {url} returned status code {response.status_code}; expected 200"
@@ -451,6 +684,15 @@ def createUser(neonAccount):
             # at this point, we have refreshed the stale OP record as though it were newly created.
             # carry on the same whether the OP record is new new or a resurrected zombie record.
 
+        openPathDirectory.updateUser(
+            opUser.get("id"),
+            {
+                "externalId": neonAccount.get("Account ID"),
+                "identity": {"email": neonAccount.get("Email 1")},
+                "status": opUser.get("status"),
+            },
+        )
+
         # Update our local copy of the account so we don't have to fetch again
         neonAccount["OpenPathID"] = opUser.get("id")
         neonUtil.updateOpenPathID(neonAccount)
@@ -485,7 +727,7 @@ def createMobileCredential(neonAccount):
     if dryRun:
         logging.warning("DryRun in openPathUtil.createMobileCredential()")
         return
-    response = requests.post(url, json=data, headers=O_headers)
+    response = getSession(url).post(url, json=data, headers=O_headers)
     if response.status_code != 201:
         raise ValueError(
             f"Post {url} returned status code {response.status_code}; expected 201"
@@ -508,7 +750,7 @@ def createMobileCredential(neonAccount):
         + f'/users/{neonAccount.get("OpenPathID")}/credentials/{response.get("id")}/setupMobile'
     )
     logging.debug("POST to %s", url)
-    response = requests.post(url, headers=O_headers)
+    response = getSession(url).post(url, headers=O_headers)
     if response.status_code != 204:
         raise ValueError(
             f"Post {url} returned status code {response.status_code}; expected 204"
@@ -27,6 +27,8 @@ sys.modules['aws_ssm'] = SimpleNamespace(
     O_APIuser="test_openpath_user",
     G_user="test_gmail_user@test.com",
     G_password="test_gmail_password",
+    MJ_APIkey="test_mailjet_key",
+    MJ_APIsecret="test_mailjet_secret",
 )
 
 # Unit tests should not access the network
@@ -36,18 +38,34 @@ def _no_network():
         yield
 
 
+# Unit tests should not read or write the real Neon account snapshot or OpenPath user directory
+@pytest.fixture(autouse=True)
+def _isolated_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setenv("NEON_SNAPSHOT_PATH", str(tmp_path / "neonAccounts.db"))
+    monkeypatch.setenv("OPENPATH_DIRECTORY_PATH", str(tmp_path / "openPathUsers.db"))
+
+
+# Mocked API calls don't need pacing to stay under the real APIs' rate limits
+@pytest.fixture(autouse=True)
+def _unthrottled_apis(monkeypatch):
+    from helpers import sessions
+    from helpers.rateLimiter import AdaptiveRateLimiter
+    for host in (sessions.NEON_HOST, sessions.OPENPATH_HOST):
+        monkeypatch.setitem(sessions._limiters, host, AdaptiveRateLimiter(rate=1_000_000))
+
+
 # ============================================================================
 # Shared fixtures for mocking external services
 # ============================================================================
 
 @pytest.fixture
 def mock_ssm(mocker):
-    """Mock AWS SSM client used by mailjetUtil for fetching API keys."""
+    """Mock AWS SSM client.  mailjetUtil reads its keys from the aws_ssm stand-in above."""
     mock_ssm_client = mocker.MagicMock()
     mock_ssm_client.get_parameters.return_value = {
         "Parameters": [
-            {"Value": "test_mailjet_key"},
-            {"Value": "test_mailjet_secret"},
+            {"Name": "/mailjet/api_key", "Value": "test_mailjet_key"},
+            {"Name": "/mailjet/api_secret", "Value": "test_mailjet_secret"},
         ]
     }
     mocker.patch('boto3.client', return_value=mock_ssm_client)
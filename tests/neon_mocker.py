@@ -18,11 +18,21 @@ from datetime import timedelta
 
 
 # resets history, calls fn, then asserts each request occurred in order
-def assert_history(requests_mock, fn, expected_history):
+def assert_history(requests_mock, fn, expected_history, concurrent_prefix=0, ordered=True):
+    """
+    The first concurrent_prefix requests are made in parallel, so their order is not checked.
+    With ordered=False only the set of requests is checked, not their order.
+    """
     requests_mock.reset_mock() # reset history
     fn()
     # Strip query params for comparison (use base URL only)
     history = [(r.method, r.url.split('?')[0]) for r in requests_mock.request_history]
+    if not ordered:
+        assert sorted(history) == sorted(expected_history)
+        return
+    if concurrent_prefix:
+        assert sorted(history[:concurrent_prefix]) == sorted(expected_history[:concurrent_prefix])
+        history = expected_history[:concurrent_prefix] + history[concurrent_prefix:]
     for i, expected in enumerate(expected_history):
         assert expected == history[i]
     assert len(history) == len(expected_history)
@@ -45,6 +45,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "alta_open_lambda"))
 import lambda_function as lf
 
 
+@pytest.fixture(autouse=True)
+def _cold_start():
+    """Each test starts from a cold container so warm caches never leak between tests."""
+    lf._warm_cache.clear()
+    lf.coalescer = lf.Coalescer()
+    yield
+    lf._warm_cache.clear()
+
+
 @pytest.fixture
 def openpath(mocker):
     """Mock the OpenPath update so we only exercise webhook parsing."""
@@ -234,11 +243,11 @@ def legacy_create_membership(enrollment_type, transaction_status, account_id=Non
 @pytest.mark.parametrize("enrollment_type", ["JOIN", "REJOIN"])
 def test_legacy_successful_join_enters_join_path(openpath, neon_account, enrollment_type):
     # A successful JOIN/REJOIN runs handle_joins (which fetches the account)
-    # before the usual OpenPath update.
+    # and hands the account to the usual OpenPath update.
     account_id = rand_id()
     lf.lambda_handler(legacy_create_membership(enrollment_type, "SUCCEEDED", account_id), {})
     neon_account.assert_called_once_with(id=account_id)
-    openpath.assert_called_once_with(account_id)
+    openpath.assert_called_once_with(account_id, account=neon_account.return_value)
 
 
 def test_legacy_renew_skips_join_path(openpath, neon_account):
@@ -510,7 +519,7 @@ def new_create_membership(enroll_type, status, account_id=None, custom_parameter
     # Mirrors the real flat payload; PII (names, card token/last-four) is replaced
     # with obvious fakes. Only accountId/enrollType/status drive handler behavior,
     # but the surrounding structure (nested creditCardOnline.id, paymentStatus)
-    # keeps the find_key_bfs lookups honest against a realistic shape.
+    # keeps the field extraction honest against a realistic shape.
     account_id = str(rand_id()) if account_id is None else account_id
     return make_event(
         "createMembership",
@@ -566,7 +575,7 @@ def test_new_successful_join_enters_join_path(openpath, neon_account, enroll_typ
     account_id = str(rand_id())
     lf.lambda_handler(new_create_membership(enroll_type, "SUCCEEDED", account_id, params), {})
     neon_account.assert_called_once_with(id=account_id)
-    openpath.assert_called_once_with(account_id)
+    openpath.assert_called_once_with(account_id, account=neon_account.return_value)
 
 
 @pytest.mark.parametrize("params", NEW_PARAM_VARIANTS)
@@ -597,3 +606,216 @@ def test_new_fresh_join_adds_to_mailjet(openpath, neon_account, mailjet, params)
     account_id = str(rand_id())
     lf.lambda_handler(new_create_membership("JOIN", "SUCCEEDED", account_id, params), {})
     mailjet.assert_called_once()
+
+
+# ===========================================================================
+# Warm-start caches
+# ===========================================================================
+
+
+def mailjet_lists_response():
+    return (
+        b'{"Count": 2, "Total": 2, "Data": ['
+        b'{"ID": 11, "Name": "NewMembers", "IsDeleted": false, "SubscriberCount": 0, "CreatedAt": "2024-01-01T00:00:00Z"},'
+        b'{"ID": 22, "Name": "AllContacts", "IsDeleted": false, "SubscriberCount": 0, "CreatedAt": "2024-01-01T00:00:00Z"}]}'
+    )
+
+
+def test_warm_invocations_reuse_mailjet_service(mocker, mock_mailjet):
+    mock_mailjet.contactslist.get.return_value.content = mailjet_lists_response()
+    credentials = mocker.spy(lf, "get_mailjet_credentials")
+
+    first = lf.get_cached_mailjet_service()
+    second = lf.get_cached_mailjet_service()
+
+    assert first is second
+    assert (first.new_members_list_id, first.all_contacts_list_id) == (11, 22)
+    credentials.assert_called_once()
+    mock_mailjet.contactslist.get.assert_called_once()
+
+
+def test_unresolved_list_ids_are_retried(mocker, mock_mailjet):
+    credentials = mocker.spy(lf, "get_mailjet_credentials")
+
+    # the default mock has no lists, so each call retries the lookup...
+    lf.get_cached_mailjet_service()
+    lf.get_cached_mailjet_service()
+    assert mock_mailjet.contactslist.get.call_count == 2
+
+    # ...until it succeeds, after which warm calls skip it
+    mock_mailjet.contactslist.get.return_value.content = mailjet_lists_response()
+    lf.get_cached_mailjet_service()
+    lf.get_cached_mailjet_service()
+    assert mock_mailjet.contactslist.get.call_count == 3
+    credentials.assert_called_once()
+
+
+def test_cache_expires_after_ttl(mocker):
+    clock = mocker.patch.object(lf.time, "monotonic", return_value=1000.0)
+    cache = lf.TTLCache(datetime.timedelta(seconds=60))
+    load = mocker.Mock(side_effect=["first", "second"])
+
+    assert cache.get("key", load) == "first"
+    clock.return_value = 1059.0
+    assert cache.get("key", load) == "first"
+    clock.return_value = 1061.0
+    assert cache.get("key", load) == "second"
+    assert load.call_count == 2
+
+
+# ===========================================================================
+# Coalescing
+# ===========================================================================
+
+
+def event_at(event_trigger, account_id, timestamp):
+    event = json.loads(make_event(event_trigger, {"accountId": account_id}, NULL_PARAMS)["body"])
+    event["eventTimestamp"] = timestamp.isoformat()
+    return {"body": json.dumps(event)}
+
+
+def test_burst_for_one_account_reconciles_once(openpath):
+    account_id = str(rand_id())
+    fired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=10)
+
+    lf.lambda_handler(event_at("editAccount", account_id, fired), {})
+    lf.lambda_handler(event_at("updateMembership", account_id, fired), {})
+    lf.lambda_handler(event_at("editAccount", account_id, fired + datetime.timedelta(seconds=1)), {})
+
+    openpath.assert_called_once_with(account_id)
+    assert lf.coalescer.store.get(account_id).merged == 2
+
+
+def test_event_after_reconcile_started_is_not_merged(openpath):
+    account_id = str(rand_id())
+    fired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=10)
+
+    lf.lambda_handler(event_at("editAccount", account_id, fired), {})
+    # fired after the first reconcile read Neon, so it may carry a change it missed
+    later = datetime.datetime.now(datetime.timezone.utc)
+    lf.lambda_handler(event_at("editAccount", account_id, later), {})
+
+    assert openpath.call_count == 2
+
+
+def test_other_accounts_are_not_merged(openpath):
+    fired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=10)
+    lf.lambda_handler(event_at("editAccount", "1", fired), {})
+    lf.lambda_handler(event_at("editAccount", "2", fired), {})
+    assert openpath.call_count == 2
+
+
+def test_failed_reconcile_is_not_recorded(openpath):
+    account_id = str(rand_id())
+    fired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=10)
+    openpath.side_effect = [ValueError("OpenPath down"), None]
+
+    with pytest.raises(ValueError):
+        lf.lambda_handler(event_at("editAccount", account_id, fired), {})
+    lf.lambda_handler(event_at("editAccount", account_id, fired), {})
+
+    assert openpath.call_count == 2
+
+
+def test_reconciles_expire_after_window():
+    coalescer = lf.Coalescer(window=datetime.timedelta(seconds=30))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    coalescer.record("1", now - datetime.timedelta(seconds=31))
+
+    assert not coalescer.already_reconciled("1", now - datetime.timedelta(seconds=40))
+    assert coalescer.store.get("1") is None
+
+
+# ===========================================================================
+# SQS batches
+# ===========================================================================
+
+
+def sqs_batch(*bodies):
+    return {
+        "Records": [
+            {"messageId": f"msg-{i}", "body": body} for i, body in enumerate(bodies)
+        ]
+    }
+
+
+@pytest.fixture
+def daytime(monkeypatch):
+    monkeypatch.setattr(lf, "in_maintenance_window", lambda: False)
+
+
+def test_batch_reconciles_each_account_once(openpath, daytime):
+    fired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=10)
+    batch = sqs_batch(
+        event_at("editAccount", "1", fired)["body"],
+        event_at("updateMembership", "1", fired)["body"],
+        event_at("editAccount", "2", fired)["body"],
+    )
+
+    assert lf.batch_handler(batch, {}) == {"batchItemFailures": []}
+    assert sorted(call.args[0] for call in openpath.call_args_list) == ["1", "2"]
+
+
+def test_batch_reports_only_failed_records(openpath, daytime):
+    fired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=10)
+
+    def update(neon_id):
+        if neon_id == "2":
+            raise ValueError("OpenPath down")
+
+    openpath.side_effect = update
+    batch = sqs_batch(
+        event_at("editAccount", "1", fired)["body"],
+        event_at("editAccount", "2", fired)["body"],
+        "not json",
+        event_at("updateMembership", "2", fired)["body"],
+    )
+
+    result = lf.batch_handler(batch, {})
+
+    assert sorted(f["itemIdentifier"] for f in result["batchItemFailures"]) == ["msg-1", "msg-2", "msg-3"]
+
+
+def test_batch_skips_records_without_an_account(openpath, daytime):
+    batch = sqs_batch(json.dumps({"eventTrigger": "editAccount", "data": {}}))
+    assert lf.batch_handler(batch, {}) == {"batchItemFailures": []}
+    openpath.assert_not_called()
+
+
+def test_batch_deferred_during_maintenance(openpath, monkeypatch):
+    monkeypatch.setattr(lf, "in_maintenance_window", lambda: True)
+    batch = sqs_batch(event_at("editAccount", "1", datetime.datetime.now(datetime.timezone.utc))["body"])
+
+    assert lf.batch_handler(batch, {}) == {"batchItemFailures": [{"itemIdentifier": "msg-0"}]}
+    openpath.assert_not_called()
+
+
+def fresh_join(neon_account):
+    """A batch with one successful JOIN for account 1, whose only membership starts today."""
+    today = datetime.datetime.now(lf.TZ).date()
+    neon_account.return_value = {
+        "membershipDates": {today.isoformat(): [(today + datetime.timedelta(days=30)).isoformat()]}
+    }
+    return sqs_batch(new_create_membership("JOIN", "SUCCEEDED", "1")["body"])
+
+
+def test_batch_joins_fetch_the_account_once(openpath, neon_account, mailjet, daytime):
+    assert lf.batch_handler(fresh_join(neon_account), {}) == {"batchItemFailures": []}
+
+    neon_account.assert_called_once_with(id="1")
+    openpath.assert_called_once_with("1", account=neon_account.return_value)
+    mailjet.assert_called_once()
+
+
+def test_batch_mailjet_failure_does_not_fail_the_join(openpath, neon_account, mailjet, daytime):
+    mailjet.side_effect = RuntimeError("Mailjet down")
+
+    assert lf.batch_handler(fresh_join(neon_account), {}) == {"batchItemFailures": []}
+    openpath.assert_called_once()
+
+
+def test_batch_failed_reconcile_skips_mailjet(openpath, neon_account, mailjet, daytime):
+    openpath.side_effect = ValueError("OpenPath down")
+
+    assert lf.batch_handler(fresh_join(neon_account), {}) == {"batchItemFailures": [{"itemIdentifier": "msg-0"}]}
+    mailjet.assert_not_called()
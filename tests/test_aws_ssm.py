@@ -0,0 +1,106 @@
+import importlib.util
+import os
+import sys
+import stat
+from pathlib import Path
+
+import pytest
+
+# conftest replaces aws_ssm in sys.modules, so load the real module from its file
+AWS_SSM_PATH = Path(__file__).parent.parent / "aws_ssm.py"
+
+
+def ssmResponse(names, InvalidParameters=None):
+    return {
+        "Parameters": [{"Name": name, "Value": f"value of {name}"} for name in reversed(names)],
+        "InvalidParameters": InvalidParameters or [],
+    }
+
+
+@pytest.fixture
+def ssmClient(mocker):
+    client = mocker.MagicMock()
+    client.get_parameters.side_effect = lambda Names, WithDecryption: ssmResponse(Names)
+    mocker.patch("boto3.client", return_value=client)
+    return client
+
+
+@pytest.fixture
+def awsSsm(monkeypatch):
+    monkeypatch.delenv("SSM_CACHE_PATH", raising=False)
+    spec = importlib.util.spec_from_file_location("aws_ssm_under_test", AWS_SSM_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_import_does_not_fetch(ssmClient, awsSsm):
+    ssmClient.get_parameters.assert_not_called()
+
+
+def test_access_fetches_only_that_service_by_name(ssmClient, awsSsm):
+    #values come back in reverse order, so positional lookup would swap them
+    assert awsSsm.N_APIkey == "value of /neon/api_key"
+    assert awsSsm.N_APIuser == "value of /neon/api_user"
+
+    ssmClient.get_parameters.assert_called_once_with(
+        Names=["/neon/api_key", "/neon/api_user"], WithDecryption=True
+    )
+
+
+def test_mailjet_keys_fetched_together_by_name(ssmClient, awsSsm):
+    assert awsSsm.MJ_APIsecret == "value of /mailjet/api_secret"
+    assert awsSsm.MJ_APIkey == "value of /mailjet/api_key"
+
+    ssmClient.get_parameters.assert_called_once_with(
+        Names=["/mailjet/api_key", "/mailjet/api_secret"], WithDecryption=True
+    )
+
+
+def test_prefetch_batches_services(ssmClient, awsSsm):
+    awsSsm.prefetch("N_APIkey", "O_APIkey")
+    assert awsSsm.O_APIuser == "value of /altaopen/api_user"
+    assert awsSsm.N_APIuser == "value of /neon/api_user"
+    assert ssmClient.get_parameters.call_count == 1
+
+
+def test_from_import_works(ssmClient, awsSsm, monkeypatch):
+    monkeypatch.setitem(sys.modules, "aws_ssm_under_test", awsSsm)
+    from aws_ssm_under_test import D_APIkey
+    assert D_APIkey == "value of /discourse/api_key"
+
+
+def test_unknown_attribute(awsSsm):
+    with pytest.raises(AttributeError):
+        awsSsm.NOT_A_SECRET
+
+
+def test_missing_parameter_raises(ssmClient, awsSsm):
+    ssmClient.get_parameters.side_effect = lambda Names, WithDecryption: ssmResponse([], InvalidParameters=Names)
+    with pytest.raises(ValueError):
+        awsSsm.G_user
+
+
+def test_disk_cache_shared_between_processes(ssmClient, awsSsm, tmp_path, monkeypatch):
+    cachePath = tmp_path / "ssm.json"
+    monkeypatch.setenv("SSM_CACHE_PATH", str(cachePath))
+
+    assert awsSsm.G_user == "value of /gmail/user"
+    assert stat.S_IMODE(os.stat(cachePath).st_mode) == 0o600
+
+    #a fresh process starts with an empty in-process cache
+    awsSsm.clearCache()
+    assert awsSsm.G_password == "value of /gmail/password"
+    assert ssmClient.get_parameters.call_count == 1
+
+
+def test_disk_cache_expires(ssmClient, awsSsm, tmp_path, monkeypatch):
+    monkeypatch.setenv("SSM_CACHE_PATH", str(tmp_path / "ssm.json"))
+    monkeypatch.setenv("SSM_CACHE_TTL", "60")
+
+    awsSsm.G_user
+    awsSsm.clearCache()
+    now = awsSsm.time.time()
+    monkeypatch.setattr(awsSsm.time, "time", lambda: now + 61)
+    awsSsm.G_user
+    assert ssmClient.get_parameters.call_count == 2
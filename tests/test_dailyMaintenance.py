@@ -88,3 +88,33 @@ class TestDailyMaintenance:
         # only the newsteward is added, not BobSmith
         assert modify['add_stewards'].last_request.body == "usernames=newsteward"
         assert not modify['rm_stewards'].called
+
+    def test_prefetched_state_is_fetched_once(self, requests_mock):
+        """OpenPath users and Discourse groups are prefetched alongside the Neon sync
+        and handed to the updaters, so each is only read once per cycle."""
+        NeonUserMock.mock_search(requests_mock, [NeonUserMock()])
+        openpath_mock = requests_mock.get(
+            f'{O_baseURL}/users',
+            json={"data": [], "totalCount": 0}
+        )
+
+        import dailyMaintenance
+        dailyMaintenance.main()
+
+        assert openpath_mock.call_count == 1
+        for group in ['makers', 'stewards', 'leadership', 'sysops']:
+            assert self.mock_discourse[group].call_count == 1, group
+
+    def test_failed_prefetch_does_not_block_other_services(self, requests_mock, mocker):
+        """A failing OpenPath read or Mailjet-only Neon search shouldn't stop Discourse or Mailjet"""
+        NeonUserMock.mock_search(requests_mock, [NeonUserMock()])
+        requests_mock.get(f'{O_baseURL}/users', status_code=500)
+        mocker.patch('dailyMaintenance.get_mailjet_neon_lookups', side_effect=ValueError("search failed"))
+        run_mailjet = mocker.patch('dailyMaintenance.run_mailjet_maintenance')
+
+        import dailyMaintenance
+        dailyMaintenance.main()
+
+        assert self.mock_discourse['makers'].called
+        assert run_mailjet.called
+        assert run_mailjet.call_args.args[1] is None
@@ -0,0 +1,73 @@
+import discourseUpdateGroups
+from discourseUtil import D_baseURL, GROUP_IDS
+from neonUtil import STAFF_TYPE, STEWARD_TYPE
+
+
+def account(id, did=None, valid=False, types=()):
+    act = {
+        "Account ID": str(id),
+        "First Name": "First",
+        "Last Name": f"Last{id}",
+        "validMembership": valid,
+        "individualTypes": [{"name": t} for t in types],
+    }
+    if did is not None:
+        act["DiscourseID"] = did
+    return act
+
+
+def mock_group_changes(requests_mock):
+    modify = {}
+    for name, gid in GROUP_IDS.items():
+        modify[f'add_{name}'] = requests_mock.put(f'{D_baseURL}/groups/{gid}/members.json',
+            json={"success": "OK", "usernames": [], "emails": []})
+        modify[f'rm_{name}'] = requests_mock.delete(f'{D_baseURL}/groups/{gid}/members.json',
+            json={"success": "OK", "usernames": [], "skipped_usernames": []})
+    return modify
+
+
+def test_buildDiscourseIndex_groups_shared_and_missing_ids():
+    accounts = {
+        "1": account(1, "alice"),
+        "2": account(2, "alice"),
+        "3": account(3, ""),
+        "4": account(4),
+    }
+
+    index = discourseUpdateGroups.buildDiscourseIndex(accounts)
+
+    assert [a["Account ID"] for a in index["alice"]] == ["1", "2"]
+    assert [a["Account ID"] for a in index[None]] == ["3", "4"]
+
+
+def test_updateMakers_keeps_maker_with_any_active_account(requests_mock):
+    modify = mock_group_changes(requests_mock)
+    accounts = {
+        # duplicate Neon accounts sharing a Discourse ID; only one is active
+        "1": account(1, "alice", valid=False),
+        "2": account(2, "alice", valid=True),
+        "3": account(3, "bob", valid=False),
+        "4": account(4, "carol", types=[STAFF_TYPE]),
+        "5": account(5, "dave", valid=True),
+    }
+    makers = {name: {"name": name} for name in ("alice", "bob", "carol", "zed")}
+
+    discourseUpdateGroups.updateMakers(accounts, makers=makers)
+
+    assert modify['add_makers'].last_request.body == "usernames=dave"
+    removed = set(modify['rm_makers'].last_request.body.removeprefix("usernames=").split("%2C"))
+    assert removed == {"bob", "zed"}
+
+
+def test_discourseUpdateGroups_reads_prefetched_groups(requests_mock, mock_discourse):
+    modify = mock_group_changes(requests_mock)
+    accounts = {
+        "1": account(1, "alice", valid=True, types=[STEWARD_TYPE]),
+        "2": account(2, valid=True, types=[STEWARD_TYPE]),
+    }
+    groupMembers = {group: {} for group in discourseUpdateGroups.SYNCED_GROUPS}
+
+    discourseUpdateGroups.discourseUpdateGroups(accounts, groupMembers=groupMembers)
+
+    assert not any(m.called for m in mock_discourse.values())
+    assert modify['add_stewards'].last_request.body == "usernames=alice"
@@ -0,0 +1,76 @@
+from collections import deque
+
+import pytest
+
+from alta_open_lambda.extractors import TRIGGER_PATHS, extract, find_keys
+
+
+def bfs(d, target_key):
+    """The per-key breadth-first search the extractors replace, kept as the reference."""
+    queue = deque([d])
+    while queue:
+        current = queue.popleft()
+        if not isinstance(current, dict):
+            continue
+        if target_key in current:
+            return current[target_key]
+        for value in current.values():
+            if isinstance(value, dict):
+                queue.append(value)
+            elif isinstance(value, list):
+                queue.extend(item for item in value if isinstance(item, dict))
+    return None
+
+
+LEGACY_CREATE = {
+    "membershipEnrollment": {"accountId": 9058, "membershipId": 1, "enrollmentType": "JOIN"},
+    "transaction": {
+        "transactionId": 2,
+        "transactionStatus": "SUCCEEDED",
+        "payments": {"payment": [{"paymentId": 3, "status": "nested"}]},
+    },
+}
+
+NEW_CREATE = {
+    "id": "1",
+    "accountId": "1877",
+    "membershipLevel": {"id": "1", "name": "Regular Membership"},
+    "enrollType": "JOIN",
+    "status": "SUCCEEDED",
+    "payments": [{"id": "2", "paymentStatus": "Succeeded", "creditCardOnline": {"id": 3}}],
+}
+
+NEW_EDIT = {"eventTrigger": "editAccount", "data": {"individualAccount": {"accountId": "12", "primaryContact": {"contactId": "99"}}}}
+LEGACY_UPDATE = {"eventTrigger": "updateMembership", "data": {"membershipEnrollment": {"accountId": 7}, "transaction": {"transactionStatus": "SUCCEEDED"}}}
+NEW_UPDATE = {"eventTrigger": "updateMembership", "data": {"accountId": "8", "status": "SUCCEEDED", "payments": [{"id": "1"}]}}
+
+
+@pytest.mark.parametrize("trigger, payload", [
+    ("createMembership", LEGACY_CREATE),
+    ("createMembership", NEW_CREATE),
+    ("editAccount", NEW_EDIT),
+    ("updateMembership", LEGACY_UPDATE),
+    ("updateMembership", NEW_UPDATE),
+])
+def test_precompiled_paths_match_bfs(trigger, payload):
+    keys = list(TRIGGER_PATHS[trigger])
+    assert extract(trigger, payload, keys) == {key: bfs(payload, key) for key in keys}
+
+
+def test_find_keys_matches_bfs_for_every_key():
+    keys = ["accountId", "id", "status", "paymentStatus", "name", "transactionStatus", "missing"]
+    for payload in (LEGACY_CREATE, NEW_CREATE, NEW_EDIT):
+        found = find_keys(payload, keys)
+        assert {key: found.get(key) for key in keys} == {key: bfs(payload, key) for key in keys}
+
+
+def test_find_keys_omits_missing_and_keeps_explicit_none():
+    assert find_keys({"a": None, "b": {"c": 1}}, ["a", "c", "d"]) == {"a": None, "c": 1}
+
+
+def test_unknown_shape_falls_back_to_scan():
+    # a reshaped payload misses the precompiled path but is still found
+    payload = {"data": {"account": {"individualAccount": {"accountId": "5"}}}}
+    assert extract("editAccount", payload, ["accountId"]) == {"accountId": "5"}
+    assert extract("mergedAccount", {"data": {"matchedAccountId": "6"}}, ["matchedAccountId"]) == {"matchedAccountId": "6"}
+    assert extract("editAccount", {"data": {}}, ["accountId"]) == {"accountId": None}
@@ -1,3 +1,5 @@
+import datetime
+import json
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
@@ -9,7 +11,14 @@ from mailjetUtil import (
     MJCredentials,
     Subscriber,
     MailjetAction,
+    MJNeonLookups,
+    get_mailjet_neon_accounts,
+    update_mj_all_contacts_list,
+    BulkJobReport,
+    run_mailjet_maintenance,
+    get_mailjet_service,
 )
+from neonUtil import N_baseURL
 
 
 @pytest.fixture(autouse=True)
@@ -318,3 +327,343 @@ class TestSubscriberModel:
         )
 
         assert subscriber.full_name == "John Doe"
+
+
+class TestGetMailjetNeonAccounts:
+    """Tests for deriving the Mailjet population from the getRealAccounts() dict"""
+
+    def test_members_come_from_account_dict(self, requests_mock):
+        search = requests_mock.post(f"{N_baseURL}/accounts/search")
+        neon_accounts = {
+            "1": {"Account ID": "1", "Email 1": "a@example.com", "Membership Expiration Date": "2025-01-01"},
+            "2": {"Account ID": "2", "Email 1": "b@example.com", "Membership Expiration Date": "2025-01-01"},
+            "3": {"Account ID": "3", "Email 1": "c@example.com", "Membership Expiration Date": "1970-01-01"},
+            "4": {"Account ID": "4", "Email 1": None, "Membership Expiration Date": "2025-01-01"},
+            "5": {"Account ID": "5", "Email 1": "e@example.com", "Membership Expiration Date": "2025-01-01",
+                  "Account Type": "Organization"},
+        }
+        lookups = MJNeonLookups(
+            non_member_accts={"6": {"Account ID": "6", "Email 1": "f@example.com"}},
+            opted_out_member_ids={"2"},
+        )
+
+        accounts = get_mailjet_neon_accounts(neon_accounts, lookups)
+
+        assert set(accounts) == {"1", "6"}
+        assert not search.called
+
+    def test_only_non_member_and_opt_out_searches_run(self, requests_mock):
+        search = requests_mock.post(
+            f"{N_baseURL}/accounts/search",
+            json={"searchResults": [], "pagination": {"totalPages": 1}},
+        )
+
+        get_mailjet_neon_accounts({})
+
+        assert search.call_count == 3
+        for request in search.request_history:
+            fields = {f["field"]: f["operator"] for f in request.json()["searchFields"]}
+            assert "Most Recent Membership Only" not in fields
+            if fields["Membership Expiration Date"] == "NOT_BLANK":
+                assert fields["Email Opt-Out"] == "NOT_EQUAL"
+
+
+def mock_json_response(status_code, body):
+    response = Mock()
+    response.status_code = status_code
+    response.content = json.dumps(body).encode()
+    response.json.return_value = body
+    return response
+
+
+class TestUpdateAllContactsListDiff:
+    """Tests for the diff-based all contacts list sync"""
+
+    @pytest.fixture
+    def mailjet_list(self, mj_service, mock_mailjet_client):
+        """
+        Current list: alice (up to date), bob (stale name), carol (no longer in Neon).
+        The contacts are years old, but all joined the list on 2024-01-01.
+        """
+        contacts = [(1, "alice@example.com"), (2, "bob@example.com"), (3, "carol@example.com")]
+        mock_mailjet_client.contact.get.return_value = mock_json_response(200, {
+            "Count": 3, "Total": 3,
+            "Data": [
+                {"ID": id, "Email": email, "Name": "", "CreatedAt": "2019-01-01T00:00:00Z",
+                 "IsExcludedFromCampaigns": False}
+                for id, email in contacts
+            ],
+        })
+        mock_mailjet_client.listrecipient.get.side_effect = lambda filters: mock_json_response(200, {
+            "Count": 1, "Total": 1,
+            "Data": [{"ContactID": filters["Contact"], "ListID": filters["ContactsList"],
+                      "SubscribedAt": "2024-01-01T00:00:00Z"}],
+        })
+
+        def props(id, first, last):
+            return {"ContactID": id, "ID": id, "Data": [
+                {"Name": "first_name", "Value": first},
+                {"Name": "last_name", "Value": last},
+                {"Name": "signed_waiver", "Value": True},
+                {"Name": "latest_membership_end", "Value": "2025-06-01T05:00:00Z"},
+            ]}
+        mock_mailjet_client.contactdata.get.return_value = mock_json_response(200, {
+            "Count": 3, "Total": 3,
+            "Data": [props(1, "Alice", "A"), props(2, "Bobby", "B"), props(3, "Carol", "C")],
+        })
+        mock_mailjet_client.contact_managemanycontacts.create.side_effect = [
+            mock_json_response(201, {"Data": [{"JobID": 1}]}),
+            mock_json_response(201, {"Data": [{"JobID": 2}]}),
+        ]
+        mock_mailjet_client.contact_managemanycontacts.get.return_value = mock_json_response(
+            200, {"Data": [{"Status": "Completed"}]}
+        )
+        mj_service.all_contacts_list_id = 456
+        return mj_service
+
+    @staticmethod
+    def neon_account(id, email, first, last):
+        return {
+            "Account ID": str(id),
+            "Email 1": email,
+            "First Name": first,
+            "Last Name": last,
+            "WaiverDate": "01/01/2024",
+            "Membership Expiration Date": "2025-06-01T00:00:00-05:00",
+        }
+
+    def test_only_deltas_are_submitted(self, mailjet_list, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_MAX_REMOVAL_FRACTION", 0.5)
+        neon_accounts = {
+            "1": self.neon_account(1, "Alice@example.com", "Alice", "A"),
+            "2": self.neon_account(2, "bob@example.com", "Bob", "B"),
+            "4": self.neon_account(4, "dave@example.com", "Dave", "D"),
+        }
+
+        report = update_mj_all_contacts_list(mailjet_list, neon_accounts, sleep=lambda s: None)
+
+        assert report.completed_jobs == [1, 2]
+        assert report.ok
+        upsert, remove = [c.kwargs["data"] for c in mock_mailjet_client.contact_managemanycontacts.create.call_args_list]
+        assert [c["Email"] for c in upsert["Contacts"]] == ["bob@example.com", "dave@example.com"]
+        assert upsert["ContactsLists"] == [{"ListID": 456, "Action": "addnoforce"}]
+        assert [c["Email"] for c in remove["Contacts"]] == ["carol@example.com"]
+        assert remove["ContactsLists"] == [{"ListID": 456, "Action": "remove"}]
+
+    def test_contacts_added_after_neon_pull_are_kept(self, mailjet_list, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_MAX_REMOVAL_FRACTION", 0.5)
+        neon_accounts = {
+            "1": self.neon_account(1, "alice@example.com", "Alice", "A"),
+            "2": self.neon_account(2, "bob@example.com", "Bobby", "B"),
+        }
+
+        # carol's contact is older than this Neon pull, but she joined the list after it started
+        report = update_mj_all_contacts_list(
+            mailjet_list, neon_accounts, sleep=lambda s: None,
+            neon_pulled_at=datetime.datetime(2023, 12, 31, tzinfo=datetime.timezone.utc),
+        )
+
+        assert report == BulkJobReport()
+        assert not mock_mailjet_client.contact_managemanycontacts.create.called
+        assert mock_mailjet_client.listrecipient.get.call_args.kwargs["filters"] == {"ContactsList": 456, "Contact": 3}
+
+    def test_contacts_on_list_before_neon_pull_are_removed(self, mailjet_list, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_MAX_REMOVAL_FRACTION", 0.5)
+        neon_accounts = {
+            "1": self.neon_account(1, "alice@example.com", "Alice", "A"),
+            "2": self.neon_account(2, "bob@example.com", "Bobby", "B"),
+        }
+
+        report = update_mj_all_contacts_list(
+            mailjet_list, neon_accounts, sleep=lambda s: None,
+            neon_pulled_at=datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc),
+        )
+
+        assert report.completed_jobs == [1]
+        remove = mock_mailjet_client.contact_managemanycontacts.create.call_args.kwargs["data"]
+        assert [c["Email"] for c in remove["Contacts"]] == ["carol@example.com"]
+
+    def test_mass_removal_is_capped(self, mailjet_list, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_MAX_REMOVAL_FRACTION", 0.4)
+        neon_accounts = {"1": self.neon_account(1, "alice@example.com", "Alice", "A")}
+
+        report = update_mj_all_contacts_list(mailjet_list, neon_accounts, sleep=lambda s: None)
+
+        # bob and carol would be 2 of 3 contacts; only one goes this sync
+        remove = mock_mailjet_client.contact_managemanycontacts.create.call_args.kwargs["data"]
+        assert [c["Email"] for c in remove["Contacts"]] == ["bob@example.com"]
+        assert report.deferred_removals == ["carol@example.com"]
+
+    def test_deferred_removals_are_emailed(self, mailjet_list, mocker):
+        send = mocker.patch("mailjetUtil.gmailUtil.sendMIMEmessage")
+        neon_accounts = {"1": self.neon_account(1, "alice@example.com", "Alice", "A")}
+        mocker.patch("mailjetUtil.get_mailjet_neon_accounts", return_value=neon_accounts)
+
+        run_mailjet_maintenance(neon_accounts, list_state=(mailjet_list, None), mail_alerts=True)
+
+        message = send.call_args.args[0]
+        assert message["To"] == "membership@asmbly.org"
+        assert "bob@example.com" in message.get_payload()
+        assert "carol@example.com" in message.get_payload()
+
+    def test_no_removals_for_empty_neon_pull(self, mailjet_list, mock_mailjet_client):
+        report = update_mj_all_contacts_list(mailjet_list, {}, sleep=lambda s: None)
+
+        assert report.completed_jobs == []
+        assert report.deferred_removals == ["alice@example.com", "bob@example.com", "carol@example.com"]
+        assert not mock_mailjet_client.contact_managemanycontacts.create.called
+
+
+class TestIterContactsInList:
+    """Tests for paged list reads"""
+
+    @staticmethod
+    def page_responder(total, page_size, fail_offset=None):
+        def respond(filters):
+            offset = filters["offset"]
+            if offset == fail_offset:
+                return mock_json_response(500, {"ErrorMessage": "boom"})
+            ids = range(offset, min(offset + page_size, total))
+            return mock_json_response(200, {
+                "Count": len(ids), "Total": total,
+                "Data": [{"ContactID": i, "ID": i, "Data": [{"Name": "first_name", "Value": f"c{i}"}]} for i in ids],
+            })
+        return respond
+
+    def test_streams_all_pages_in_order(self, mj_service, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_PAGE_SIZE", 10)
+        mock_mailjet_client.contactdata.get.side_effect = self.page_responder(total=45, page_size=10)
+
+        contacts = mj_service.iter_contacts_in_list(456)
+
+        assert next(contacts).first_name == "c0"
+        assert [c.id_ for c in contacts] == list(range(1, 45))
+        offsets = sorted(c.kwargs["filters"]["offset"] for c in mock_mailjet_client.contactdata.get.call_args_list)
+        assert offsets == [0, 10, 20, 30, 40]
+        assert all(c.kwargs["filters"]["limit"] == 10 for c in mock_mailjet_client.contactdata.get.call_args_list)
+
+    def test_failed_page_ends_stream(self, mj_service, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_PAGE_SIZE", 10)
+        mock_mailjet_client.contactdata.get.side_effect = self.page_responder(total=45, page_size=10, fail_offset=20)
+
+        assert [c.id_ for c in mj_service.get_all_contacts_in_list(456)] == list(range(20))
+
+    @staticmethod
+    def email_page_responder(total, page_size, fail_offset=None):
+        def respond(filters):
+            offset = filters["offset"]
+            if offset == fail_offset:
+                return mock_json_response(500, {"ErrorMessage": "boom"})
+            ids = range(offset, min(offset + page_size, total))
+            return mock_json_response(200, {
+                "Count": len(ids), "Total": total,
+                "Data": [{"ID": i, "Email": f"C{i}@example.com", "Name": "", "CreatedAt": "2024-01-01T00:00:00Z",
+                          "IsExcludedFromCampaigns": False} for i in ids],
+            })
+        return respond
+
+    def test_list_contacts_pages_concurrently(self, mj_service, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_PAGE_SIZE", 10)
+        mock_mailjet_client.contact.get.side_effect = self.email_page_responder(total=25, page_size=10)
+
+        contacts = mj_service.get_list_contacts(456)
+
+        assert {id: c.email for id, c in contacts.items()} == {i: f"C{i}@example.com" for i in range(25)}
+        offsets = sorted(c.kwargs["filters"]["offset"] for c in mock_mailjet_client.contact.get.call_args_list)
+        assert offsets == [0, 10, 20]
+
+    def test_list_contacts_partial_read_fails(self, mj_service, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_PAGE_SIZE", 10)
+        mock_mailjet_client.contact.get.side_effect = self.email_page_responder(total=25, page_size=10, fail_offset=10)
+
+        assert mj_service.get_list_contacts(456) is None
+
+    def test_empty_list(self, mj_service, mock_mailjet_client):
+        mock_mailjet_client.contactdata.get.side_effect = self.page_responder(total=0, page_size=10)
+
+        assert mj_service.get_all_contacts_in_list(456) is None
+
+
+def subscriber(n):
+    return Subscriber(
+        email_=f"c{n}@example.com",
+        id_=None,
+        first_name="C",
+        last_name=str(n),
+        attended_orientation=False,
+        orientation_date=None,
+        signed_waiver=False,
+        active_member=False,
+        latest_membership_end=None,
+    )
+
+
+class TestBulkJobs:
+    """Tests for chunked bulk submission and job tracking"""
+
+    def test_submit_bulk_jobs_chunks(self, mj_service, mock_mailjet_client, mocker):
+        mocker.patch("mailjetUtil.MJ_BULK_CHUNK_SIZE", 2)
+
+        def create(data):
+            first = data["Contacts"][0]["Email"]
+            if first == "c2@example.com":
+                return mock_json_response(400, {"ErrorMessage": "bad payload"})
+            return mock_json_response(201, {"Data": [{"JobID": int(first[1])}]})
+        mock_mailjet_client.contact_managemanycontacts.create.side_effect = create
+
+        subs = [subscriber(n) for n in range(5)]
+        jobs, unsubmitted = mj_service.submit_bulk_jobs([456], subs, MailjetAction.ADD_NOFORCE)
+
+        assert {job_id: [s.email for s in chunk] for job_id, chunk in jobs.items()} == {
+            0: ["c0@example.com", "c1@example.com"],
+            4: ["c4@example.com"],
+        }
+        assert [s.email for s in unsubmitted] == ["c2@example.com", "c3@example.com"]
+
+    def test_track_bulk_jobs_outcomes(self, mj_service, mock_mailjet_client):
+        polls = {1: 0}
+
+        def get(action_id):
+            if action_id == 1:
+                # not registered yet, then processing, then done with per-contact errors
+                polls[1] += 1
+                if polls[1] == 1:
+                    return mock_json_response(404, {})
+                status = "Processing" if polls[1] == 2 else "Completed"
+                return mock_json_response(200, {"Data": [{"Status": status, "ErrorFile": "https://mj/errors.csv"}]})
+            if action_id == 2:
+                return mock_json_response(200, {"Data": [{"Status": "Error", "Error": "quota"}]})
+            return mock_json_response(200, {"Data": [{"Status": "Processing"}]})
+        mock_mailjet_client.contact_managemanycontacts.get.side_effect = get
+
+        sleeps = []
+        report = mj_service.track_bulk_jobs(
+            {1: [subscriber(1)], 2: [subscriber(2)], 3: [subscriber(3)]},
+            timeout=datetime.timedelta(seconds=10),
+            sleep=sleeps.append,
+        )
+
+        assert report.completed_jobs == [1]
+        assert report.error_files == ["https://mj/errors.csv"]
+        assert report.failed_contacts == {"c2@example.com": "job 2 Error: quota"}
+        assert report.pending_jobs == [3]
+        assert sleeps == [2.0, 4.0, 8.0]
+        assert not report.ok
+
+    def test_track_bulk_jobs_gives_up_on_status_errors(self, mj_service, mock_mailjet_client):
+        mock_mailjet_client.contact_managemanycontacts.get.return_value = mock_json_response(401, {})
+
+        sleeps = []
+        report = mj_service.track_bulk_jobs({1: [subscriber(1)]}, sleep=sleeps.append)
+
+        assert list(report.failed_contacts) == ["c1@example.com"]
+        assert report.pending_jobs == []
+        assert len(sleeps) == 2
+
+
+def test_mailjet_service_uses_named_ssm_keys(mock_mailjet_client):
+    with patch("mailjetUtil.Client", return_value=mock_mailjet_client) as client:
+        service = get_mailjet_service()
+
+    client.assert_called_once_with(auth=("test_mailjet_key", "test_mailjet_secret"), version="v3")
+    assert (service.new_members_list_id, service.all_contacts_list_id) == (123, 456)
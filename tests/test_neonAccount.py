@@ -0,0 +1,56 @@
+import copy
+import json
+
+import neonUtil
+import neonSnapshot
+from neonAccount import NeonAccount
+
+
+def test_behaves_like_the_dict_it_wraps():
+    raw = {"Account ID": "1", "individualTypes": [{"name": "Steward"}]}
+    account = NeonAccount(raw)
+
+    assert account == raw
+    assert json.loads(json.dumps(account)) == raw
+    assert copy.deepcopy(account) == raw
+
+
+def test_type_names_follow_changes_to_individualTypes():
+    account = NeonAccount({"Account ID": "1"})
+    assert account.typeNames() == frozenset()
+
+    account["individualTypes"] = [{"name": "Steward"}]
+    assert account.typeNames() == {"Steward"}
+
+    account["individualTypes"].append({"name": "Instructor"})
+    assert account.typeNames() == {"Steward", "Instructor"}
+
+    account.update(individualTypes=[{"name": "Leader"}])
+    assert account.typeNames() == {"Leader"}
+
+    account["individualTypes"][0] = {"name": "Instructor"}
+    assert account.typeNames() == {"Instructor"}
+
+    account["individualTypes"][0]["name"] = "Steward"
+    assert account.typeNames() == {"Steward"}
+
+    account.pop("individualTypes")
+    assert account.typeNames() == frozenset()
+
+
+def test_accountIsType_matches_for_records_and_plain_dicts():
+    types = [{"name": neonUtil.STAFF_TYPE}, {"name": None}, {}]
+    for account in ({"individualTypes": types}, NeonAccount({"individualTypes": types})):
+        assert neonUtil.accountIsType(account, neonUtil.STAFF_TYPE)
+        assert not neonUtil.accountIsType(account, neonUtil.LEAD_TYPE)
+        # a type entry without a name matches None, as it always has
+        assert neonUtil.accountIsType(account, None)
+
+
+def test_search_results_and_snapshots_become_records():
+    account = neonUtil.fixTypes({"Account ID": "1", "Individual Type": "Steward | Instructor"})
+    assert isinstance(account, NeonAccount)
+    assert neonUtil.accountIsType(account, "Instructor")
+
+    neonSnapshot.saveSnapshot({"1": account})
+    assert isinstance(neonSnapshot.loadSnapshot()["1"], NeonAccount)
@@ -0,0 +1,64 @@
+import datetime
+
+import neonSnapshot
+import neonUtil
+from neon_mocker import NeonUserMock, today_plus
+
+
+def test_load_without_snapshot_returns_none():
+    assert neonSnapshot.loadSnapshot() is None
+    assert neonSnapshot.snapshotTime() is None
+
+
+def test_save_and_load_round_trip():
+    accounts = {
+        "1": {"Account ID": "1", "validMembership": True, "individualTypes": [{"name": "Steward"}]},
+        "2": {"Account ID": "2", "validMembership": False},
+    }
+    neonSnapshot.saveSnapshot(accounts)
+
+    assert neonSnapshot.loadSnapshot() == accounts
+    assert neonSnapshot.snapshotTime() is not None
+
+
+def test_save_replaces_previous_snapshot():
+    neonSnapshot.saveSnapshot({"1": {"Account ID": "1"}, "2": {"Account ID": "2"}})
+    neonSnapshot.saveSnapshot({"3": {"Account ID": "3"}})
+
+    assert neonSnapshot.loadSnapshot() == {"3": {"Account ID": "3"}}
+
+
+def test_stale_snapshot_is_ignored(mocker):
+    neonSnapshot.saveSnapshot({"1": {"Account ID": "1"}})
+
+    later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=2)
+    mocker.patch.object(neonSnapshot, "_now", return_value=later)
+
+    assert neonSnapshot.loadSnapshot(maxAge=datetime.timedelta(hours=1)) is None
+    assert neonSnapshot.loadSnapshot() == {"1": {"Account ID": "1"}}
+
+
+def test_getRealAccounts_persists_and_reuses_snapshot(requests_mock):
+    account = NeonUserMock(1).add_membership(
+        neonUtil.MEMBERSHIP_ID_REGULAR, today_plus(-30), today_plus(30), fee=50.0
+    )
+    search_mock, _ = NeonUserMock.mock_search(requests_mock, [account])
+
+    fresh = neonUtil.getRealAccounts(snapshotMaxAge=datetime.timedelta(hours=1))
+    searches = search_mock.call_count
+    assert fresh["1"]["validMembership"]
+
+    # second call is served from the snapshot without touching Neon
+    requests_mock.reset_mock()
+    assert neonUtil.getRealAccounts(snapshotMaxAge=datetime.timedelta(hours=1)) == fresh
+    assert requests_mock.call_count == 0
+    assert searches > 0
+
+
+def test_membership_cache_requires_matching_signal():
+    neonSnapshot.saveMemberships({"1": ("a", [{"status": "SUCCEEDED"}]), "2": ("b", [])})
+
+    cached = neonSnapshot.loadMemberships({"1": "a", "2": "changed", "3": "c"}, datetime.timedelta(hours=1))
+
+    assert cached == {"1": [{"status": "SUCCEEDED"}]}
+    assert neonSnapshot.loadMemberships({"1": "a"}, datetime.timedelta(0)) == {}
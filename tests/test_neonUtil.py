@@ -1,5 +1,10 @@
+import copy
+import random
+from datetime import timedelta
+
 import neonUtil
-from neon_mocker import NeonUserMock, today_plus
+import neonSnapshot
+from neon_mocker import NeonUserMock, build_membership_response, today_plus
 
 
 today = today_plus(0)
@@ -206,3 +211,246 @@ def test_appendMemberships_membershipDates_mapping_multiple(requests_mock):
         },
         'validMembership': False,
     }
+
+
+def mock_search_by_field(requests_mock, results_by_field):
+    """Mock the accounts search, answering based on the first search field."""
+    def respond(request, context):
+        field = request.json()["searchFields"][0]["field"]
+        accounts = results_by_field.get(field, [])
+        return {
+            "searchResults": [a.search_result() for a in accounts],
+            "pagination": {"totalPages": 1 if accounts else 0, "currentPage": 0},
+        }
+    return requests_mock.post(f'{neonUtil.N_baseURL}/accounts/search', json=respond)
+
+
+def test_getRealAccounts_incremental_starts_with_full_sync(requests_mock):
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(30), fee=50.0)
+    member.mock(requests_mock)
+    search = mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+
+    accounts = neonUtil.getRealAccounts(incremental=True)
+
+    assert accounts["1"]["validMembership"]
+    fields = {r.json()["searchFields"][0]["field"] for r in search.request_history}
+    assert "Account Last Modified Date" not in fields
+
+
+def test_getRealAccounts_incremental_merges_modified_accounts(requests_mock):
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(30), fee=50.0)
+    member.mock(requests_mock)
+    mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+    neonUtil.getRealAccounts(incremental=True)
+
+    # a new member joins, and an unrelated account gets edited
+    joined = NeonUserMock(2).add_membership(REGULAR, today, today_plus(30), fee=50.0)
+    joined.mock(requests_mock)
+    bystander = NeonUserMock(3)
+    search = mock_search_by_field(requests_mock, {
+        "Account Last Modified Date": [bystander],
+        "Membership Last Modified Date": [joined],
+    })
+    requests_mock.reset_mock()
+
+    accounts = neonUtil.getRealAccounts(incremental=True)
+
+    assert set(accounts) == {"1", "2"}
+    assert accounts["1"]["validMembership"]
+    assert accounts["2"]["validMembership"]
+    assert search.call_count == 2
+    assert {r.json()["searchFields"][0]["value"] for r in search.request_history} == {today}
+    # only the new member's memberships were fetched
+    membership_calls = [r.url for r in requests_mock.request_history if r.url.endswith("/memberships")]
+    assert membership_calls == [f'{neonUtil.N_baseURL}/accounts/2/memberships']
+
+
+def test_getRealAccounts_incremental_full_sync_when_stale(requests_mock, mocker):
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(30), fee=50.0)
+    member.mock(requests_mock)
+    search = mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+    neonUtil.getRealAccounts(incremental=True)
+
+    mocker.patch.object(neonUtil, "today", neonUtil.today + neonUtil.FULL_SYNC_INTERVAL)
+    requests_mock.reset_mock()
+    neonUtil.getRealAccounts(incremental=True)
+
+    fields = {r.json()["searchFields"][0]["field"] for r in search.request_history}
+    assert "Membership Expiration Date" in fields
+    assert "Account Last Modified Date" not in fields
+
+
+def test_membershipChangedSince_term_boundaries():
+    since = neonUtil.today - timedelta(days=1)
+    account = lambda start, end: {"membershipDates": {str(start): [str(end), REGULAR]}}
+    t = neonUtil.today
+
+    assert neonUtil._membershipChangedSince(account(t, t + timedelta(days=30)), since)
+    assert neonUtil._membershipChangedSince(account(t - timedelta(days=30), t - timedelta(days=1)), since)
+    assert neonUtil._membershipChangedSince(account(t - timedelta(days=30), t - timedelta(days=2)), since)
+    assert not neonUtil._membershipChangedSince(account(t - timedelta(days=30), t + timedelta(days=30)), since)
+    assert not neonUtil._membershipChangedSince({}, since)
+
+
+def random_memberships(rng):
+    offsets = [-400, -366, -365, -31, -30, -2, -1, 0, 1, 29, 30, 365]
+    memberships = []
+    for _ in range(rng.randint(0, 6)):
+        start = rng.choice(offsets)
+        end = start + rng.choice([0, 1, 29, 30, 364])
+        memberships.append(build_membership_response(
+            today_plus(start), today_plus(end),
+            status=rng.choice(["SUCCEEDED", "SUCCEEDED", "PENDING", "FAILED", "CANCELED"]),
+            fee=rng.choice([0.0, 50.0]),
+            membershipLevelId=rng.choice([REGULAR, CERAMICS, str(CERAMICS)]),
+            autoRenewal=rng.choice([True, False]),
+        ))
+    return memberships
+
+
+def test_applyMembershipsBatch_matches_applyMemberships():
+    rng = random.Random(17)
+    pairs = [({"Account ID": str(i)}, random_memberships(rng)) for i in range(2000)]
+
+    expected = [neonUtil.applyMemberships(copy.deepcopy(account), memberships, detailed=True) for account, memberships in pairs]
+    actual = neonUtil.applyMembershipsBatch(pairs, detailed=True)
+
+    assert actual == expected
+    # the interesting branches all came up
+    assert any(a.get("validMembership") and not a.get("paidRegular") and not a.get("compedRegular")
+               and not a.get("paidCeramics") and not a.get("compedCeramics") for a in actual)
+    assert any(a.get("compedCeramics") for a in actual)
+
+
+def membership_calls(requests_mock):
+    return [r.url for r in requests_mock.request_history if r.url.endswith("/memberships")]
+
+
+def rewind_high_water_mark(days):
+    """Pretend the last incremental sync ran the given number of days ago."""
+    neonSnapshot.saveSnapshot(
+        neonSnapshot.loadSnapshot(), meta={"highWaterMark": str(neonUtil.today - timedelta(days=days))}
+    )
+
+
+def test_full_sync_refetches_cached_membership_histories(requests_mock):
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(30), fee=50.0)
+    member.mock(requests_mock)
+    mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+    neonUtil.getRealAccounts()
+
+    requests_mock.reset_mock()
+    neonUtil.getRealAccounts()
+
+    assert membership_calls(requests_mock) == [f'{neonUtil.N_baseURL}/accounts/1/memberships']
+
+
+def test_incremental_reuses_histories_of_unmodified_accounts(requests_mock):
+    # the term lapsed yesterday, so the account is refreshed without being modified
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(-1), fee=50.0)
+    member.mock(requests_mock)
+    mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+    first = neonUtil.getRealAccounts(incremental=True)
+    rewind_high_water_mark(2)
+
+    requests_mock.reset_mock()
+    second = neonUtil.getRealAccounts(incremental=True)
+
+    assert membership_calls(requests_mock) == []
+    assert second["1"] == first["1"]
+
+
+def test_incremental_refetches_stale_membership_cache(requests_mock, mocker):
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(-1), fee=50.0)
+    member.mock(requests_mock)
+    mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+    neonUtil.getRealAccounts(incremental=True)
+    rewind_high_water_mark(2)
+
+    mocker.patch.object(neonUtil, "MEMBERSHIP_CACHE_MAX_AGE", timedelta(0))
+    requests_mock.reset_mock()
+    neonUtil.getRealAccounts(incremental=True)
+
+    assert membership_calls(requests_mock) == [f'{neonUtil.N_baseURL}/accounts/1/memberships']
+
+
+def test_incremental_refetches_modified_account_with_unchanged_dates(requests_mock):
+    member = NeonUserMock(1).add_membership(REGULAR, today_plus(-30), today_plus(30), fee=50.0)
+    member.mock(requests_mock)
+    mock_search_by_field(requests_mock, {"Membership Expiration Date": [member]})
+    assert not neonUtil.getRealAccounts(incremental=True)["1"].get("ceramicsMembership")
+
+    # an upgrade to ceramics keeps the term dates and status Neon reports in searches
+    upgraded = NeonUserMock(1).add_membership(CERAMICS, today_plus(-30), today_plus(30), fee=50.0)
+    upgraded.mock(requests_mock)
+    mock_search_by_field(requests_mock, {"Membership Last Modified Date": [upgraded]})
+    requests_mock.reset_mock()
+    accounts = neonUtil.getRealAccounts(incremental=True)
+
+    assert membership_calls(requests_mock) == [f'{neonUtil.N_baseURL}/accounts/1/memberships']
+    assert accounts["1"]["ceramicsMembership"]
+
+
+def mock_paged_search(requests_mock, pages_by_field):
+    """Mock the accounts search with several pages per search field."""
+    def respond(request, context):
+        body = request.json()
+        pages = pages_by_field.get(body["searchFields"][0]["field"], [])
+        page = body["pagination"]["currentPage"]
+        return {
+            "searchResults": pages[page] if page < len(pages) else [],
+            "pagination": {"totalPages": len(pages), "currentPage": page},
+        }
+    return requests_mock.post(f'{neonUtil.N_baseURL}/accounts/search', json=respond)
+
+
+def test_getNeonAccounts_fetches_every_page(requests_mock):
+    pages = [[{"Account ID": str(page * 10 + i)} for i in range(3)] for page in range(5)]
+    search = mock_paged_search(requests_mock, {"Email 1": pages})
+
+    accounts = neonUtil.getNeonAccounts([{"field": "Email 1", "operator": "NOT_BLANK"}])
+
+    assert list(accounts) == [a["Account ID"] for page in pages for a in page]
+    assert sorted(r.json()["pagination"]["currentPage"] for r in search.request_history) == [0, 1, 2, 3, 4]
+
+
+def test_getNeonAccountsForSearches_earlier_searches_win(requests_mock):
+    mock_paged_search(requests_mock, {
+        "First": [[{"Account ID": "1", "from": "first"}], [{"Account ID": "2", "from": "first"}]],
+        "Second": [[{"Account ID": "2", "from": "second"}, {"Account ID": "3", "from": "second"}]],
+    })
+
+    accounts = neonUtil.getNeonAccountsForSearches([
+        [{"field": "First", "operator": "NOT_BLANK"}],
+        [{"field": "Second", "operator": "NOT_BLANK"}],
+    ])
+
+    assert {id: a["from"] for id, a in accounts.items()} == {"1": "first", "2": "first", "3": "second"}
+
+
+def test_iter_neon_accounts_streams_pages_in_order(requests_mock):
+    pages = [[{"Account ID": str(page * 10 + i), "Individual Type": "Steward"} for i in range(2)] for page in range(6)]
+    search = mock_paged_search(requests_mock, {"Email 1": pages})
+
+    accounts = neonUtil.iter_neon_accounts([{"field": "Email 1", "operator": "NOT_BLANK"}], prefetch=2)
+    first = next(accounts)
+
+    # page 0 plus a bounded window of prefetched pages, not the whole search
+    assert first["Account ID"] == "0"
+    assert first["individualTypes"] == [{"name": "Steward"}]
+    assert search.call_count <= 3
+
+    rest = list(accounts)
+    assert [a["Account ID"] for a in [first, *rest]] == [a["Account ID"] for page in pages for a in page]
+    assert search.call_count == 6
+
+
+def test_iter_neon_accounts_can_stop_early(requests_mock):
+    pages = [[{"Account ID": str(page)}] for page in range(20)]
+    search = mock_paged_search(requests_mock, {"Email 1": pages})
+
+    accounts = neonUtil.iter_neon_accounts([{"field": "Email 1", "operator": "NOT_BLANK"}], prefetch=2)
+    assert [next(accounts)["Account ID"] for _ in range(3)] == ["0", "1", "2"]
+    accounts.close()
+
+    assert search.call_count < 20
@@ -0,0 +1,114 @@
+import datetime
+
+import neonUtil
+import openPathDirectory
+import openPathUtil
+from openPathUtil import O_baseURL, GROUP_SUBSCRIBERS, GROUP_CERAMICS
+
+
+def op_user(id, updated_at, groups=(), external_id=None):
+    return {
+        "id": id,
+        "externalId": external_id,
+        "identity": {"email": f"user{id}@example.com", "firstName": "Some"},
+        "status": "A",
+        "groups": [{"id": group, "name": f"Group {group}"} for group in groups],
+        "updatedAt": updated_at,
+    }
+
+
+def test_round_trip_keeps_directory_fields():
+    openPathDirectory.saveUsers([op_user(1, "2026-01-01T00:00:00.000Z", [GROUP_SUBSCRIBERS], "11")])
+
+    assert openPathDirectory.loadUsers() == {
+        1: {
+            "id": 1,
+            "externalId": "11",
+            "identity": {"email": "user1@example.com"},
+            "status": "A",
+            "groups": [{"id": GROUP_SUBSCRIBERS, "name": f"Group {GROUP_SUBSCRIBERS}"}],
+            "updatedAt": "2026-01-01T00:00:00.000Z",
+        }
+    }
+
+
+def test_stale_user_is_ignored_with_max_age(mocker):
+    openPathDirectory.saveUsers([op_user(1, "2026-01-01T00:00:00.000Z")])
+
+    later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=10)
+    mocker.patch.object(openPathDirectory, "_now", return_value=later)
+
+    assert openPathDirectory.getUser(1, maxAge=datetime.timedelta(minutes=5)) is None
+    assert openPathDirectory.getUser(1)["id"] == 1
+
+
+def test_first_incremental_sync_is_full(requests_mock):
+    users = [
+        op_user(1, "2026-01-01T00:00:00.000Z", [GROUP_SUBSCRIBERS]),
+        op_user(2, "2026-01-03T00:00:00.000Z"),
+    ]
+    requests_mock.get(f'{O_baseURL}/users', json={"data": users, "totalCount": 2})
+
+    opUsers = openPathUtil.getAllUsers(incremental=True)
+
+    assert opUsers == {1: users[0], 2: users[1]}
+    assert set(openPathDirectory.loadUsers()) == {1, 2}
+    assert openPathDirectory.getMeta("lastFullSync") == str(neonUtil.today)
+    assert openPathDirectory.getMeta("highWaterMark") == "2026-01-03T00:00:00.000Z"
+
+
+def test_incremental_sync_pages_only_updated_users(requests_mock):
+    openPathDirectory.saveUsers(
+        [op_user(1, "2026-01-01T00:00:00.000Z"), op_user(2, "2026-01-03T00:00:00.000Z")],
+        replace=True,
+        meta={"lastFullSync": str(neonUtil.today), "highWaterMark": "2026-01-03T00:00:00.000Z"},
+    )
+    updated = op_user(1, "2026-01-05T00:00:00.000Z", [GROUP_SUBSCRIBERS])
+    # newest first; the search stops at the first user older than the high-water mark
+    changes = requests_mock.get(f'{O_baseURL}/users', json={
+        "data": [
+            updated,
+            op_user(2, "2026-01-03T00:00:00.000Z"),
+            op_user(3, "2025-12-01T00:00:00.000Z"),
+        ],
+        "totalCount": 500,
+    })
+
+    opUsers = openPathUtil.getAllUsers(incremental=True)
+
+    assert changes.call_count == 1
+    assert "sort=updatedat&order=desc" in changes.last_request.url.lower()
+    assert opUsers[1]["groups"] == [{"id": GROUP_SUBSCRIBERS, "name": f"Group {GROUP_SUBSCRIBERS}"}]
+    assert set(opUsers) == {1, 2}
+    assert openPathDirectory.getMeta("highWaterMark") == "2026-01-05T00:00:00.000Z"
+
+
+def test_full_verify_after_interval(requests_mock):
+    lastFullSync = neonUtil.today - openPathUtil.FULL_SYNC_INTERVAL
+    openPathDirectory.saveUsers(
+        [op_user(1, "2026-01-01T00:00:00.000Z"), op_user(2, "2026-01-01T00:00:00.000Z")],
+        meta={"lastFullSync": str(lastFullSync), "highWaterMark": "2026-01-01T00:00:00.000Z"},
+    )
+    # user 2 was deleted outright, which an incremental sync can't see
+    requests_mock.get(f'{O_baseURL}/users', json={
+        "data": [op_user(1, "2026-01-01T00:00:00.000Z")], "totalCount": 1,
+    })
+
+    assert set(openPathUtil.getAllUsers(incremental=True)) == {1}
+    assert set(openPathDirectory.loadUsers()) == {1}
+    assert openPathDirectory.getMeta("lastFullSync") == str(neonUtil.today)
+
+
+def test_group_changes_are_written_through(requests_mock):
+    fetch = requests_mock.get(f'{O_baseURL}/users/7/groups', json={"data": [{"id": GROUP_SUBSCRIBERS, "name": "Subscribers"}]})
+    requests_mock.put(f'{O_baseURL}/users/7/groupIds', status_code=204)
+    maxAge = datetime.timedelta(minutes=5)
+
+    assert openPathUtil.getGroupsById(7, maxAge) == [{"id": GROUP_SUBSCRIBERS, "name": "Subscribers"}]
+    assert openPathUtil.getGroupsById(7, maxAge) == [{"id": GROUP_SUBSCRIBERS, "name": "Subscribers"}]
+    assert fetch.call_count == 1
+
+    openPathUtil.setGroups({"OpenPathID": 7}, [GROUP_SUBSCRIBERS, GROUP_CERAMICS])
+
+    assert [group["id"] for group in openPathUtil.getGroupsById(7, maxAge)] == [GROUP_SUBSCRIBERS, GROUP_CERAMICS]
+    assert fetch.call_count == 1
@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 
+import openPathUpdateAll as updateAllModule
 from openPathUpdateAll import openPathUpdateAll
 from neonUtil import MEMBERSHIP_ID_REGULAR, MEMBERSHIP_ID_CERAMICS, ACCOUNT_FIELD_OPENPATH_ID, N_baseURL, LEAD_TYPE
 from openPathUtil import GROUP_SUBSCRIBERS, GROUP_CERAMICS, GROUP_MANAGEMENT, O_baseURL
@@ -88,7 +89,7 @@ def test_updates_existing_users_with_missing_groups(requests_mock):
     assert_history(rm, lambda: openPathUpdateAll(accounts), [
         (get_all_users._method, get_all_users._url),
         *[(u._method, u._url) for u in updates]
-    ])
+    ], ordered=False)
 
     assert updates[0].last_request.json() == {"groupIds": [GROUP_SUBSCRIBERS]}
     assert updates[1].last_request.json() == {"groupIds": [GROUP_SUBSCRIBERS, GROUP_CERAMICS]}
@@ -120,7 +121,7 @@ def test_bulk_update_mixed_accounts(requests_mock):
     assert_history(rm, lambda: openPathUpdateAll(accounts), [
         (get_all_users._method, get_all_users._url),
         *[(u._method, u._url) for u in updates]
-    ])
+    ], ordered=False)
 
 
 def test_skips_invalid_accounts(requests_mock):
@@ -261,3 +262,57 @@ def test_handles_failed_user_creation(requests_mock):
         (get_all_users._method, get_all_users._url),
         (create_alta._method, create_alta._url),
     ])
+
+    assert updateAllModule.getFailureText(openPathUpdateAll(accounts)).strip().startswith(
+        "WARNING: 1 OPENPATH UPDATE FAILED"
+    )
+
+
+def test_retries_failed_group_updates(requests_mock, monkeypatch):
+    """A failed group PUT is retried; one that keeps failing doesn't stop the others."""
+    rm = requests_mock
+    monkeypatch.setattr(updateAllModule, "RETRY_DELAY", 0)
+
+    flaky = NeonUserMock(1, open_path_id=101, waiver_date=start, facility_tour_date=tour)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+    broken = NeonUserMock(2, open_path_id=102, waiver_date=start, facility_tour_date=tour)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+    healthy = NeonUserMock(3, open_path_id=103, waiver_date=start, facility_tour_date=tour)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+
+    accounts = {act.account_id: act.mock(rm) for act in [flaky, broken, healthy]}
+    mock_empty_groups(rm, accounts)
+    flaky_put = rm.put(f'{O_baseURL}/users/101/groupIds', [{"status_code": 502}, {"status_code": 204}])
+    broken_put = rm.put(f'{O_baseURL}/users/102/groupIds', status_code=500)
+    healthy_put = rm.put(f'{O_baseURL}/users/103/groupIds', status_code=204)
+
+    results = openPathUpdateAll(accounts)
+
+    assert flaky_put.call_count == 2
+    assert broken_put.call_count == updateAllModule.APPLY_RETRIES
+    assert healthy_put.call_count == 1
+    assert [(r["attempts"], r["error"] is None) for r in results] == [
+        (2, True), (updateAllModule.APPLY_RETRIES, False), (1, True)
+    ]
+
+    table = updateAllModule.getResultsTable(results)
+    assert "update groups         2       1       2" in table
+    assert "create user           0       0       0" in table
+
+
+def test_rejected_group_updates_are_not_retried(requests_mock, monkeypatch):
+    """A 4xx from OpenPath won't go away on retry, so it fails on the first attempt."""
+    rm = requests_mock
+    monkeypatch.setattr(updateAllModule, "RETRY_DELAY", 0)
+
+    missing = NeonUserMock(1, open_path_id=101, waiver_date=start, facility_tour_date=tour)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+
+    accounts = {missing.account_id: missing.mock(rm)}
+    mock_empty_groups(rm, accounts)
+    missing_put = rm.put(f'{O_baseURL}/users/101/groupIds', status_code=404)
+
+    results = openPathUpdateAll(accounts)
+
+    assert missing_put.call_count == 1
+    assert [(r["attempts"], r["error"] is None) for r in results] == [(1, False)]
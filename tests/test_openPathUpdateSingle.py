@@ -1,6 +1,7 @@
-from openPathUpdateSingle import openPathUpdateSingle
+import openPathUtil
+from openPathUpdateSingle import openPathUpdateSingle, stageTimer
 from neon_mocker import NeonUserMock, today_plus, assert_history
-from neonUtil import MEMBERSHIP_ID_REGULAR, MEMBERSHIP_ID_CERAMICS, ACCOUNT_FIELD_OPENPATH_ID, N_baseURL, INSTRUCTOR_TYPE, ONDUTY_TYPE
+from neonUtil import getMemberById, MEMBERSHIP_ID_REGULAR, MEMBERSHIP_ID_CERAMICS, ACCOUNT_FIELD_OPENPATH_ID, N_baseURL, INSTRUCTOR_TYPE, ONDUTY_TYPE
 from openPathUtil import GROUP_SUBSCRIBERS, GROUP_INSTRUCTORS, GROUP_ONDUTY, O_baseURL
 from datetime import datetime, timezone
 
@@ -35,7 +36,7 @@ def test_skips_invalid_user(requests_mock, mocker):
         assert_history(requests_mock, lambda: openPathUpdateSingle(account.account_id), [
             ('GET', f'{N_baseURL}/accounts/{account.account_id}'),
             ('GET', f'{N_baseURL}/accounts/{account.account_id}/memberships'),
-        ])
+        ], concurrent_prefix=2)
 
 
 def test_skips_existing_user(requests_mock, mocker):
@@ -55,7 +56,7 @@ def test_skips_existing_user(requests_mock, mocker):
         ('GET', f'{N_baseURL}/accounts/{account.account_id}'),
         ('GET', f'{N_baseURL}/accounts/{account.account_id}/memberships'),
         (get_groups._method, get_groups._url),
-    ])
+    ], concurrent_prefix=3)
 
 
 def test_updates_existing_user_with_missing_groups(requests_mock, mocker):
@@ -74,7 +75,7 @@ def test_updates_existing_user_with_missing_groups(requests_mock, mocker):
         ('GET', f'{N_baseURL}/accounts/{account.account_id}/memberships'),
         (get_groups._method, get_groups._url),
         (update_groups._method, update_groups._url),
-    ])
+    ], concurrent_prefix=3)
 
     # Verify groups updated correctly
     assert update_groups.last_request.json() == {"groupIds": [GROUP_SUBSCRIBERS]}
@@ -129,7 +130,7 @@ def test_creates_user_with_correct_group(requests_mock, mocker):
             ('GET', f'{N_baseURL}/accounts/{account.account_id}'),
             ('GET', f'{N_baseURL}/accounts/{account.account_id}/memberships'),
             *[(m._method, m._url) for m in updates.values()]
-        ])
+        ], concurrent_prefix=2)
 
         # Verify body of each update
         assert updates['create_alta'].last_request.json() == {
@@ -173,4 +174,57 @@ def test_handles_failed_user_creation(requests_mock):
         ('GET', f'{N_baseURL}/accounts/{account.account_id}'),
         ('GET', f'{N_baseURL}/accounts/{account.account_id}/memberships'),
         (create_alta._method, create_alta._url),
+    ], concurrent_prefix=2)
+
+
+def test_reports_stage_timings(requests_mock):
+    account = NeonUserMock(waiver_date=start, facility_tour_date=tour, open_path_id=ALTA_ID)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+    account.mock(requests_mock)
+    requests_mock.get(f'{O_baseURL}/users/{ALTA_ID}/groups', json={"data": [{"id": GROUP_SUBSCRIBERS}]})
+
+    timings = openPathUpdateSingle(account.account_id)
+
+    assert list(timings) == ["neon account", "neon memberships", "openpath groups", "openpath update"]
+    assert all(seconds >= 0 for seconds in timings.values())
+
+
+def test_stage_timer_records_time_since_previous_stage(mocker):
+    mocker.patch("openPathUpdateSingle.time.perf_counter", side_effect=[10.0, 10.5, 12.0, 12.25])
+    timings = {}
+    stage = stageTimer(timings)
+
+    stage("first")
+    stage("second")
+    stage("third")
+
+    assert timings == {"first": 0.5, "second": 1.5, "third": 0.25}
+
+
+def test_access_groups_computed_once(requests_mock, mocker):
+    account = NeonUserMock(waiver_date=start, facility_tour_date=tour, open_path_id=ALTA_ID)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+    account.mock(requests_mock)
+    requests_mock.get(f'{O_baseURL}/users/{ALTA_ID}/groups', json={"data": []})
+    update_groups = requests_mock.put(f'{O_baseURL}/users/{ALTA_ID}/groupIds', status_code=204)
+    getOpGroups = mocker.spy(openPathUtil, "getOpGroups")
+
+    openPathUpdateSingle(account.account_id)
+
+    assert getOpGroups.call_count == 1
+    assert update_groups.last_request.json() == {"groupIds": [GROUP_SUBSCRIBERS]}
+
+
+def test_uses_prefetched_account(requests_mock):
+    account = NeonUserMock(waiver_date=start, facility_tour_date=tour, open_path_id=ALTA_ID)\
+        .add_membership(REGULAR, start, end, fee=100.0)
+    account.mock(requests_mock)
+    get_groups = requests_mock.get(f'{O_baseURL}/users/{ALTA_ID}/groups', json={"data": [{"id": GROUP_SUBSCRIBERS}]})
+
+    prefetched = getMemberById(account.account_id)
+    requests_mock.reset_mock()
+
+    # The caller already has the account and memberships --> only the groups are fetched
+    assert_history(requests_mock, lambda: openPathUpdateSingle(account.account_id, account=prefetched), [
+        (get_groups._method, get_groups._url),
     ])
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+import neonUtil
+import openPathUtil
+from neonAccount import NeonAccount
+from openPathUtil import (
+    GROUP_MANAGEMENT, GROUP_SUBSCRIBERS, GROUP_CERAMICS, GROUP_COWORKING, GROUP_STEWARDS,
+    GROUP_INSTRUCTORS, GROUP_SHAPER_ORIGIN, GROUP_DOMINO, GROUP_ONDUTY,
+    GROUP_CERAMICS_ONDUTY, GROUP_SPECIAL_EVENT,
+)
+
+
+ALL_TYPES = [
+    neonUtil.STAFF_TYPE, neonUtil.DIRECTOR_TYPE, neonUtil.LEAD_TYPE, neonUtil.SUPER_TYPE,
+    neonUtil.COWORKING_TYPE, neonUtil.STEWARD_TYPE, neonUtil.INSTRUCTOR_TYPE,
+    neonUtil.WIKI_ADMIN_TYPE, neonUtil.ONDUTY_TYPE, neonUtil.ONDUTY_TYPE_CERAMICS,
+]
+FLAGS = [
+    "validMembership", "AccessSuspended", "WaiverDate", "FacilityTourDate",
+    "ceramicsMembership", "CsiDate", "Shaper Origin", "Woodshop Specialty Tools",
+]
+
+
+def legacy_op_groups(account):
+    """getOpGroups as it was written before the policy table"""
+    is_type = lambda type: neonUtil.accountIsType(account, type)
+    groups = set()
+    if is_type(neonUtil.INSTRUCTOR_TYPE):
+        groups.add(GROUP_INSTRUCTORS)
+    if is_type(neonUtil.ONDUTY_TYPE):
+        groups.add(GROUP_ONDUTY)
+    if is_type(neonUtil.ONDUTY_TYPE_CERAMICS):
+        groups.add(GROUP_CERAMICS_ONDUTY)
+    if is_type(neonUtil.LEAD_TYPE) or is_type(neonUtil.DIRECTOR_TYPE) or is_type(neonUtil.SUPER_TYPE):
+        groups.add(GROUP_MANAGEMENT)
+    elif is_type(neonUtil.STAFF_TYPE):
+        groups.update([GROUP_SUBSCRIBERS, GROUP_STEWARDS, GROUP_INSTRUCTORS, GROUP_COWORKING, GROUP_CERAMICS])
+    if neonUtil.accountHasFacilityAccess(account):
+        groups.add(GROUP_SUBSCRIBERS)
+        if neonUtil.subscriberHasCeramicsAccess(account):
+            groups.add(GROUP_CERAMICS)
+        if is_type(neonUtil.COWORKING_TYPE):
+            groups.add(GROUP_COWORKING)
+        if is_type(neonUtil.STEWARD_TYPE):
+            groups.add(GROUP_STEWARDS)
+        if neonUtil.accountHasShaperAccess(account):
+            groups.add(GROUP_SHAPER_ORIGIN)
+        if neonUtil.accountHasDominoAccess(account):
+            groups.add(GROUP_DOMINO)
+    return groups
+
+
+def random_account(rng):
+    account = {
+        "Account ID": str(rng.randrange(100000)),
+        "individualTypes": [
+            {"name": type} for type in ALL_TYPES if rng.random() < 0.2
+        ],
+    }
+    for flag in FLAGS:
+        if rng.random() < 0.6:
+            account[flag] = True if flag in ("validMembership", "AccessSuspended", "ceramicsMembership") else "2024-01-01"
+    return account
+
+
+@pytest.mark.parametrize("wrap", [dict, NeonAccount])
+def test_op_groups_match_legacy_rules(wrap):
+    rng = random.Random(1234)
+    accounts = [wrap(random_account(rng)) for _ in range(3000)]
+
+    for account in accounts:
+        groups = openPathUtil.getOpGroups(account)
+        assert groups == sorted(groups)
+        assert set(groups) == legacy_op_groups(account), account
+
+    batch = openPathUtil.getOpGroupsForAccounts(dict(enumerate(accounts)))
+    assert batch == {i: openPathUtil.getOpGroups(account) for i, account in enumerate(accounts)}
+
+
+def test_managed_groups():
+    for group in (GROUP_MANAGEMENT, GROUP_ONDUTY, GROUP_SUBSCRIBERS, GROUP_CERAMICS,
+                  GROUP_CERAMICS_ONDUTY, GROUP_COWORKING, GROUP_STEWARDS,
+                  GROUP_INSTRUCTORS, GROUP_SHAPER_ORIGIN, GROUP_DOMINO):
+        assert openPathUtil.isManagedGroup(group)
+
+    assert not openPathUtil.isManagedGroup(GROUP_SPECIAL_EVENT)
+    assert not openPathUtil.isManagedGroup(None)
+
+
+def test_group_changes_keeps_unmanaged_groups():
+    account = {"individualTypes": [{"name": neonUtil.ONDUTY_TYPE}]}
+
+    current, desired = openPathUtil.groupChanges(
+        account, [{"id": GROUP_SUBSCRIBERS}, {"id": GROUP_SPECIAL_EVENT}]
+    )
+
+    assert current == [GROUP_SUBSCRIBERS, GROUP_SPECIAL_EVENT]
+    assert desired == [GROUP_ONDUTY, GROUP_SPECIAL_EVENT]
@@ -0,0 +1,57 @@
+import pytest
+
+from helpers.rateLimiter import AdaptiveRateLimiter, retryAfterSeconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = "https://api.neoncrm.com/v2/accounts/search"
+
+
+@pytest.fixture
+def clock(mocker):
+    now = [1000.0]
+    mocker.patch("helpers.rateLimiter.time.monotonic", side_effect=lambda: now[0])
+    return now
+
+
+def test_reserve_spaces_calls_at_current_rate(clock):
+    limiter = AdaptiveRateLimiter(rate=4)
+    assert [limiter.reserve() for _ in range(3)] == [0.0, 0.25, 0.5]
+
+
+def test_backs_off_on_throttling_and_recovers(clock):
+    limiter = AdaptiveRateLimiter(rate=8, minRate=1, maxRate=10, increase=1)
+
+    limiter.observe(FakeResponse(429))
+    assert limiter.currentRate == 4
+    limiter.observe(FakeResponse(503))
+    assert limiter.currentRate == 2
+    for _ in range(3):
+        limiter.observe(FakeResponse(500))
+    assert limiter.currentRate == 1
+
+    for _ in range(20):
+        limiter.observe(FakeResponse(200))
+    assert limiter.currentRate == 10
+
+
+def test_client_errors_are_not_throttling(clock):
+    limiter = AdaptiveRateLimiter(rate=5, maxRate=10, increase=1)
+    limiter.observe(FakeResponse(404))
+    assert limiter.currentRate == 6
+
+
+def test_retry_after_pushes_next_slot(clock):
+    limiter = AdaptiveRateLimiter(rate=10)
+    limiter.observe(FakeResponse(429, {"Retry-After": "3"}))
+    assert limiter.reserve() == 3.0
+
+
+def test_retry_after_formats():
+    assert retryAfterSeconds(FakeResponse(429, {"Retry-After": "2.5"})) == 2.5
+    assert retryAfterSeconds(FakeResponse(429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retryAfterSeconds(FakeResponse(429, {"Retry-After": "soon"})) is None
+    assert retryAfterSeconds(FakeResponse(429)) is None
@@ -0,0 +1,76 @@
+import pytest
+
+from helpers import sessions
+from helpers.api import apiCall
+
+
+@pytest.fixture(autouse=True)
+def _fresh_sessions():
+    sessions.closeSessions()
+    yield
+    sessions.closeSessions()
+
+
+def test_one_session_per_host():
+    neon = sessions.getSession("https://api.neoncrm.com/v2/accounts/1")
+    assert sessions.getSession("https://api.neoncrm.com/v2/accounts/search") is neon
+    assert sessions.getSession("https://api.openpath.com/orgs/5231/users") is not neon
+
+
+def test_pool_sized_for_thread_fan_out():
+    adapter = sessions.getSession("https://api.neoncrm.com/v2").get_adapter("https://api.neoncrm.com/v2")
+    assert adapter._pool_maxsize == sessions.POOL_SIZE
+
+
+def test_default_timeout_applied(requests_mock):
+    url = "https://api.neoncrm.com/v2/accounts/1"
+    requests_mock.get(url, json={})
+
+    sessions.getSession(url).get(url)
+    sessions.getSession(url).get(url, timeout=5)
+
+    assert requests_mock.request_history[0].timeout == sessions.DEFAULT_TIMEOUT
+    assert requests_mock.request_history[1].timeout == 5
+
+
+def test_apiCall_uses_shared_session(requests_mock, mocker):
+    url = "https://api.neoncrm.com/v2/accounts/1"
+    requests_mock.patch(url, json={})
+    spy = mocker.spy(sessions.PooledSession, "request")
+
+    apiCall("PATCH", url, {"a": 1}, {})
+
+    assert spy.call_count == 1
+    assert requests_mock.last_request.json() == {"a": 1}
+
+
+def test_neon_requests_share_one_limiter(requests_mock, mocker):
+    limiter = sessions.getLimiter("https://api.neoncrm.com/v2/accounts/1")
+    acquire = mocker.spy(limiter, "acquire")
+    requests_mock.get("https://api.neoncrm.com/v2/accounts/1", json={})
+    requests_mock.patch("https://api.neoncrm.com/v2/accounts/1", json={})
+    requests_mock.get("https://api.openpath.com/orgs/5231/users", json={})
+
+    sessions.getSession("https://api.neoncrm.com/v2/accounts/1").get("https://api.neoncrm.com/v2/accounts/1")
+    apiCall("PATCH", "https://api.neoncrm.com/v2/accounts/1", {}, {})
+    sessions.getSession("https://api.openpath.com").get("https://api.openpath.com/orgs/5231/users")
+
+    assert acquire.call_count == 2
+    assert sessions.getLimiter("https://api.openpath.com/orgs/5231/users") is not limiter
+    assert sessions.getLimiter("https://api.mailjet.com/v3/REST/contact") is None
+
+
+def test_throttled_neon_request_is_retried(requests_mock, mocker):
+    url = "https://api.neoncrm.com/v2/accounts/1"
+    requests_mock.get(url, [
+        {"status_code": 429, "headers": {"Retry-After": "0"}},
+        {"status_code": 200, "json": {"ok": True}},
+    ])
+    rate = sessions.getLimiter(url).currentRate
+
+    response = sessions.getSession(url).get(url)
+
+    assert response.json() == {"ok": True}
+    assert requests_mock.call_count == 2
+    # halved by the 429, then nudged back up by the success
+    assert sessions.getLimiter(url).currentRate < rate